@@ -36,7 +36,7 @@ print()
 if choice in [1, 2]:
 	cache = TC.cache(status=choice, username=name[0])
 	# Get the twitter feed of the specified user, as well as his last tweets
-	twitter_feed = TAPI.get_feed(name[0], cache, show_name=name[1], get_replies=False, order_by_influence=False)
+	twitter_feed = TAPI.get_feed(name[0], cache, show_name=name[1], get_replies=False, order_by_influence=False, n=20, workers=8)
 	print(f"Getting {name[1]}'s last tweets...")
 	last_tweets = TAPI.get_user_interactions(name[0], 0, get_replies=True, order_by_influence=True, n=20, cache=cache)
 	# Sort the feed tweets and keep the one we want before normalising and computing influence score
@@ -45,14 +45,12 @@ if choice in [1, 2]:
 	# Switch this to compute influence again (based on news article that might have been written since then)
 	compute_influence_again = True
 	if compute_influence_again:
-		for i, tweet in enumerate(last_tweets):
-			print(f"Computing news influence of last tweets... ({i+1}/{len(last_tweets)})", end="\r")
-			tweet.compute_influence(include_news=True, include_google=False)
-		print()
-		for i, tweet in enumerate(twitter_feed):
-			print(f"Computing news influence of feed tweets... ({i+1}/{len(twitter_feed)})", end="\r")
-			tweet.compute_influence(include_news=True, include_google=False)
-		print()
+		print("Computing news influence of last tweets and feed tweets...")
+		# All texts are searched at the same time, the ones already searched recently come from the cache
+		TE.score_batch(list(last_tweets) + list(twitter_feed), include_news=True, include_google=False, concurrency=8)
+		# Keep the news influence of the searched texts for the next runs
+		TE.news_cache.save()
+		print(f"News influence: {TE.news_cache.report()}")
 	last_tweets = TE.normalise_scores(last_tweets)
 	twitter_feed = TE.normalise_scores(twitter_feed)
 	# Sort the tweets after normalisation
@@ -68,9 +66,9 @@ if choice == 3:
 	cache = TC.cache(username=name[0])
 	latest, feed = cache.get_all_cached()
 	if (latest, feed) != (None, None):
-		# Build a dict {tweet: feed just before said tweet}
-		data = cache.split_latest_feed(latest, feed)
-		print(len(data), len(latest), len(feed))
+		# Build a matrix with, for each of his tweets, the indices of the tweets of the feed just before it
+		latest_tweets, feed_tweets, windows = cache.window_feed(latest, feed)
+		print(windows.shape, len(latest), len(feed))
 		# Set interacted=True for tweets for which James interacted (replied to, liked, retweeted)
 		TE.feed.flag_interact(feed, latest)
 		i = sum([t.interacted for d, t in feed.items()])
@@ -99,7 +97,7 @@ while choice == 5:
 	t0 = time.time()
 	print("Downloading new results for the cache...")
 	last_tweets = TAPI.get_user_interactions(name[0], 0, get_replies=True, order_by_influence=False, cache=cache_loop)
-	twitter_feed = TAPI.get_feed(name[0], cache_loop, show_name=name[1], get_replies=False, order_by_influence=False)
+	twitter_feed = TAPI.get_feed(name[0], cache_loop, show_name=name[1], get_replies=False, order_by_influence=False, workers=8)
 	print("Done, sleeping 1h")
 	dt = time.time()-t0
 	time.sleep(3600 - dt)
@@ -1,7 +1,6 @@
-import requests
-import time
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
+from project import http_handler as HH
 
 
 '''
@@ -43,7 +42,7 @@ from datetime import datetime, timedelta
 
 '''
 'Known issues/ To-Do:
-	-429 response exponential wait time was removed. Do we want it back?
+	-429 responses are retried with an exponential wait time by the shared rate limiter (http_handler), the error is only raised when they keep coming.
 	-Not important since we dont use the time the article was publish but bing returns the current time instead on the time the article was published.
 '''
 
@@ -97,8 +96,8 @@ def News_Search(url, tme=True):
 	user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/81.0.4003.0 Safari/537.36 Edg/81.0.381.0'
 	cookie = ""
 	headers = {'user-agent': user_agent, "cookie": cookie}
-	response = requests.get(url, headers=headers)	#Perform a search using a url with the modified user agent and save the html
-	if response.status_code == 429: #If we get a 429 response code (Too many requests) raise an exception. The automated wait time was removed.
+	response = HH.get(url, headers=headers)	#Perform a search using a url with the modified user agent and save the html. The rate limiter waits and retries on 429 responses
+	if response.status_code == 429: #If we still get a 429 response code (Too many requests) after the retries raise an exception.
 		raise ConnectionRefusedError(f'Request for {url} returned HTTP code 429')
 	if url.find("https://www.google.com") != -1:	#If its a Google News search post process using Google_News_Soup_Parser()
 		if str(response.content).find("id=\"search\"") != -1:		#Google html has a lot of crap from the headers and stuff and takes too long to parse. It can safely be splitted at id="search" so thats what we will do
@@ -2,29 +2,49 @@
 The NewsSite class for usage in the News_weights package
 """
 
+from . import extracthandling as eh
 from . import webhandling as wh
 import datetime as dt
 import typing as tp
-import re
-import json
-import os
+import functools
+
+
+@functools.lru_cache(maxsize=4096)
+def date_ordinal(wiki_date: tp.Optional[str]) -> int:
+    """
+    Converts the date of a wikipedia page to a number, each date string is only parsed once
+    @param wiki_date: a date like '01 January 2020', or None
+    @return: the proleptic Gregorian ordinal of the date, 0 if there is no (valid) date
+    """
+    try:
+        return dt.datetime.strptime(wiki_date, '%d %B %Y').toordinal()
+    except (TypeError, ValueError):
+        return 0
 
 
 class NewsSite:
     """
     Class to save news sites and their properties
     """
-    def gen_flags(self) -> None:
+    __slots__ = ('name', 'tpe', 'wiki_url', 'country', 'readers', 'ggl_name', 'page', 'tempreaders', 'wiki_date',
+                 'bng_name', 'info')
+    flag_names = ('country', 'tempreaders', 'readers', 'ggl_name', 'bng_name')
+    record_fields = ('name', 'tpe', 'wiki_url', 'country', 'readers', 'ggl_name', 'tempreaders', 'wiki_date',
+                     'bng_name')
+
+    def gen_flags(self) -> tp.Dict[str, bool]:
         """
         Generates the flags dictionary of this NewsSite
+        @return: dictionary with a boolean per flag, indicating that the variable is set
         """
-        self.flags = {
-            'country': self.country is not None,
-            'tempreaders': self.tempreaders is not None,
-            'readers': self.readers is not None,
-            'ggl_name': self.ggl_name is not None,
-            'bng_name': self.bng_name is not None
-        }
+        return {flag: getattr(self, flag) is not None for flag in NewsSite.flag_names}
+
+    @property
+    def flags(self) -> tp.Dict[str, bool]:
+        """
+        The flags dictionary of this NewsSite, only generated when it is asked for
+        """
+        return self.gen_flags()
 
     def __init__(self, name: str, tpe: str):
         if type(name) != str:
@@ -44,8 +64,7 @@ class NewsSite:
         self.tempreaders = None  # Place to store intermediate readership numbers
         self.wiki_date = None
         self.bng_name = None
-        self.flags = None
-        self.gen_flags()
+        self.info = None  # The information extracted from the wikipedia page (extracthandling.PageInfo)
 
     def __repr__(self):
         return (f'<NewsSite Object>: <name: {self.name},\t'
@@ -72,6 +91,16 @@ class NewsSite:
         else:
             raise TypeError(f'Cannot compare {type(self)} with {type(other)}')
 
+    def dedup_key(self) -> tp.Tuple[int, int, int]:
+        """
+        Key to choose between NewsSites with the same name, without any download: the higher the better
+        @return: tuple with the amount of True flags, the ordinal of the wikipedia page date (0 if unknown)
+                    and the readers (-1 if unknown)
+        """
+        return (sum(getattr(self, flag) is not None for flag in NewsSite.flag_names),
+                date_ordinal(self.wiki_date),
+                self.readers if self.readers is not None else -1)
+
     def __comp_helper(self, other):
         """
         Helper function for __lt__, __le__, __gt__, __ge__ operator overloads
@@ -79,9 +108,8 @@ class NewsSite:
         @param other: same as in the operator overloads
         @return: 2 ints containing the amount of True flags in both self and other
         """
-        self.gen_flags(), other.gen_flags()
-        self_count = len([flag for key, flag in self.flags.items() if flag])
-        other_count = len([flag for key, flag in other.flags.items() if flag])
+        self_count = len([flag for flag in NewsSite.flag_names if getattr(self, flag) is not None])
+        other_count = len([flag for flag in NewsSite.flag_names if getattr(other, flag) is not None])
 
         return self_count > other_count
 
@@ -155,7 +183,6 @@ class NewsSite:
         """
         if type(country) == str or country is None:
             self.country = country
-            self.gen_flags()
         else:
             raise TypeError(f'param "country" should be of type {str}')
 
@@ -166,7 +193,6 @@ class NewsSite:
         """
         if type(readers) == int or readers is None:
             self.readers = readers
-            self.gen_flags()
         else:
             raise TypeError(f'param "readers" should be of type {int}')
 
@@ -177,7 +203,6 @@ class NewsSite:
         """
         if type(ggl_name) == str or ggl_name is None:
             self.ggl_name = ggl_name
-            self.gen_flags()
         else:
             raise TypeError(f'param "ggl_name" should be of type {str}')
 
@@ -188,20 +213,18 @@ class NewsSite:
         """
         if type(bng_name) == str or bng_name is None:
             self.bng_name = bng_name
-            self.gen_flags()
         else:
             raise TypeError(f'param "bng_name" should be of type {str}')
 
-    def set_page(self, page: tp.Optional[str]) -> None:
+    def set_page(self, page: tp.Optional[tp.Union[str, bytes]]) -> None:
         """
         Add a webpage to the NewsSite for further use
-        @param page: string containing the webpage
+        @param page: string or bytes containing the webpage
         """
-        if type(page) == str or page is None:
+        if type(page) in (str, bytes) or page is None:
             self.page = page
-            self.gen_flags()
         else:
-            raise TypeError(f'param "page" should be of type {str}')
+            raise TypeError(f'param "page" should be of type {str} or {bytes}')
 
     def set_tempreaders(self, tempreaders: tp.Optional[int]) -> None:
         """
@@ -210,45 +233,38 @@ class NewsSite:
         """
         if type(tempreaders) == int or tempreaders is None:
             self.tempreaders = tempreaders
-            self.gen_flags()
         else:
             raise TypeError(f'param "tempreaders" should be of type {str}')
 
+    def set_info(self, info) -> None:
+        """
+        Add the information extracted from the wikipedia page for further use, instead of the page itself
+        @param info: an extracthandling.PageInfo object
+        """
+        if isinstance(info, eh.PageInfo) or info is None:
+            self.info = info
+        else:
+            raise TypeError(f'param "info" should be of type {eh.PageInfo}')
+
     def acquire_wiki_date(self) -> None:
         """
         Get the date of the last wikipedia edit of the page
         """
+        if self.info is not None:
+            self.wiki_date = self.info.wiki_date or dt.datetime.now().strftime('%d %B %Y')
 
-        def find_wiki_date(page: str) -> str:
-            """
-            Find the date in a wikipedia page
-            @param page: a string containing a wikipedia page
-            @return: a string readable by datetime
-            """
-            find = re.findall(r'(\bThis page was last edited on \b(([0-9]{1,2}) [a-zA-Z]+ [0-9]+))', page)
-            if find:
-                for res in find[::-1]:
-                    if len(res[2]) == 1:
-                        date = '0' + res[1]
-                    else:
-                        date = res[1]
-                    dt.datetime.strptime(date, '%d %B %Y')
-
-                    return date
-
-            return dt.datetime.now().strftime('%d %B %Y')
-
-        if self.page is not None:
+        elif self.page is not None:
             try:
-                self.wiki_date = find_wiki_date(self.page)
+                self.wiki_date = eh.find_wiki_date(self.page)
             except Exception as e:
                 self.wiki_date = dt.datetime.now().strftime('%d %B %Y')
                 print(f'An unexpected exception was raised: {e}, set the date to {self.wiki_date}')
 
         elif self.wiki_url is not None:
             try:
-                self.page = wh.get_webpage_html_str(self.wiki_url)
-                self.wiki_date = find_wiki_date(self.page)
+                # Only the extracted information is kept, for multithreading.tempreaders_task()
+                self.info = eh.PageInfo(wh.get_webpage_bytes(self.wiki_url)).compact(self.tpe)
+                self.wiki_date = self.info.wiki_date or dt.datetime.now().strftime('%d %B %Y')
             except Exception as e:
                 self.wiki_date = dt.datetime.now().strftime('%d %B %Y')
                 print(f'An unexpected exception was raised: {e}, set the date to {self.wiki_date}')
@@ -256,14 +272,12 @@ class NewsSite:
         else:
             self.wiki_date = dt.datetime.now().strftime('%d %B %Y')
 
-        self.gen_flags()
-
     def remove_page(self):
         """
-        Remove the webpage for faster writing to json
+        Remove the webpage and the information extracted from it, once they are not needed anymore
         """
         self.page = None
-        self.gen_flags()
+        self.info = None
 
     def check_flag(self, flag: str) -> bool:
         """
@@ -272,22 +286,38 @@ class NewsSite:
         @return: a boolean indicating the flag of a class variable
         """
         if type(flag) == str:
-            try:
-                self.gen_flags()
-                return self.flags[flag]
-            except KeyError:
+            if flag not in NewsSite.flag_names:
                 raise ValueError(f'param "flag" should have one of the following values:',
-                                 f'{[flag for flag in self.flags]}')
+                                 f'{list(NewsSite.flag_names)}')
+            return getattr(self, flag) is not None
         else:
             raise TypeError(f'param "flag" should be of type {str}')
 
-    def gen_json_str(self) -> str:
+    def to_record(self, fields=None) -> dict:
+        """
+        Gives the variables of this NewsSite that are set, for a dump record (the page is never written)
+        @param fields: optional iterable with the names of the variables to give, besides the name and tpe
+        @return: a dictionary with the variables
+        """
+        fields = NewsSite.record_fields if fields is None else ('name', 'tpe', *fields)
+        record = {}
+        for field in fields:
+            value = getattr(self, field)
+            if value is not None:
+                record[field] = value
+        return record
+
+    @staticmethod
+    def from_record(record: dict):
         """
-        Generates the json string to be written to the json file of this NewsSite
-        @return: a string containing the json dump of this NewsSites
+        Create a NewsSite from a dump record, without the checks of the set_{variable}() functions
+        @param record: a dictionary given by to_record()
+        @return: a NewsSite object containing the info from the record
         """
-        self.remove_page()
-        return json.dumps(self.__dict__(), ensure_ascii=False, indent=4, sort_keys=True, default=str)
+        newssite = NewsSite.__new__(NewsSite)
+        for field in NewsSite.__slots__:
+            setattr(newssite, field, record.get(field))
+        return newssite
 
     @staticmethod
     def get_self(json_dict: dict):
@@ -304,78 +334,6 @@ class NewsSite:
         newssite.set_page(json_dict['page'])
         newssite.set_tempreaders(json_dict['tempreaders'])
         newssite.set_bng_name(json_dict['bng_name'])
+        newssite.wiki_date = json_dict.get('wiki_date')
 
         return newssite
-
-    @staticmethod
-    def write_json(newssites: list, json_idx=0, main=True) -> None:
-        """
-        Write a series of NewsSites to a json file
-        @param newssites: a list of NewsSites objects to be written to a json file
-        @param json_idx: index number for the json file
-        @param main: boolean to indicate wheter this is running from main or not
-        """
-        # Type handling
-        if type(newssites) != list:
-            raise TypeError(f'param "newssites" should be of type {list}')
-        elif any(not isinstance(newssite, NewsSite) for newssite in newssites):
-            raise TypeError(f'items in "newssites" should be of type {NewsSite}')
-        if type(json_idx) != int:
-            raise TypeError(f'param "json_idx" shoud be of type {int}')
-
-        # Create the file string
-        file = '[\n'
-        for newssite in newssites:
-            json_str = newssite.gen_json_str()
-            file += json_str
-            file += ',\n'
-
-        if not bool(len(newssites)):
-            file += ']'
-        else:
-            file = f'{file[:-2]}]'
-
-        # Get the json file path
-        if not main:
-            path = f'News_weights/data/NewsSiteDump{json_idx}.json'
-        else:
-            path = f'project/News_weights/data/NewsSiteDump{json_idx}.json'
-
-        # Write the file string to the json file
-        with open(path, 'w', encoding='utf-8') as f:
-            f.writelines(file)
-
-    @staticmethod
-    def get_json(newssites=None, json_idx=0, main=True) -> list:
-        """
-        Opens a json file into a series of Newssites
-        @param newssites: an already existing list of newssites, if wished for
-        @param json_idx: the index number of the json file to be opened
-        @param main: boolean to indicate wheter this is running from main or not
-        @return: a list of NewsSite objects
-        """
-        # Type handling and initialising
-        if newssites is None:
-            newssites = list()
-        elif type(newssites) != list:
-            raise TypeError(f'param "newssites" should be of type {list}')
-        elif any(not isinstance(newssite, NewsSite) for newssite in newssites):
-            raise TypeError(f'items in "newssites" should be of type {NewsSite}')
-        if type(json_idx) != int:
-            raise TypeError(f'param "json_idx" shoud be of type {int}')
-
-        # Get the path for the json
-        if not main and not (os.path.isdir('C:/Users/Guille') or os.path.isdir('C:/Users/gaffa')):
-            path = f'News_weights/data/NewsSiteDump{json_idx}.json'
-        else:
-            path = f'project/News_weights/data/NewsSiteDump{json_idx}.json'
-
-        # Open the file and load with json
-        with open(path, encoding='utf-8') as f:
-            file = json.load(f)
-
-        # Add all the NewsSites to the final list
-        for data in file:
-            newssites.append(NewsSite.get_self(data))
-
-        return newssites
@@ -10,104 +10,100 @@ Package to gather and return a readership number for a Google/Bing News outlet.
                 Return: - an integer containing the readership number of the outlet,
                         - None in case: the News_reach.csv file does not exist or the given name is invalid
 
+ -> call_many(): Same as call(), for a list of names at once (e.g. a whole page of search results).
+                Param news_names:       an iterable of Google/Bing News outlet names
+                Param engine:           same as in call()
+                Param mainpy:           same as in call()
+                Return: - a list with the readership number (or None) of each name, in the same order
+
  -> create():   Use this function to create the necessary file to be able to use call()
                 Param mainpy:           a boolean to indicate running from main.py
                 Param new:              a boolean to indicate starting from fresh instead of building on previous data
+                Param offline:          a boolean to only use the responses saved by previous runs, without network
+                Param resume:           a boolean to resume the previous run if it did not finish (default)
+                Param dump_interval:    number of seconds between the dumps of the stages (default 60)
                 Return: - None
 
 --NOTES--
+ -> The data file is only read once per process, and read again when it changes on disk.
+ -> create() saves the wikipedia responses in project/cache/http. A rerun only downloads the pages older than a week
+    that changed since, so it is much faster after a crash or for a weekly refresh.
+ -> create() journals each item processed by each stage in project/News_weights/data/journal. If it crashes, or some
+    items fail (e.g. too many requests), the next run replays the journaled items and only processes the other ones.
+    The journals are removed once a run finishes without failures.
+ -> create() streams each news site through its stages (newspapers/tv channels, duplicates filter, temporary readers,
+    then the Google and Bing names at the same time) as soon as it is ready. NewsSiteDump1-4 are snapshots of these stages, written every
+    dump_interval seconds; NewsSiteDump5 holds the final data, with the readers numbers computed at the end.
+ -> The dumps hold one compact json line per news site. NewsSiteDump2-4 only hold what their stage changed (on top of
+    NewsSiteDump1, resp. NewsSiteDump2), and they are read lazily by dumphandling.DumpReader.
  -> The readership numbers are rough estimates based on the circulation of physical newspapers and the viewership of
     television news channels. The numbers are all pulled from Wikipedia.
  -> After using create(), make sure to add the following to your commit:
-            - project/News_weights/data/NewsSiteDump1.json
-            - project/News_weights/data/NewsSiteDump2.json
-            - project/News_weights/data/NewsSiteDump3.json
-            - project/News_weights/data/NewsSiteDump4.json
-            - project/News_weights/data/NewsSiteDump5.json
+            - project/News_weights/data/NewsSiteDump1.ndjson
+            - project/News_weights/data/NewsSiteDump2.ndjson
+            - project/News_weights/data/NewsSiteDump3.ndjson
+            - project/News_weights/data/NewsSiteDump4.ndjson
+            - project/News_weights/data/NewsSiteDump5.ndjson
 """
 
+from . import dumphandling as dh
+from . import extracthandling as eh
 from . import filehandling as fh
 from . import multithreading as mt
-from . import namefinders as nf
-from .NewsSite import NewsSite
+from . import pipelinehandling as ph
 from . import queuehandling as qh
-from . import webhandling as wh
+from . import stagehandling as sh
+from project import http_handler as hh
 import typing as tp
 import queue
 
 
-def create(mainpy: bool, new: bool, queueprint=False) -> None:
+def create(mainpy: bool, new: bool, queueprint=False, offline=False, resume=True, dump_interval=60.) -> None:
     """
     Creates the data file for use by the call() function.
     @param mainpy: boolean to indicate wheter this is running from main or not
     @param new: start all the way from fresh
-    @param queueprint: boolean to print the queue sizes after the process is finished
+    @param queueprint: boolean to print the stage counters, the connection reuse, the cache use and the pattern timings after the process is finished
+    @param offline: boolean to replay the responses cached by previous runs instead of using the network
+    @param resume: boolean to resume an unfinished previous run from its journals, instead of starting over
+    @param dump_interval: number of seconds between the dumps of the stages (NewsSiteDump1-4)
     """
-    progress = mt.ProgressThread(7)
+    hh.crawl_cache = hh.response_cache('project/cache/http' if mainpy else 'cache/http', offline=offline)
+    if not resume:
+        sh.clear_journals(mainpy=mainpy)
+    journals = {stage: sh.StageJournal(stage, mainpy=mainpy) for stage in
+                ('newspapers', 'tvchannels', 'tempreaders', 'ggl_names', 'bng_names')}
+    progress = mt.ProgressThread(3)
     progress.start()
 
     try:
         country_dict = fh.read_internet_tv_csv(mainpy=mainpy)       # Retrieve data from first csv file
 
-        q_newssites0 = queue.Queue() if new else fh.read_from_json(5, mainpy=mainpy)
-        q_newssites1 = mt.get_newspapers(q_newssites0, country_dict)
-
-        progress.update()
-
-        q_newssites1 = mt.get_tvchannels(q_newssites1, country_dict)
-        s1 = q_newssites1.qsize()
-        q_newssites1 = qh.filter_newssites(q_newssites1)
-        q_newssites1 = fh.write_to_json(q_newssites1, 1, mainpy=mainpy)
-        q_newssites1, q_bypass1 = qh.split_bypass(q_newssites1, 'tempreaders')
-        sq1, sb1 = q_newssites1.qsize(), q_bypass1.qsize()
+        # The NewsSites go through the newspapers/tvchannels, tempreaders and names stages as soon as they are ready
+        pipeline = ph.Pipeline(country_dict, journals=journals, dump_interval=dump_interval, mainpy=mainpy)
+        if new:
+            q_newssites = pipeline.run(queue.Queue())
+        else:
+            with dh.read_dump(5, mainpy=mainpy) as previous:    # The previous data is read as it is needed
+                q_newssites = pipeline.run(previous)
 
         progress.update()
 
-        q_newssites2, readers_dict = mt.get_tempreaders(q_newssites1, country_dict)
+        # The readers numbers need the total readers of all the newspapers of a country
         if new:
+            readers_dict = pipeline.get_readers_dict(q_newssites)
             fh.write_to_csv(readers_dict, mainpy=mainpy)
         else:
             readers_dict = fh.read_from_csv(mainpy=mainpy)
-        q_newssites2 = qh.merge_bypass(q_newssites2, q_bypass1)
-        s2 = q_newssites2.qsize()
-        q_newssites2 = qh.filter_newssites(q_newssites2)
-        q_newssites2 = fh.write_to_json(q_newssites2, 2, mainpy=mainpy)
-        q_newssites2, q_bypass2 = qh.split_bypass(q_newssites2, 'readers')
-        sq2, sb2 = q_newssites2.qsize(), q_bypass2.qsize()
+        q_newssites, q_bypass = qh.split_bypass(q_newssites, 'readers')
+        q_newssites = mt.get_readers(q_newssites, country_dict, readers_dict)
+        q_newssites = qh.merge_bypass(q_newssites, q_bypass)
+        q_newssites = qh.filter_newssites(q_newssites)
+        q_newssites = fh.write_to_json(q_newssites, 5, mainpy=mainpy)
 
         progress.update()
 
-        q_newssites3 = mt.get_readers(q_newssites2, country_dict, readers_dict)
-        q_newssites3 = qh.merge_bypass(q_newssites3, q_bypass2)
-        s3 = q_newssites3.qsize()
-        q_newssites3 = qh.filter_newssites(q_newssites3)
-        q_newssites3 = fh.write_to_json(q_newssites3, 3, mainpy=mainpy)
-        q_newssites3, q_bypass3 = qh.split_bypass(q_newssites3, 'ggl_name')
-        sq3, sb3 = q_newssites3.qsize(), q_bypass3.qsize()
-
-        progress.update()
-
-        q_newssites4, q_newssites3 = nf.get_gglnames(q_newssites3)
-        q_newssites4 = qh.merge_bypass(q_newssites4, q_newssites3)
-        q_newssites4 = qh.merge_bypass(q_newssites4, q_bypass3)
-        s4 = q_newssites4.qsize()
-        q_newssites4 = qh.filter_newssites(q_newssites4)
-        q_newssites4 = fh.write_to_json(q_newssites4, 4, mainpy=mainpy)
-        q_newssites4, q_bypass4 = qh.split_bypass(q_newssites4, 'bng_name')
-        sq4, sb4 = q_newssites4.qsize(), q_bypass4.qsize()
-
-        progress.update()
-
-        q_newssites5, q_newssites4 = nf.get_bngnames(q_newssites4)
-        q_newssites5 = qh.merge_bypass(q_newssites5, q_newssites4)
-        q_newssites5 = qh.merge_bypass(q_newssites5, q_bypass4)
-        s5 = q_newssites5.qsize()
-        q_newssites5 = qh.filter_newssites(q_newssites5)
-        q_newssites5 = fh.write_to_json(q_newssites5, 5, mainpy=mainpy)
-
-        progress.update()
-
-        fh.write_results(q_newssites5, mainpy=mainpy)
+        fh.write_results(q_newssites, mainpy=mainpy)
 
         progress.stop()
 
@@ -115,9 +111,23 @@ def create(mainpy: bool, new: bool, queueprint=False) -> None:
         progress.stop()
         raise e
 
+    finally:
+        [journal.close() for journal in journals.values()]
+
+    # Keep the journals if some items were not processed, so the next run only processes those
+    failed = {stage: len(journal.failed) for stage, journal in journals.items() if journal.failed}
+    unfinished = pipeline.unfinished()
+    if not failed and not unfinished:
+        sh.clear_journals(mainpy=mainpy)
+    else:
+        print(f'Unfinished items: {failed}, {unfinished} in total. Run create() again to process them.')
+
     if queueprint:
-        print(f'Queue sizes: {s1} -> q{sq1}, b{sb1}; {s2} -> q{sq2}, b{sb2}; {s3} -> '
-              f'q{sq3}, b{sb3}; {s4} -> q{sq4}, b{sb4}; {s5}')
+        print(f'Stages: {pipeline.report()}')
+        print(f'Connections: {hh.connection_report()}')
+        print(f'Responses: {hh.crawl_cache.report()}')
+        print(f'Patterns: {eh.report()}')
+        print(f'Replayed from the journals: {sum(journal.replayed for journal in journals.values())} items')
 
 
 def call(news_name: str, engine: str, mainpy=True) -> tp.Optional[int]:
@@ -128,28 +138,25 @@ def call(news_name: str, engine: str, mainpy=True) -> tp.Optional[int]:
     @param mainpy: boolean to indicate if this file is run from main.py
     @return: Integer with the readership number, None if that does not exist
     """
+    return call_many([news_name], engine, mainpy=mainpy)[0]
+
+
+def call_many(news_names: tp.Iterable[str], engine: str, mainpy=True) -> tp.List[tp.Optional[int]]:
+    """
+    Gives the estimated readership numbers of several news outlets in one pass over the data
+    @param news_names: iterable of strings containing the Google/Bing names of news outlets
+    @param engine: the search engine: ('b', 'B' or 'bing' for Bing; 'g', 'G' or 'google' for Google
+    @param mainpy: boolean to indicate if this file is run from main.py
+    @return: list with the readership number of each name (in the same order), None for names without data
+    """
+    news_names = list(news_names)
     try:                                    # Try something
-        data = fh.read_from_file(mainpy)           # Read the data file
-        if engine in ('g', 'G', 'google'):
-            result = data[0][news_name]             # Get the readership number
-            del data                                # Delete the data from memory
-            return result                           # Return the result
-        elif engine in ('b', 'B', 'bing'):
-            result = data[1][news_name]             # Get the readership number
-            del data                                # Delete the data from memory
-            return result                           # Return the result
-        else:
-            raise ValueError(
-                f'Invalid engine, should be in ("b", "B", "bing") for Bing or in ("g", "G", "google") for Google')
+        data = fh.get_reach_index(mainpy).get_dict(engine)     # Get the (cached) data of that engine
+        return [data.get(news_name) for news_name in news_names]   # Look up every name
 
     except FileNotFoundError:               # If there is a FileNotFoundError
         str1 = 'The data file was not created yet.'
         str2 = 'Use News_weights.create() to create the data file first.'
         str3 = 'This requires a stable internet connection and might take a while!'
         print(f'--- {str1} {str2} {str3} ---')  # Print something
-        return None                             # Return None
-
-    except KeyError:                        # If there is a KeyError
-        # print(f'--- The news site you were looking for ({news_name}) has no data. ---')   # Print something
-        del data                                # Delete the data from memory
-        return None                             # Return None
+        return [None for _ in news_names]       # Return None for every name
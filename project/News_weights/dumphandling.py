@@ -0,0 +1,166 @@
+"""
+The NewsSite dumps: one compact json record per line, written as a stream and read lazily from a memory-mapped file
+"""
+
+from .NewsSite import NewsSite
+import typing as tp
+import json
+import mmap
+import os
+
+
+# Per dump: the dump it holds the changes of, and the variables it holds besides the name and tpe
+# The dumps of the stages only hold what the stage changed, the Google and Bing stages run next to each other
+dump_fields = {
+    1: (None, None),                # All the variables (duplicates filter)
+    2: (1, ('tempreaders',)),       # Temporary readers
+    3: (2, ('ggl_name',)),          # Google names
+    4: (2, ('bng_name',)),          # Bing names
+    5: (None, None)                 # All the variables (final data)
+}
+
+
+def get_dump_path(num: int, mainpy=True) -> str:
+    """
+    Gives the path of a dump
+    @param num: the number put behind the file name
+    @param mainpy: boolean to indicate if this file is run from main.py
+    @return: the path of the dump file
+    """
+    folder = 'project/News_weights/data' if mainpy else 'News_weights/data'
+    return f'{folder}/NewsSiteDump{num}.ndjson'
+
+
+def write_dump(newssites: tp.Iterable[NewsSite], num: int, mainpy=True, path=None) -> int:
+    """
+    Writes NewsSites to a dump, line by line, the old dump is only replaced once the new one is complete
+    @param newssites: an iterable with NewsSite objects
+    @param num: the number put behind the file name, which also gives the variables written (see dump_fields)
+    @param mainpy: boolean to indicate if this file is run from main.py
+    @param path: optional path of the dump, instead of the default one
+    @return: the number of NewsSites written
+    """
+    if type(num) != int:
+        raise TypeError(f'param "num" should be of type {int}')
+
+    path = get_dump_path(num, mainpy=mainpy) if path is None else path
+    fields = dump_fields.get(num, (None, None))[1]
+    temp_path = f'{path}.tmp'
+    count = 0
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for newssite in newssites:
+            if not isinstance(newssite, NewsSite):
+                raise TypeError(f'items in "newssites" should be of type {NewsSite}')
+            f.write(json.dumps(newssite.to_record(fields), ensure_ascii=False, separators=(',', ':')))
+            f.write('\n')
+            count += 1
+    os.replace(temp_path, path)
+    return count
+
+
+class DumpReader:
+    """
+    Lazy reader of a dump: the file is memory-mapped, and a NewsSite is only built when it is asked for
+    """
+    def __init__(self, path: str, base=None):
+        """
+        Initialiser for DumpReader, only finds where the lines start
+        @param path: the path of the dump
+        @param base: optional DumpReader of the dump this one holds the changes of
+        """
+        self.path = path
+        self.base = base
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.keys = None        # (name, tpe) -> line number, only made when a base asks for it
+
+        self.offsets = []
+        start = 0
+        while start < size:
+            end = self.data.find(b'\n', start)
+            end = size if end < 0 else end
+            if end > start:
+                self.offsets.append((start, end))
+            start = end + 1
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, idx: int) -> NewsSite:
+        return NewsSite.from_record(self.record(idx))
+
+    def __iter__(self) -> tp.Iterator[NewsSite]:
+        return (self[idx] for idx in range(len(self)))
+
+    def __enter__(self) -> 'DumpReader':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def record(self, idx: int) -> dict:
+        """
+        Gives a record of the dump, with the variables of the base dumps added
+        @param idx: the line number of the record
+        @return: dictionary with the variables of the NewsSite
+        """
+        start, end = self.offsets[idx]
+        record = json.loads(self.data[start:end])
+        if self.base is not None:
+            base_record = self.base.find(record['name'], record['tpe'])
+            record = {**base_record, **record} if base_record is not None else record
+        return record
+
+    def find(self, name: str, tpe: str) -> tp.Optional[dict]:
+        """
+        Gives the record of a NewsSite
+        @param name: the name of the NewsSite
+        @param tpe: the tpe of the NewsSite
+        @return: dictionary with the variables of the NewsSite, None if it is not in the dump
+        """
+        if self.keys is None:
+            self.keys = {}
+            for idx, (start, end) in enumerate(self.offsets):
+                record = json.loads(self.data[start:end])
+                self.keys[(record['name'], record['tpe'])] = idx
+        idx = self.keys.get((name, tpe))
+        return self.record(idx) if idx is not None else None
+
+    def close(self) -> None:
+        """
+        Close the file (and those of the base dumps)
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+        if self.base is not None:
+            self.base.close()
+
+
+def read_dump(num: int, mainpy=True) -> DumpReader:
+    """
+    Opens a dump, with the dumps it holds the changes of
+    @param num: the number put behind the file name
+    @param mainpy: boolean to indicate if this file is run from main.py
+    @return: a DumpReader of the dump
+    """
+    if type(num) != int:
+        raise TypeError(f'param "num" should be of type {int}')
+
+    base_num = dump_fields.get(num, (None, None))[0]
+    base = read_dump(base_num, mainpy=mainpy) if base_num is not None else None
+    return DumpReader(get_dump_path(num, mainpy=mainpy), base=base)
+
+
+def convert_json(num: int, mainpy=True) -> int:
+    """
+    One-time conversion of an old json dump (NewsSiteDump{num}.json, one indented json list) to the ndjson dump
+    @param num: the number put behind the file name
+    @param mainpy: boolean to indicate if this file is run from main.py
+    @return: the number of NewsSites converted
+    """
+    path = get_dump_path(num, mainpy=mainpy)
+    with open(f'{path[:-len(".ndjson")]}.json', encoding='utf-8') as f:
+        json_dicts = json.load(f)
+    return write_dump((NewsSite.get_self(json_dict) for json_dict in json_dicts), num, mainpy=mainpy)
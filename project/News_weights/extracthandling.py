@@ -0,0 +1,272 @@
+"""
+Precompiled regex extraction of the numbers, countries, dates and titles in (raw) wikipedia pages
+"""
+
+import datetime as dt
+import typing as tp
+import urllib.parse
+import threading
+import html
+import time
+import re
+
+
+# The infobox (table at the top right of an article) holds the circulation, audience share and country
+infobox_pattern = re.compile(
+    rb'(?P<circulation>\b[cC]irculation\b.*?\n?[^0-9]*?(?P<circulation_num>[0-9,.]+[,.][0-9]{3}))'
+    rb'|(?P<audience_share>\b[Aa]udience [Ss]hare\b</th><td[^>]*>(?:<[^>]*>)*'
+    rb'(?P<audience_share_num>[0-9,.]+[,.][0-9]{3}|[0-9]{1,2}.[0-9]*%|[0-9.]+ \bmillion\b|[0-9]+))'
+    rb'|(?P<country>\b[Cc]ountry\b</th><td[^>]*>(?:<[^>]*>)*(?P<country_name>[^<]*))')
+
+# The footer holds the date of the last edit
+footer_pattern = re.compile(rb'\bThis page was last edited on \b(([0-9]{1,2}) [a-zA-Z]+ [0-9]+)')
+
+# Text of the article, only scanned when the infobox does not give a number
+copies_pattern = re.compile(rb'([0-9,.]+[,.][0-9]{3}) \b[cC]opies\b')
+circulation_text_pattern = re.compile(rb'\b[cC]irculation\b .{0,4} ([0-9,.]+[,.][0-9]{3})')
+viewers_pattern = re.compile(rb'(([0-9,.]+ (\bmillion\b )?)(\b[Vv]iewers\b|\b[Hh]omes\b)|\b[Hh]ouseholds\b)')
+
+# Lists of newspapers and of news television channels
+newspaper_link_pattern = re.compile(rb'<i><a href="/wiki/([^"]*)')
+table_row_pattern = re.compile(rb'<tr>(.*?)</tr>', re.DOTALL)
+title_pattern = re.compile(rb'title="([^"]*)')
+
+timings = dict()            # Pattern name -> [number of scans, seconds, bytes scanned]
+timings_lock = threading.Lock()
+
+
+def as_bytes(page: tp.Union[str, bytes]) -> bytes:
+    """
+    Gives the bytes of a webpage
+    @param page: the webpage, as bytes or as str
+    @return: the utf-8 bytes of the webpage
+    """
+    if type(page) == bytes:
+        return page
+    elif type(page) == str:
+        return page.encode('utf-8')
+    raise TypeError(f'param "page" should be of type {bytes} or {str}')
+
+
+def scan(name: str, pattern: re.Pattern, text: bytes) -> tp.List[re.Match]:
+    """
+    Gives all the matches of a pattern in a text, and counts the time it took
+    @param name: name of the pattern, for the timings
+    @param pattern: the compiled pattern
+    @param text: the bytes to scan
+    @return: a list with the matches
+    """
+    t0 = time.perf_counter()
+    matches = list(pattern.finditer(text))
+    seconds = time.perf_counter() - t0
+    with timings_lock:
+        timing = timings.setdefault(name, [0, 0., 0])
+        timing[0] += 1
+        timing[1] += seconds
+        timing[2] += len(text)
+    return matches
+
+
+def report() -> str:
+    """
+    Gives the timings of the patterns
+    @return: a string with the number of scans and the time per pattern
+    """
+    with timings_lock:
+        items = sorted(timings.items(), key=lambda item: -item[1][1])
+        return '; '.join(f'{name}: {num} scans, {round(seconds, 3)}s, {round(size / 10 ** 6, 1)}MB'
+                         for name, (num, seconds, size) in items)
+
+
+def infobox(page: bytes) -> bytes:
+    """
+    Gives the infobox table of a wikipedia article, with the tables inside it
+    @param page: the bytes of the article
+    @return: the bytes of the infobox, empty if there is none
+    """
+    start = page.find(b'class="infobox')
+    if start < 0:
+        return b''
+
+    depth, pos = 1, start
+    while depth:
+        close = page.find(b'</table', pos)
+        if close < 0:
+            return page[start:]
+        opening = page.find(b'<table', pos, close)
+        if opening >= 0:
+            depth, pos = depth + 1, opening + 6
+        else:
+            depth, pos = depth - 1, page.find(b'>', close) + 1 or len(page)
+    return page[start:pos]
+
+
+def footer(page: bytes) -> bytes:
+    """
+    Gives the footer of a wikipedia article
+    @param page: the bytes of the article
+    @return: the bytes of the footer, the whole page if there is no footer
+    """
+    start = page.rfind(b'<footer')
+    if start < 0:
+        start = page.rfind(b'id="footer')
+    return page[start:] if start >= 0 else page
+
+
+def to_int(number: bytes) -> int:
+    """
+    Converts a number like 1,234,567 or 1.234.567 to an int
+    @param number: the bytes of the number
+    @return: the int
+    """
+    return int(number.replace(b'.', b'').replace(b',', b''))
+
+
+class PageInfo:
+    """
+    The information found in the infobox and footer of a wikipedia article, with one scan of each
+    """
+    def __init__(self, page: tp.Union[str, bytes]):
+        """
+        Initialiser for PageInfo
+        @param page: the article, as bytes or as str
+        """
+        self.page = as_bytes(page)  # Dropped by compact()
+        self.circulation = []       # The circulation numbers, as bytes
+        self.audience_share = []    # The audience share values, as bytes
+        self.country = []           # The countries, as str
+        self.wiki_date = None       # The date of the last edit, as str
+        self.fallback = None        # The number found in the text by compact(), if the infobox does not give one
+        for match in scan('infobox', infobox_pattern, infobox(self.page)):
+            if match.group('circulation') is not None:
+                self.circulation.append(match.group('circulation_num'))
+            elif match.group('audience_share') is not None:
+                self.audience_share.append(match.group('audience_share_num'))
+            else:
+                self.country.append(html.unescape(match.group('country_name').decode('utf-8', 'replace')))
+
+        find = scan('footer', footer_pattern, footer(self.page))
+        if find:
+            date = find[-1].group(1).decode('utf-8', 'replace')
+            date = '0' + date if len(find[-1].group(2)) == 1 else date
+            try:
+                dt.datetime.strptime(date, '%d %B %Y')
+                self.wiki_date = date
+            except ValueError:      # Not a date datetime can read (e.g. another language), the date stays unknown
+                pass
+
+    def compact(self, tpe: str) -> 'PageInfo':
+        """
+        Scan the text of the article for the number of the outlet (only if the infobox does not give it),
+            then drop the page, so only the extracted fields are kept
+        @param tpe: 'pp' for a newspaper, 'tv' for a tv channel
+        @return: the PageInfo itself
+        """
+        if self.page is not None:
+            needed = not self.circulation if tpe == 'pp' else self.share_viewers(1.) is None
+            self.fallback = self.text_number(tpe) if needed else None
+            self.page = None
+        return self
+
+    def newspaper_readers(self) -> tp.Optional[int]:
+        """
+        Gives the circulation of a newspaper: from the infobox, else from the text of the article
+        @return: the circulation, None if it was not found
+        """
+        if self.circulation:
+            return to_int(self.circulation[0])
+        return self.text_number('pp')
+
+    def tvchannel_viewers(self, tv_viewers: float) -> tp.Optional[int]:
+        """
+        Gives the number of viewers of a tv channel: from the audience share in the infobox,
+            else from the text of the article
+        @param tv_viewers: number of television viewers in the country of the channel
+        @return: the number of viewers, None if it was not found
+        """
+        number = self.share_viewers(tv_viewers)
+        return number if number is not None else self.text_number('tv')
+
+    def share_viewers(self, tv_viewers: float) -> tp.Optional[int]:
+        """
+        Gives the number of viewers of a tv channel from the audience share in the infobox
+        @param tv_viewers: number of television viewers in the country of the channel
+        @return: the number of viewers, None if it was not found
+        """
+        for share in self.audience_share:
+            if b'%' in share:
+                return int(float(share.replace(b'%', b'')) * tv_viewers)
+            elif b'million' in share:
+                return int(float(share.replace(b' million', b'')) * 10 ** 6)
+            else:
+                try:
+                    return int(share.replace(b',', b''))
+                except ValueError:
+                    continue
+        return None
+
+    def text_number(self, tpe: str) -> tp.Optional[int]:
+        """
+        Gives the circulation (newspaper) or number of viewers (tv channel) from the text of the article
+        @param tpe: 'pp' for a newspaper, 'tv' for a tv channel
+        @return: the number, None if it was not found
+        """
+        if self.page is None:
+            return self.fallback    # Found by compact()
+
+        if tpe == 'pp':
+            find = scan('copies', copies_pattern, self.page)
+            if find:
+                return to_int(find[-1].group(1))
+
+            find = scan('circulation_text', circulation_text_pattern, self.page)
+            if find:
+                return to_int(find[-1].group(1))
+
+        else:
+            for match in scan('viewers', viewers_pattern, self.page)[::-1]:
+                number = match.group(2) or b''
+                try:
+                    if b'million' in number:
+                        return int(float(number.replace(b' million', b'')) * 10 ** 6)
+                    else:
+                        return int(number.replace(b',', b''))
+                except ValueError:
+                    continue
+
+        return None
+
+
+def find_wiki_date(page: tp.Union[str, bytes]) -> str:
+    """
+    Find the date of the last edit in a wikipedia page
+    @param page: the wikipedia page, as bytes or as str
+    @return: a string readable by datetime, the current date if none was found
+    """
+    date = PageInfo(page).wiki_date
+    return date if date is not None else dt.datetime.now().strftime('%d %B %Y')
+
+
+def newspaper_titles(page: tp.Union[str, bytes]) -> tp.List[str]:
+    """
+    Gives the wikipedia page names of the newspapers in a "List of newspapers in {country}" article
+    @param page: the article, as bytes or as str
+    @return: a list with the page names
+    """
+    # The links are percent-encoded (e.g. Lib%C3%A9ration), the API only knows the decoded page names
+    return [urllib.parse.unquote(html.unescape(match.group(1).decode('utf-8', 'replace'))).replace('_', ' ')
+            for match in scan('newspaper_link', newspaper_link_pattern, as_bytes(page))]
+
+
+def tvchannel_titles(page: tp.Union[str, bytes]) -> tp.List[str]:
+    """
+    Gives the wikipedia page names of the first link of each table row of the "List of news television channels"
+    @param page: the article, as bytes or as str
+    @return: a list with the page names
+    """
+    titles = []
+    for row in scan('table_row', table_row_pattern, as_bytes(page)):
+        find = title_pattern.search(row.group(1))
+        if find is not None:
+            titles.append(html.unescape(find.group(1).decode('utf-8', 'replace')))
+    return titles
@@ -5,8 +5,9 @@ All the functions that handle file reading and writing.
 import csv
 import os
 import queue
+import threading
 import typing as tp
-from .NewsSite import NewsSite
+from . import dumphandling as dh
 
 
 def read_internet_tv_csv(mainpy=True) -> dict:
@@ -87,36 +88,22 @@ def read_from_csv(mainpy=True) -> dict:
 
 def write_to_json(q_newssites: queue.Queue, num: int, mainpy=True) -> queue.Queue:
     """
-    Function to write a queue with NewsSite objects to a json file
+    Function to write a queue with NewsSite objects to a dump file
     @param q_newssites: a queue with NewsSite objects
     @param mainpy: boolean to indicate if this file is run from main.py
     @param num: the number put behind the file name
     """
-    newssites = []                              # Initiate an empty list
     q_copy = queue.Queue()                      # Initiate a replacement queue
+    newssites = []                              # Initiate an empty list
     while not q_newssites.empty():              # Iterate through the queue
         newssite, *a = q_newssites.get()            # Unpack each item
         q_copy.put((newssite,))                     # Put the newssite back
         newssites.append(newssite)                  # Also add it to the list
-    NewsSite.write_json(newssites, json_idx=num, main=mainpy)    # Write the list to a json
+    dh.write_dump(newssites, num, mainpy=mainpy)    # Stream the list to the dump
 
     return q_copy                               # Return the replacement
 
 
-def read_from_json(num: int, mainpy=True) -> queue.Queue:
-    """
-    Reads a json containing a queue of NewsSite objects
-    @param num: the number put behind the file name
-    @param mainpy: boolean to indicate if this file is run from main.py
-    @return: a queue of NewsSite objects
-    """
-    q_newssites = queue.Queue()                     # Initiate queue
-    newssites = NewsSite.get_json(json_idx=num, main=mainpy)     # Read the info from the json
-    [q_newssites.put((newssite,)) for newssite in newssites]    # Put that all into the queue
-
-    return q_newssites                              # Return the queue
-
-
 def write_results(q_newssites: queue.Queue, mainpy=True) -> None:
     """
     Write the final results queue to the csv file
@@ -160,6 +147,15 @@ def read_from_file(mainpy: bool) -> tp.Tuple[dict, dict]:
     else:
         path = 'project/News_weights/data/News_reach2.csv'
 
+    return read_reach_file(path)
+
+
+def read_reach_file(path: str) -> tp.Tuple[dict, dict]:
+    """
+    Reads a news outlet reach csv file at the given path
+    @param path: path to the csv file
+    @return: Integers denoting reach in Dictionary with keys: {News site names}
+    """
     # Get the data from the file
     with open(path, encoding='utf-8') as f:
         data = list(csv.DictReader(f))
@@ -176,3 +172,66 @@ def read_from_file(mainpy: bool) -> tp.Tuple[dict, dict]:
             bng_dict[bng_name] = int(ln['reach'])
 
     return ggl_dict, bng_dict
+
+
+class ReachIndex:
+    """
+    In-memory index of a news outlet reach csv file, keyed by Google and Bing names.
+    The file is only parsed again when its modification time changes.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = None
+        self.ggl_dict = {}
+        self.bng_dict = {}
+        self.lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """
+        Reload the index if the file changed on disk since the last load
+        Raises FileNotFoundError if the file does not exist
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self.mtime:
+            with self.lock:
+                if mtime != self.mtime:     # Another thread might have reloaded it in the meantime
+                    self.ggl_dict, self.bng_dict = read_reach_file(self.path)
+                    self.mtime = mtime
+
+    def get_dict(self, engine: str) -> dict:
+        """
+        Get the up-to-date reach dictionary of a search engine
+        @param engine: the search engine: ('b', 'B' or 'bing' for Bing; 'g', 'G' or 'google' for Google
+        @return: dictionary with the reach of each news outlet name of that engine
+        """
+        if engine in ('g', 'G', 'google'):
+            self.refresh()
+            return self.ggl_dict
+        elif engine in ('b', 'B', 'bing'):
+            self.refresh()
+            return self.bng_dict
+        else:
+            raise ValueError(
+                f'Invalid engine, should be in ("b", "B", "bing") for Bing or in ("g", "G", "google") for Google')
+
+
+reach_indices = {}      # Process-wide ReachIndex objects, one per file path
+reach_lock = threading.Lock()
+
+
+def get_reach_index(mainpy: bool) -> ReachIndex:
+    """
+    Get the process-wide index of the news outlet reach data file
+    @param mainpy: boolean to indicate if this file is run from main.py
+    @return: the ReachIndex of the data file
+    """
+    # Get the path
+    if not mainpy:
+        path = 'News_weights/data/News_reach2.csv'
+    else:
+        path = 'project/News_weights/data/News_reach2.csv'
+
+    with reach_lock:
+        if path not in reach_indices:
+            reach_indices[path] = ReachIndex(path)
+        return reach_indices[path]
@@ -2,10 +2,12 @@
 All the multithreading stuff for the News_weights package.
 """
 
+from . import extracthandling as eh
 from . import webhandling as wh
 from .NewsSite import NewsSite
 import typing as tp
-import re
+import collections
+import functools
 import threading
 import queue
 import time
@@ -55,96 +57,286 @@ class ProgressThread(threading.Thread):
         self.step += 1
 
 
-class QueueThread(threading.Thread):
+class PoolStage:
     """
-    Subclass of threading.Thread to allow for queued input and constant amount of threads
+    A stage of work submitted to a WorkerPool: its concurrency limit, its waiting jobs and its counters
     """
-    def __init__(self, input_queue: queue.Queue, result_queue: queue.Queue,
-                 task: callable, args: tuple, name=None):
+    def __init__(self, name: str, limit=None):
         """
-        Initialiser for QueueThread
-        @param input_queue: a queue with input values to be processed
-        @param result_queue: a queue in which the results should be put()
-        @param task: the task this thread has to execute
-        @param args: constant set of arguments for task
-        @param name: an optional name for this thread
+        Initialiser for PoolStage, use WorkerPool.stage() to create one
+        @param name: the name of the stage
+        @param limit: optional maximum number of jobs of this stage running at the same time
+        """
+        self.name = name
+        self.limit = limit
+        self.cond = threading.Condition()
+        self.backlog = collections.deque()  # Jobs waiting for a free slot of the stage
+        self.running = 0                    # Jobs in the queue of the pool or being run
+        self.pending = 0                    # Jobs submitted and not done yet (waiting, running or backing off)
+
+        self.submitted = 0
+        self.done = 0
+        self.failed = 0
+        self.requeued = 0
+        self.calls = 0
+        self.latency = 0.                   # Total time spent in the task, in seconds
+        self.t_first = None
+        self.t_last = None
+
+    def join(self, timeout=None) -> bool:
+        """
+        Wait until all the jobs submitted to the stage are done
+        @param timeout: optional maximum number of seconds to wait
+        @return: boolean to indicate that all jobs are done
         """
-        super().__init__(name=name)
+        with self.cond:
+            return self.cond.wait_for(lambda: self.pending == 0, timeout)
 
-        if type(input_queue) != queue.Queue:
-            raise TypeError(f'param "input_queue" should be of type {queue.Queue}')
-        if type(result_queue) != queue.Queue:
-            raise TypeError(f'param "result_queue" should be of type {queue.Queue}')
+    def throughput(self) -> float:
+        """
+        @return: the number of jobs done (or failed) per second, since the first one started
+        """
+        if self.t_first is None or self.t_last == self.t_first:
+            return 0.
+        return (self.done + self.failed) / (self.t_last - self.t_first)
+
+    def mean_latency(self) -> float:
+        """
+        @return: the mean time (seconds) of a call to the task
+        """
+        return self.latency / self.calls if self.calls else 0.
+
+    def report(self) -> str:
+        """
+        @return: a string with the counters of the stage
+        """
+        return (f'{self.name}: {self.done} done, {self.failed} failed, {self.requeued} requeued, '
+                f'{self.throughput():.1f}/s, {1000 * self.mean_latency():.0f} ms per call')
+
+
+class WorkerPool:
+    """
+    A fixed number of worker threads shared by all the stages, with a concurrency limit per stage
+    Jobs refused because of too many requests (ConnectionRefusedError) are requeued with an exponential backoff
+    """
+    def __init__(self, num_threads=128, max_retries=5, backoff=1., max_backoff=60., name='Worker'):
+        """
+        Initialiser for WorkerPool, the threads are started by the first submit()
+        @param num_threads: number of worker threads
+        @param max_retries: number of times a refused job is requeued before it fails
+        @param backoff: number of seconds to wait before the first requeue, doubled for each next one
+        @param max_backoff: maximum number of seconds to wait before a requeue
+        @param name: prefix of the thread names
+        """
+        self.num_threads = num_threads
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.name = name
+        self.jobs = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.stages = dict()
+
+    def stage(self, name: str, limit=None) -> PoolStage:
+        """
+        Create a stage to submit jobs to
+        @param name: the name of the stage, for the counters
+        @param limit: optional maximum number of jobs of this stage running at the same time
+        @return: the PoolStage
+        """
+        stage = PoolStage(name, limit)
+        with self.lock:
+            self.stages[name] = stage
+        return stage
+
+    def start(self) -> None:
+        """
+        Start the worker threads, if not done yet
+        """
+        with self.lock:
+            if not self.threads:
+                self.threads = [threading.Thread(target=self.work, name=f'{self.name}-{i}', daemon=True)
+                                for i in range(self.num_threads)]
+                [thread.start() for thread in self.threads]
+
+    def close(self) -> None:
+        """
+        Stop the worker threads once the queued jobs are done
+        """
+        with self.lock:
+            threads, self.threads = self.threads, []
+        [self.jobs.put(None) for _ in threads]
+        [thread.join() for thread in threads]
+
+    def submit(self, stage: PoolStage, task: callable, args=tuple(), callback=None, errback=None) -> None:
+        """
+        Submit a job: task(*args) is run by one of the worker threads
+        @param stage: the PoolStage of the job
+        @param task: the function to be run
+        @param args: tuple with the arguments of the task
+        @param callback: optional function called with the return value of the task
+        @param errback: optional function called with the exception, if the task fails
+        """
         if not callable(task):
             raise TypeError(f'param "task" should be a function object')
-        if type(args) != tuple:
-            raise TypeError(f'param "args" should be of type {tuple}')
 
-        self.input_queue = input_queue
-        self.result_queue = result_queue
-        self.task = task
-        self.args = args
-        self.busy = None
+        self.start()
+        with stage.cond:
+            stage.pending += 1
+            stage.submitted += 1
+            stage.backlog.append((stage, task, args, callback, errback, 0))
+            self.dispatch(stage)
 
-    def run(self) -> None:
+    def dispatch(self, stage: PoolStage) -> None:
+        """
+        Put the waiting jobs of a stage in the queue of the pool, as far as its limit allows (call with stage.cond)
+        @param stage: the PoolStage
         """
-        Override of threading.Thread.run(self) to allow cycling throught the queued inputs
+        while stage.backlog and (stage.limit is None or stage.running < stage.limit):
+            stage.running += 1
+            self.jobs.put(stage.backlog.popleft())
+
+    def requeue(self, job: tuple) -> None:
         """
-        while not self.input_queue.empty() and threading.main_thread().is_alive():     # Iterate through the input queue
-            ipt = self.input_queue.get()                        # Get an input item
-            self.busy = ipt                                     # Make the busy indicator that input
+        Put a refused job back in the backlog of its stage
+        @param job: the job
+        """
+        stage = job[0]
+        with stage.cond:
+            stage.backlog.append(job)
+            self.dispatch(stage)
+
+    def work(self) -> None:
+        """
+        Target of the worker threads: run the queued jobs until a None is queued
+        """
+        while True:
+            job = self.jobs.get()
             try:
-                opt, *xtr, iterate = self.task(*ipt, *self.args)    # Run the task and unpack the return values
-                if opt is not None:                                 # In case the main output is not None
-                    # If the iterate indicator is True, try to put the output through iteration
-                    if iterate:
-                        for tup in opt:
-                            try:
-                                for key, item in tup.items():
-                                    self.result_queue.put((key, item))
-                            except AttributeError:
-                                self.result_queue.put((tup,))
-                    # Otherwise put the output in the result queue as is, including the extra output
-                    else:
-                        if xtr:
-                            self.result_queue.put((opt, tuple(xtr)))
-                        else:
-                            self.result_queue.put((opt,))
-
-            # Handle exceptions
-            except TypeError as e:
-                print(f'\n{self.name}: While processing {ipt}, a TypeError exception was raised: {e}')
-                continue
+                if job is None:
+                    return
+                self.run_job(job)
+            finally:
+                self.jobs.task_done()
+
+    def run_job(self, job: tuple) -> None:
+        """
+        Run a job, and call its callback or errback (or requeue it if it was refused)
+        @param job: the job
+        """
+        stage, task, args, callback, errback, attempt = job
+        t0 = time.time()
+        with stage.cond:
+            stage.t_first = t0 if stage.t_first is None else stage.t_first
+
+        error, result = None, None
+        try:
+            result = task(*args)
+        except ConnectionRefusedError as e:
+            if attempt < self.max_retries:
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                timer = threading.Timer(delay, self.requeue, ((stage, task, args, callback, errback, attempt + 1),))
+                timer.daemon = True
+                timer.start()
+                self.finish(stage, t0, 'requeued')
+                return
+            error = e
+        except Exception as e:
+            error = e
+
+        try:
+            if error is None and callback is not None:
+                callback(result)
+            elif error is not None and errback is not None:
+                errback(error)
+        except Exception as e:
+            print(f'\n{threading.current_thread().name}: The callback of a {stage.name} job raised an exception: {e}')
+        self.finish(stage, t0, 'done' if error is None else 'failed')
+
+    def finish(self, stage: PoolStage, t0: float, outcome: str) -> None:
+        """
+        Count a finished call of a stage, and free its slot
+        @param stage: the PoolStage
+        @param t0: the time the call started
+        @param outcome: 'done', 'failed' or 'requeued'
+        """
+        t1 = time.time()
+        with stage.cond:
+            setattr(stage, outcome, getattr(stage, outcome) + 1)
+            stage.calls += 1
+            stage.latency += t1 - t0
+            stage.t_last = t1
+            stage.running -= 1
+            if outcome != 'requeued':
+                stage.pending -= 1
+            self.dispatch(stage)
+            stage.cond.notify_all()
+
+    def join(self) -> None:
+        """
+        Wait until all the jobs submitted to the pool are done
+        """
+        with self.lock:
+            stages = list(self.stages.values())
+        [stage.join() for stage in stages]
+        self.jobs.join()
 
-            except ConnectionRefusedError as e:
-                print(f'\n{self.name}: While processing {ipt}, a ConnectionRefusedError exception was raised: {e}\n',
-                      f'\n{self.name}: ABORTING FURTHER RUN')
-                break
+    def report(self) -> str:
+        """
+        @return: a string with the counters of every stage
+        """
+        with self.lock:
+            stages = list(self.stages.values())
+        return '; '.join(stage.report() for stage in stages)
 
-            except ConnectionError as e:
-                print(f'\n{self.name}: While processing {ipt}, a ConnectionError exception was raised: {e}')
-                continue
 
-            except Exception as e:
-                print(f'\n{self.name}: While processing {ipt}, an unexpected exception was raised: {e}')
-                continue
+pool = WorkerPool()     # Shared by all the stages of the package
 
-        if not threading.main_thread().is_alive() and not self.input_queue.empty():
-            print(f'Stopped {self} after Interupt of MainThread')
 
-        return
+class QueueThread:
+    """
+    Runs a task on each input value of a queue, with the worker threads of a WorkerPool
+    """
+    @staticmethod
+    def unpack(opt: tp.Any, xtr: list, iterate: bool) -> tp.List[tuple]:
+        """
+        Staticmethod for QueueThread to convert the return values of a task into the items for the result queue
+        @param opt: the main output of the task
+        @param xtr: the extra outputs of the task
+        @param iterate: boolean to put the items of the main output in the result queue one by one
+        @return: a list with the items for the result queue
+        """
+        outputs = []
+        if opt is not None:                                 # In case the main output is not None
+            # If the iterate indicator is True, try to put the output through iteration
+            if iterate:
+                for tup in opt:
+                    try:
+                        for key_, item in tup.items():
+                            outputs.append((key_, item))
+                    except AttributeError:
+                        outputs.append((tup,))
+            # Otherwise put the output in the result queue as is, including the extra output
+            else:
+                if xtr:
+                    outputs.append((opt, tuple(xtr)))
+                else:
+                    outputs.append((opt,))
+        return outputs
 
     @staticmethod
     def thread_runner(input_queue: queue.Queue, task: callable, args: tuple,
-                      result_queue=None, num_threads=8) -> queue.Queue:
+                      result_queue=None, num_threads=8, worker_pool=None) -> queue.Queue:
         """
         Staticmethod for QueuedThread to manage multithreaded workflow
         @param input_queue: a queue with input values to be processed
         @param task: a function to be executed on the input values
         @param args: tuple of constants for the task
         @param result_queue: optional queue for output of task to be put into
-        @param num_threads: number of threads to be used, defaults to 8
-        @return: the result_queue with the processed input put() into it
+        @param num_threads: maximum number of input values processed at the same time, defaults to 8
+        @param worker_pool: optional WorkerPool, instead of the shared one
+        @return: the result_queue with the processed input put() into it, in the order of the input values
         """
         # Type handling
         if type(input_queue) != queue.Queue:
@@ -157,296 +349,220 @@ class QueueThread(threading.Thread):
             raise TypeError(f'param "args" should be of type {tuple}')
         if result_queue is None:
             result_queue = queue.Queue()
+        worker_pool = pool if worker_pool is None else worker_pool
 
-        if input_queue.empty():
-            return result_queue
+        items = []
+        while not input_queue.empty():
+            items.append(input_queue.get())
+        outputs = [[] for _ in items]           # The items for the result queue, per input value
 
-        num_threads = min(input_queue.qsize(), num_threads)
+        def done(idx: int, ret: tuple) -> None:
+            opt, *xtr, iterate = ret            # Unpack the return values of the task
+            outputs[idx] = QueueThread.unpack(opt, xtr, iterate)
 
-        # Creating the threads and starting them
-        threads = [QueueThread(input_queue, result_queue, task, args, name=f'Thread-{i}') for i in range(num_threads)]
-        [thread.start() for thread in threads]
+        def failed(ipt: tuple, error: Exception) -> None:
+            print(f'\n{stage.name}: While processing {ipt}, a {type(error).__name__} exception was raised: {error}')
 
-        # Loop to keep the rest from the code from running before threads are all done
-        for thread in threads:
-            thread.join()
-            del thread
-        del input_queue
+        stage = worker_pool.stage(getattr(task, '__name__', 'task'), limit=num_threads)
+        for idx, ipt in enumerate(items):
+            worker_pool.submit(stage, task, (*ipt, *args), callback=functools.partial(done, idx),
+                               errback=functools.partial(failed, ipt))
+        stage.join()
 
+        [result_queue.put(output) for item_outputs in outputs for output in item_outputs]
         return result_queue
 
 
-def get_newspapers(q_newssites: queue.Queue, country_dict: dict) -> queue.Queue:
+def newspapers_input(country_dict: dict) -> queue.Queue:
     """
-    Gets the newspapers in the countries in country_lst from wikipedia and returns them in a queue
-    @param q_newssites: a queue to put NewsSite objects in
+    Create a queue for newspapers_task() to work with as a task_queue.
     @param country_dict: the working country information dictionary
-    @return: q_newspapers with the addition of the newspapers found here
+    @return: a queue.Queue object containing all the wikipedia links for newspapers_task() to work with.
     """
-    def construct_input_queue() -> queue.Queue:
-        """
-        Create a queue for GetNewspaperThread to work with as a task_queue.
-        @return: a queue.Queue object containing all the wikipedia links for GetNewspaperThread to work with.
-        """
-        result = queue.Queue()
-        for country in country_dict:
-            try:
-                url = wh.create_wiki_link(f'List of newspapers in {country}')
-                result.put((country, url))
-            except ValueError:
+    result = queue.Queue()
+    titles = {country: f'List of newspapers in {country}' for country in country_dict}
+    links = wh.resolve_wiki_titles(titles.values())     # Check which lists exist, in bulk
+    for country, title in titles.items():
+        if links[title] is not None:
+            result.put((country, links[title]))
+
+    return result
+
+
+def newspapers_task(country: str, url: str) -> tp.Tuple[tp.Optional[tp.List[NewsSite]], bool]:
+    """
+    The task function of the newspapers stage of pipelinehandling.Pipeline
+    @param country: a string containing a country name
+    @param url: a string containing a url for the "List of newspapers in {country}" wikipedia article
+    @return: a list with all NewsSite objects obtained from the wikipedia article
+            and the iterate boolean for QueueThread.run()
+    """
+    page = wh.get_webpage_bytes(url)                        # Get the webpage
+    names = eh.newspaper_titles(page)                       # Find the newspaper names in the wikipedia links
+    if names:                                               # If something is found
+        links = wh.resolve_wiki_titles(names)                   # Check which ones have a wikipedia page, in bulk
+        newssites = []
+        for name in names:                                      # Go through all the findings
+            if links[name] is None:
                 continue
+            # Put a corresponding NewsSite instance in the result queue
+            newssite = NewsSite(name, 'pp')
+            newssite.set_wiki_url(links[name])
+            newssite.set_country(country)
+            newssite.acquire_wiki_date()    # Downloads the page once, its information is kept for tempreaders_task()
+            newssites.append(newssite)
 
-        return result
+        return newssites, True
 
-    def task(country: str, url: str) -> tp.Tuple[tp.Optional[tp.List[NewsSite]], bool]:
-        """
-        The task function for the threads to work on
-        @param country: a string containing a country name
-        @param url: a string containing a url for the "List of newspapers in {country}" wikipedia article
-        @param rel: dictionary with already existing NewsSite objects
-        @return: a list with all NewsSite objects obtained from the wikipedia article
-                and the iterate boolean for QueueThread.run()
-        """
-        page = wh.get_webpage_html_str(url)                        # Get the webpage
-        find = re.findall(r'<i><a href="/wiki/[^"]*', page)     # Find wikipedia links
-        if find:                                                # If something is found
-            newssites = []
-            for _res in find:                                       # Go through all the findings
-                # Get the newspaper name and put a corresponding NewsSite instance in the result queue
-                name = _res.replace('<i><a href="/wiki/', '').replace('_', ' ')
-                newssite = NewsSite(name, 'pp')
-                try:
-                    newssite.set_wiki_url(wh.create_wiki_link(name))
-                    newssite.set_country(country)
-                    newssite.acquire_wiki_date()
-                    newssites.append(newssite)
-                except ValueError:
-                    continue
-
-            return newssites, True
+    return None, False
 
-        return None, False
 
-    # Create the input queue and process it with multithreading
-    input_queue = construct_input_queue()
-    return QueueThread.thread_runner(input_queue, task, tuple(), result_queue=q_newssites, num_threads=24)
+def tvchannels_input() -> queue.Queue:
+    """
+    Gets all news television channels that are listed on a wiki list
+    @return: a queue with NewsSite objects for further processing
+    """
+    url, page = wh.get_wiki_page('List of news television channels')  # Get the url and the webpage of the wiki
+
+    names = eh.tvchannel_titles(page)                           # Find the wiki title of each table entry
+    result = queue.Queue()                                      # Create a Queue
+
+    if names:                                                   # If something is found
+        links = wh.resolve_wiki_titles(names)                      # Check the wikipedia links, in bulk
+        for name in names:
+            if links[name] is not None:                                 # Put a NewsSite instance in the queue
+                newssite = NewsSite(name, 'tv')
+                newssite.set_wiki_url(links[name])
+                result.put((newssite,))                                 # Bad wikipedia links are skipped
+    return result
 
 
-def get_tvchannels(q_newssites: queue.Queue, country_dict: dict) -> queue.Queue:
+def tvchannels_task(newssite: NewsSite, cntry_dict: dict) -> tp.Tuple[tp.Optional[NewsSite], bool]:
     """
-    Get the tv channels from the wikipedia page "List of news television channels"
-    @param q_newssites: a queue to put NewsSite objects in
-    @param country_dict: the working country information dictionary
-    @return: q_newssites with the addition of the news channels found on wikipedia
+    The task function of the tvchannels stage of pipelinehandling.Pipeline
+    @param newssite: a NewsSite object of which the country is unknown
+    @param cntry_dict: the working country information dictionary
+    @return: newssite, but now processed and the iterate boolean for QueueThread.run()
+    """
+    # Get the webpage, and only keep the information extracted from it in the NewsSite object
+    info = eh.PageInfo(wh.get_webpage_bytes(newssite.wiki_url)).compact('tv')
+    newssite.set_info(info)
+    newssite.acquire_wiki_date()
+
+    # Find the country in the infobox of the NewsSite
+    if info.country and info.country[0] in cntry_dict:
+        newssite.set_country(info.country[0])
+
+    # Filter out news sites without a country
+    if newssite.check_flag('country'):
+        return newssite, False
+    else:
+        del newssite
+        return None, False
+
+
+def tempreaders_task(site: NewsSite, cntry_dict: dict) -> tp.Union[tp.Tuple[tp.Tuple[NewsSite], str, int, bool],
+                                                                   tp.Tuple[None, bool]]:
+    """
+    The task function of the tempreaders stage of pipelinehandling.Pipeline
+    @param site: a NewsSite object of which the country is unknown
+    @param cntry_dict: the working country information dictionary
+    @return: newssite, but now processed and a tuple with info for readers_dict
+                and the iterate boolean for QueueThread.run()
     """
-    def construct_input_queue() -> queue.Queue:
+    # HELPER FUNCTIONS
+    def get_info() -> eh.PageInfo:
         """
-        Gets all news television channels that are listed on a wiki list
-        @return: a queue with NewsSite objects for further processing
+        Get the information extracted from the wikipedia page of the NewsSite
+        @return: a PageInfo object
         """
-        url = wh.create_wiki_link('List of news television channels')  # Create the url to the wiki
-        page = wh.get_webpage_html_str(url)                            # Get the webpage
+        if site.info is not None:
+            return site.info                    # If the NewsSite already has the information, use that
+        elif site.page is not None:
+            return eh.PageInfo(site.page)       # If the NewsSite already has a webpage, use that
+        elif site.wiki_url is None:
+            return eh.PageInfo(b'')             # If the NewsSite has now wiki_url, make the page empty
+        return eh.PageInfo(wh.get_webpage_bytes(site.wiki_url))
+
+    def finder_newspaper() -> int:
+        """
+        Find the raw wikipedia number for newspaper type NewsSite objects
+        @return: an int with the raw wikipedia number
+        """
+        try:
+            info = get_info()
+        except ConnectionRefusedError as e:
+            print(f'\n{e}')
+            return 0
+        except ConnectionError:
+            return 0
+
+        # Circulation in the infobox, or else in the text
+        number = info.newspaper_readers()
+        if number is not None:
+            return number
+
+        return int(0.005 * cntry_dict[site.country]['pop'])  # Assume value if all else fails
+
+    def finder_tvchannel() -> int:
+        """
+        Find the raw wikipedia number for tv channel type NewsSite objects
+        @return: an int with the raw wikipedia number
+        """
+        # Audience share in the infobox, or else viewers in the text
+        number = get_info().tvchannel_viewers(cntry_dict[site.country]['TV'])
+        if number is not None:
+            return number
+
+        return int(0.01 * cntry_dict[site.country]['TV'])  # Assume value if all else fails
+
+    # MAIN TASK
+    if site.tpe == 'pp':                # If the NewsSite is a newspaper
+        number = finder_newspaper()         # Find the number
+    elif site.tpe == 'tv':              # If the NewsSite is a TV channel
+        number = finder_tvchannel()         # Find the number
+    else:                               # If the NewsSite is of unknown type
+        number = 0                          # Set the number to 0
+
+    # If the number is not 0 (failure number) add this number to the NewsSite
+    if number > 0:
+        site.set_tempreaders(number)
+    site.remove_page()                  # The webpage (information) is not needed by the next stages
+
+    # Filter out stuff
+    if site.check_flag('tempreaders'):
+        return (site,), site.country, number, False
+    else:
+        del site
+        return None, False
 
-        findtab = re.findall(r'(<tr>(\n.*?)*</tr>)', page)          # Find table entries in the page
-        result = queue.Queue()                                      # Create a Queue
 
-        if findtab:                                                 # If something is found
-            for res in findtab:                                        # Go through all the results
-                findtitle = re.search(r'title="[^"]*', res[0])              # Find the wiki title
-                if findtitle is not None:                                   # If something is found
-                    name = findtitle.group().replace('title="', '')             # Extract the name
-                    try:
-                        link = wh.create_wiki_link(name)                     # Create the wikipedia link
-                        if link:                                              # Put a NewsSite instance in the queue
-                            newssite = NewsSite(name, 'tv')
-                            newssite.set_wiki_url(link)
-                            result.put((newssite,))
-                    except ValueError:
-                        continue                                         # Just in case there's a bad wikipedia link
-        return result
-
-    def task(newssite: NewsSite, cntry_dict: dict) -> tp.Tuple[tp.Optional[NewsSite], bool]:
-        """
-        The task function for the threads to work on
-        @param newssite: a NewsSite object of which the country is unknown
-        @param cntry_dict: the working country information dictionary
-        @return: newssite, but now processed and the iterate boolean for QueueThread.run()
-        """
-        # Get the webpage and add to the NewsSite object
-        page = wh.get_webpage_html_str(newssite.wiki_url)
-        newssite.set_page(page)
-        newssite.acquire_wiki_date()
-
-        # Find the country in the wikipedia page of the NewsSite
-        find = re.findall(r'(\b[Cc]ountry\b</th><td>(<.*?>)?([^<]*))', page)
-        if find:
-            country = find[0][-1]
-            if country in cntry_dict:
-                newssite.set_country(country)
-
-        # Filter out news sites without a country
-        if newssite.check_flag('country'):
-            return newssite, False
-        else:
-            del newssite
-            return None, False
-
-    # Create the input queue and process it with multithreading
-    input_queue = construct_input_queue()
-    return QueueThread.thread_runner(input_queue, task, (country_dict,), result_queue=q_newssites, num_threads=48)
-
-
-def get_tempreaders(q_newssites: queue.Queue, country_dict: dict) -> tp.Tuple[queue.Queue, dict]:
+def readers_task(newssite: NewsSite, cntry_dict: dict, rdrs_dict: dict) -> tp.Tuple[tp.Optional[NewsSite], bool]:
     """
-    Finds the raw number of readers from wikipedia
-    @param q_newssites: a queue with NewsSite objects to be processed
-    @param country_dict: the working country information dictionary
-    @return: processed version of q_newssites, dictionary with total readers of newspapers per country
+    The task function for the threads of get_readers() to work on
+    @param newssite: a NewsSite object of which the country is unknown
+    @param cntry_dict: the working country information dictionary
+    @param rdrs_dict: dictionary with total readers of newspapers per country
+    @return: newssite, but now processed and the iterate boolean for QueueThread.run()
     """
-    def task(site: NewsSite, cntry_dict: dict) -> tp.Union[tp.Tuple[tp.Tuple[NewsSite], str, int, bool],
-                                                           tp.Tuple[None, bool]]:
-        """
-        The task function for the threads to work on
-        @param site: a NewsSite object of which the country is unknown
-        @param cntry_dict: the working country information dictionary
-        @return: newssite, but now processed and a tuple with info for readers_dict
-                    and the iterate boolean for QueueThread.run()
-        """
-        # HELPER FUNCTIONS
-        def finder_newspaper() -> int:
-            """
-            Find the raw wikipedia number for newspaper type NewsSite objects
-            @return: an int with the raw wikipedia number
-            """
-            if site.page is not None:
-                page = site.page    # If the NewsSite already has a webpage, use that
-            elif site.wiki_url is None:
-                page = ''           # If the NewsSite has now wiki_url, make the page an empty string
-            else:
-                # Get the wikipedia page and put that in the newssite for future reference
-                try:
-                    page = wh.get_webpage_html_str(site.wiki_url)
-                    site.set_page(page)
-                except ConnectionRefusedError as e:
-                    print(f'\n{e}')
-                    return 0
-                except ConnectionError:
-                    return 0
-
-            # Use first regex to find a circulation table entry and extract it for return
-            find = re.findall(
-                r'\b[cC]irculation\b.*?\n?[^0-9]*[0-9,.]+[,.][0-9]{3}',
-                page)
-
-            if find:
-                res = re.search(r'[0-9,.]+[,.][0-9]{3}', find[0]).group()
-                if res:
-                    return int(res.replace('.', '').replace(',', ''))
-
-            # If that failed, use second regex to find text reference to circulation numbers and return
-            find = re.findall(
-                r'[0-9,.]+[,.][0-9]{3} \b[cC]opies\b',
-                page)
-
-            if find:
-                res = re.search(r'[0-9,.]+[,.][0-9]{3}', find[-1]).group()
-                if res:
-                    return int(res.replace('.', '').replace(',', ''))
-
-            # If that failed, use third regex to find text reference to circulation numbers and return
-            find = re.findall(r'\b[cC]irculation\b .{0,4} [0-9,.]+[,.][0-9]{3}', page)
-            if find:
-                res = re.search(r'[0-9,.]+[,.][0-9]{3}', find[-1]).group()
-                if res:
-                    return int(res.replace('.', '').replace(',', ''))
-
-            return int(0.005 * cntry_dict[site.country]['pop'])  # Assume value if all else fails
-
-        def finder_tvchannel() -> int:
-            """
-            Find the raw wikipedia number for tv channel type NewsSite objects
-            @return: an int with the raw wikipedia number
-            """
-            if site.page is not None:
-                page = site.page    # If the NewsSite already has a webpage, use that
-            elif site.wiki_url is None:
-                page = ''           # If the NewsSite has now wiki_url, make the page an empty string
-            else:
-                page = wh.get_webpage_html_str(site.wiki_url)  # Get the wikipedia page
-
-            # Use first regex to find a audience share table entry and extract it for return
-            find = re.findall(
-                r'(\b[Aa]udience [Ss]hare\b</th><td>([0-9,.]+[,.][0-9]{3}|[0-9]{1,2}.[0-9]*%|[0-9.]+ \bmillion\b|'
-                r'[0-9]+))',
-                page)
-
-            if find:
-                for res in find:
-                    if 'audience share' in res[0].lower():
-                        if '%' in res[1]:
-                            return int(float(res[1].replace('%', '')) * cntry_dict[site.country]['TV'])
-                        elif 'million' in res[1]:
-                            return int(float(res[1].replace(' million', '')) * 10 ** 6)
-                        else:
-                            try:
-                                return int(res[1].replace(',', ''))
-                            except ValueError:
-                                continue
-                    else:
-                        continue
-
-            # If that failed, use second regex to find text reference to viewership numbers and return
-            find = re.findall(
-                r'(([0-9,.]+ (\bmillion\b )?)(\b[Vv]iewers\b|\b[Hh]omes\b)|\b[Hh]ouseholds\b)',
-                page)
-
-            if find:
-                for res in find[::-1]:
-                    if 'million' in res[1]:
-                        return int(float(res[1].replace(' million', '')) * 10 ** 6)
-                    else:
-                        try:
-                            return int(res[1].replace(',', ''))
-                        except ValueError:
-                            continue
-
-            return int(0.01 * cntry_dict[site.country]['TV'])  # Assume value if all else fails
-
-        # MAIN TASK
-        if site.tpe == 'pp':                # If the NewsSite is a newspaper
-            number = finder_newspaper()         # Find the number
-        elif site.tpe == 'tv':              # If the NewsSite is a TV channel
-            number = finder_tvchannel()         # Find the number
-        else:                               # If the NewsSite is of unknown type
-            number = 0                          # Set the number to 0
-
-        # If the number is not 0 (failure number) add this number to the NewsSite
-        if number > 0:
-            site.set_tempreaders(number)
-
-        # Filter out stuff
-        if site.check_flag('tempreaders'):
-            return (site,), site.country, number, False
-        else:
-            del site
-            return None, False
-
-    result_queue = QueueThread.thread_runner(q_newssites, task, (country_dict,), num_threads=96)    # Run the task
-
-    q_newssites_new = queue.Queue()     # Initiate a queue for return
-    readers_dict = {}                   # Initiate a dictionary to store total readership per country
-
-    while not result_queue.empty():     # Run through the initial result queue
-        item = result_queue.get()           # Get an item
-        newssite, (country, num) = item     # Unpack the item
-        q_newssites_new.put(newssite)       # Put the NewsSite into the final result queue
-
-        # Count the total readership in each country
-        if country not in readers_dict:
-            readers_dict[country] = 0
-        readers_dict[country] += num
-
-    return q_newssites_new, readers_dict
+    country = newssite.country      # Get the country of the newssite
+    if newssite.tpe == 'pp':        # Calculate final number for newspaper
+        readers = int(
+            cntry_dict[country]['Internet'] * newssite.tempreaders / rdrs_dict[country])
+
+    elif newssite.tpe == 'tv':      # Calculate final number for tv channel
+        readers = int(
+            cntry_dict[country]['Internet'] * newssite.tempreaders / cntry_dict[country]['TV'])
+    else:
+        readers = None
+    newssite.set_readers(readers)   # Set the number in the NewsSite object
+
+    # Filter
+    if newssite.check_flag('readers'):
+        return newssite, False
+    else:
+        del newssite
+        return None, False
 
 
 def get_readers(q_newssites: queue.Queue, country_dict: dict, readers_dict: dict) -> queue.Queue:
@@ -457,31 +573,4 @@ def get_readers(q_newssites: queue.Queue, country_dict: dict, readers_dict: dict
     @param readers_dict: dictionary with total readers of newspapers per country
     @return: processed version of q_newssites
     """
-    def task(newssite: NewsSite, cntry_dict: dict, rdrs_dict: dict) -> tp.Tuple[tp.Optional[NewsSite], bool]:
-        """
-        The task function for the threads to work on
-        @param newssite: a NewsSite object of which the country is unknown
-        @param cntry_dict: the working country information dictionary
-        @param rdrs_dict: dictionary with total readers of newspapers per country
-        @return: newssite, but now processed and the iterate boolean for QueueThread.run()
-        """
-        country = newssite.country      # Get the country of the newssite
-        if newssite.tpe == 'pp':        # Calculate final number for newspaper
-            readers = int(
-                cntry_dict[country]['Internet'] * newssite.tempreaders / rdrs_dict[country])
-
-        elif newssite.tpe == 'tv':      # Calculate final number for tv channel
-            readers = int(
-                cntry_dict[country]['Internet'] * newssite.tempreaders / cntry_dict[country]['TV'])
-        else:
-            readers = None
-        newssite.set_readers(readers)   # Set the number in the NewsSite object
-
-        # Filter
-        if newssite.check_flag('readers'):
-            return newssite, False
-        else:
-            del newssite
-            return None, False
-
-    return QueueThread.thread_runner(q_newssites, task, (country_dict, readers_dict), num_threads=128)
+    return QueueThread.thread_runner(q_newssites, readers_task, (country_dict, readers_dict), num_threads=128)
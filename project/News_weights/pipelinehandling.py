@@ -0,0 +1,433 @@
+"""
+Streaming pipeline of the create() function: each NewsSite goes to the next stage as soon as it is processed
+"""
+
+from . import dumphandling as dh
+from . import multithreading as mt
+from . import namefinders as nf
+from . import queuehandling as qh
+from . import stagehandling as sh
+from .NewsSite import NewsSite
+import typing as tp
+import functools
+import threading
+import queue
+
+
+def as_list(opt: tp.Any) -> tp.List[NewsSite]:
+    """
+    Converts the main output of a task of the multithreading module into a list of NewsSites
+    @param opt: None, a NewsSite, a tuple with a NewsSite, or a list of NewsSites
+    @return: a list of NewsSite objects
+    """
+    if opt is None:
+        return []
+    elif isinstance(opt, NewsSite):
+        return [opt]
+    return list(opt)
+
+
+class Stage:
+    """
+    A stage of the pipeline: its items are processed by a WorkerPool as soon as they arrive,
+        and the resulting NewsSites are passed on to the next stages
+    """
+    def __init__(self, name: str, task: callable, num_threads: int, bypass=None, journal=None,
+                 stop_on_refused=False, worker_pool=None):
+        """
+        Initialiser for Stage
+        @param name: the name of the stage
+        @param task: function that processes an input item (unpacked) and returns a list of NewsSites
+        @param num_threads: maximum number of items processed at the same time
+        @param bypass: optional flag, NewsSites that have it go to the next stages without processing
+        @param journal: optional StageJournal to resume the stage
+        @param stop_on_refused: boolean to stop processing once an item is still refused (too many requests) after
+                                the retries of the pool, and pass the next items on as they are
+        @param worker_pool: optional WorkerPool, instead of the shared one
+        """
+        if not callable(task):
+            raise TypeError(f'param "task" should be a function object')
+
+        self.name = name
+        self.task = task
+        self.bypass = bypass
+        self.journal = journal
+        self.stop_on_refused = stop_on_refused
+        self.pool = mt.pool if worker_pool is None else worker_pool
+        self.jobs = self.pool.stage(name, limit=num_threads)
+
+        self.next_stages = []
+        self.upstream = 0               # Number of stages (or feeders) still putting items in
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.done = threading.Event()
+        self.refused = False
+
+        self.output = []                # All NewsSites that went through the stage, for the dumps
+        self.results = []               # The NewsSites that were processed by the task (now or in a journaled run)
+        self.stats = {'processed': 0, 'replayed': 0, 'bypassed': 0, 'failed': 0, 'unfinished': 0}
+
+    def connect(self, stage: 'Stage') -> 'Stage':
+        """
+        Pass the output of this stage on to another stage
+        @param stage: the next stage
+        @return: the next stage
+        """
+        self.next_stages.append(stage)
+        stage.add_upstream()
+        return stage
+
+    def add_upstream(self) -> None:
+        """
+        Count one more stage (or feeder) putting items in this stage
+        """
+        with self.lock:
+            self.upstream += 1
+
+    def close_upstream(self) -> None:
+        """
+        Tell the stage that one of the stages (or feeders) putting items in it is done
+        """
+        with self.lock:
+            self.upstream -= 1
+            if self.upstream == 0:
+                self.closed.set()
+
+    def feed(self, items: tp.Iterable[tuple]) -> None:
+        """
+        Put input items in the stage, as one of its upstream feeders (see add_upstream())
+        @param items: the input items
+        """
+        [self.put(ipt) for ipt in items]
+        self.close_upstream()
+
+    def start(self) -> None:
+        """
+        Start waiting for the end of the stage
+        """
+        threading.Thread(target=self.finish, name=f'{self.name}-finish', daemon=True).start()
+
+    def finish(self) -> None:
+        """
+        Wait for the upstream stages and the jobs of the stage to be done, then tell the next stages
+        """
+        self.closed.wait()
+        self.jobs.join()
+        [stage.close_upstream() for stage in self.next_stages]
+        self.done.set()
+
+    def count(self, stat: str) -> None:
+        with self.lock:
+            self.stats[stat] += 1
+
+    def emit(self, newssite: NewsSite, result=False) -> None:
+        """
+        Pass a NewsSite on to the next stages
+        @param newssite: the NewsSite
+        @param result: boolean to indicate that the NewsSite was processed by the task of this stage
+        """
+        with self.lock:
+            self.output.append(newssite)
+            if result:
+                self.results.append(newssite)
+        [stage.put((newssite,)) for stage in self.next_stages]
+
+    def put(self, ipt: tuple) -> None:
+        """
+        Put an input item in the stage: it is submitted to the pool, or passed on as it is
+        @param ipt: the input item
+        """
+        # NewsSites that do not need this stage, or that cannot be processed anymore, go on as they are
+        if self.bypass is not None and ipt[0].check_flag(self.bypass):
+            self.count('bypassed')
+            self.emit(ipt[0])
+            return
+        if self.refused:
+            self.count('unfinished')
+            self.emit(ipt[0])
+            return
+
+        # Items processed by a previous run are replayed from the journal
+        key = self.journal.next_key(ipt) if self.journal is not None else None
+        if self.journal is not None and key in self.journal.done:
+            self.count('replayed')
+            [self.emit(output[0], result=True) for output in self.journal.replay(key)]
+            return
+
+        self.pool.submit(self.jobs, self.run, ipt, callback=functools.partial(self.processed, ipt, key),
+                         errback=functools.partial(self.failed, ipt, key))
+
+    def run(self, *ipt) -> tp.Optional[tp.List[NewsSite]]:
+        """
+        Run the task on an input item, unless the stage stopped in the meantime
+        A NewsSite that got the bypass flag in the meantime (from a better duplicate, see Deduplicator) goes on as it is
+        @param ipt: the input item
+        @return: the NewsSites given by the task, None if the item was not processed
+        """
+        if self.refused:
+            return None
+        if self.bypass is not None and ipt[0].check_flag(self.bypass):
+            return [ipt[0]]
+        return self.task(*ipt)
+
+    def processed(self, ipt: tuple, key: tp.Optional[str], newssites: tp.Optional[tp.List[NewsSite]]) -> None:
+        """
+        Callback of the jobs of the stage: pass the NewsSites given by the task on
+        """
+        if newssites is None:
+            self.count('unfinished')
+            self.emit(ipt[0])
+            return
+
+        self.count('processed')
+        if self.journal is not None:
+            self.journal.record_done(key, [(newssite,) for newssite in newssites])
+        [self.emit(newssite, result=True) for newssite in newssites]
+
+    def failed(self, ipt: tuple, key: tp.Optional[str], error: Exception) -> None:
+        """
+        Errback of the jobs of the stage: journal the item as failed, and drop it (or pass it on as it is)
+        """
+        print(f'\n{threading.current_thread().name}: While processing {ipt} in {self.name}, '
+              f'a {type(error).__name__} exception was raised: {error}')
+        if self.journal is not None:
+            self.journal.record_failed(key, error)
+        if self.stop_on_refused and isinstance(error, ConnectionRefusedError):
+            self.refused = True
+            self.count('unfinished')
+            self.emit(ipt[0])
+        else:
+            self.count('failed')
+
+
+class Deduplicator:
+    """
+    Incremental version of queuehandling.filter_newssites(): only the first NewsSite with a name goes on
+    When a later one has a higher NewsSite.dedup_key(), its variables are copied into the one that went on,
+        so each name is only processed once by the next stages (which skip the variables that are now set)
+    """
+    def __init__(self):
+        self.best = dict()      # Name -> (key of the best NewsSite so far, the NewsSite that went on)
+
+    def __call__(self, newssite: NewsSite) -> tp.List[NewsSite]:
+        key = newssite.dedup_key()
+        other = self.best.get(newssite.name)
+        if other is None:
+            self.best[newssite.name] = (key, newssite)
+            return [newssite]
+        if key > other[0]:
+            first = other[1]
+            if newssite.wiki_url != first.wiki_url:
+                first.info = newssite.info      # The information extracted from the page of the other wiki_url
+            for field, value in newssite.to_record().items():
+                setattr(first, field, value)
+            self.best[newssite.name] = (key, first)
+        return []
+
+
+class NameMerger:
+    """
+    Joins the Google and Bing branches of the pipeline: a NewsSite goes on once both name searches are done,
+        with the names found by both (a NewsSite replayed from a journal is another object with the same name)
+    The Deduplicator lets one NewsSite per name through, so the name is the key (the tpe and country can still change)
+    """
+    def __init__(self):
+        self.waiting = dict()   # Name -> NewsSites that came through one branch, waiting for the other one
+
+    def __call__(self, newssite: NewsSite) -> tp.List[NewsSite]:
+        key = newssite.name
+        waiting = self.waiting.setdefault(key, [])
+        if not waiting:
+            waiting.append(newssite)
+            return []
+
+        first = waiting.pop(0)
+        if not waiting:
+            del self.waiting[key]
+        for engine in nf.engines.values():
+            flag, set_name = engine[1], engine[2]
+            if not first.check_flag(flag) and newssite.check_flag(flag):
+                set_name(first, getattr(newssite, flag))
+        return [first]
+
+    def flush(self) -> tp.List[NewsSite]:
+        """
+        Gives the NewsSites still waiting once the branches are done (the other branch dropped them after a failure),
+            the names they did not get are set to ''
+        @return: list with the NewsSites that were waiting
+        """
+        newssites = [newssite for waiting in self.waiting.values() for newssite in waiting]
+        self.waiting.clear()
+        for newssite in newssites:
+            for engine in nf.engines.values():
+                flag, set_name = engine[1], engine[2]
+                if not newssite.check_flag(flag):
+                    set_name(newssite, '')
+        return newssites
+
+
+class Snapshotter(threading.Thread):
+    """
+    Subclass of threading.Thread to periodically dump the NewsSites that went through each stage,
+        without stopping the pipeline
+    """
+    def __init__(self, stages: tp.Dict[int, Stage], interval: float, mainpy=True):
+        """
+        Initialiser for Snapshotter
+        @param stages: the stages to dump, per dump number
+        @param interval: number of seconds between the dumps
+        @param mainpy: boolean to indicate if this file is run from main.py
+        """
+        super().__init__(name='Snapshotter', daemon=True)
+        self.stages = stages
+        self.interval = interval
+        self.mainpy = mainpy
+        self.stopped = threading.Event()
+
+    def dump(self) -> None:
+        """
+        Write the NewsSites that went through each stage so far
+        """
+        for json_idx, stage in self.stages.items():
+            with stage.lock:
+                newssites = list(stage.output)
+            dh.write_dump(newssites, json_idx, mainpy=self.mainpy)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def stop(self) -> None:
+        """
+        Stop the periodic dumps, and write the final ones
+        """
+        self.stopped.set()
+        self.join()
+        self.dump()
+
+
+class Pipeline:
+    """
+    The stages of the create() function, connected to each other:
+        newspapers, tv channels -> dedup -> tempreaders -> Google names, Bing names (at the same time) -> merge
+    The readers numbers need the totals of all newspapers of a country, they are computed after the pipeline.
+    """
+    def __init__(self, country_dict: dict, journals=None, dump_interval=60., mainpy=True, worker_pool=None):
+        """
+        Initialiser for Pipeline
+        @param country_dict: the working country information dictionary
+        @param journals: optional dictionary with the StageJournal of each stage
+        @param dump_interval: number of seconds between the dumps of the stages
+        @param mainpy: boolean to indicate if this file is run from main.py
+        @param worker_pool: optional WorkerPool for all the stages, instead of the shared one
+        """
+        journals = dict() if journals is None else journals
+        self.country_dict = country_dict
+
+        self.newspapers = Stage('newspapers', lambda country, url: as_list(mt.newspapers_task(country, url)[0]),
+                                24, journal=journals.get('newspapers'), worker_pool=worker_pool)
+        self.tvchannels = Stage('tvchannels', lambda site: as_list(mt.tvchannels_task(site, country_dict)[0]),
+                                48, journal=journals.get('tvchannels'), worker_pool=worker_pool)
+        self.dedup = Stage('dedup', Deduplicator(), 1, worker_pool=worker_pool)
+        self.tempreaders = Stage('tempreaders', lambda site: as_list(mt.tempreaders_task(site, country_dict)[0]),
+                                 96, bypass='tempreaders', journal=journals.get('tempreaders'), worker_pool=worker_pool)
+        self.gglnames = Stage('ggl_names', lambda site: nf.find_name(site, 'ggl') or [site], nf.limits['ggl'],
+                              bypass='ggl_name', journal=journals.get('ggl_names'), stop_on_refused=True,
+                              worker_pool=worker_pool)
+        self.bngnames = Stage('bng_names', lambda site: nf.find_name(site, 'bng') or [site], nf.limits['bng'],
+                              bypass='bng_name', journal=journals.get('bng_names'), stop_on_refused=True,
+                              worker_pool=worker_pool)
+        self.merger = NameMerger()
+        self.names = Stage('names', self.merger, 1, worker_pool=worker_pool)
+
+        self.newspapers.connect(self.dedup)
+        self.tvchannels.connect(self.dedup)
+        self.dedup.connect(self.tempreaders)
+        self.tempreaders.connect(self.gglnames).connect(self.names)
+        self.tempreaders.connect(self.bngnames).connect(self.names)
+
+        self.stages = [self.newspapers, self.tvchannels, self.dedup, self.tempreaders, self.gglnames, self.bngnames,
+                       self.names]
+        self.snapshotter = Snapshotter({1: self.dedup, 2: self.tempreaders, 3: self.gglnames, 4: self.bngnames},
+                                       dump_interval, mainpy=mainpy)
+
+    def run(self, previous: tp.Union[queue.Queue, tp.Iterable[NewsSite]]) -> queue.Queue:
+        """
+        Run the pipeline, starting from already existing NewsSites (previous data)
+        @param previous: a queue with NewsSite objects, or an iterable of NewsSites like a dumphandling.DumpReader,
+            which is read one NewsSite at a time as the duplicates filter takes them
+        @return: a queue with the deduplicated NewsSites at the end of the pipeline
+        """
+        if isinstance(previous, queue.Queue):
+            make_previous = lambda: [previous.get() for _ in range(previous.qsize())]
+        else:
+            make_previous = lambda: ((newssite,) for newssite in previous)
+
+        # The feeders: previous data, and the inputs of the first stages (which need a few requests to be made)
+        feeders = [(self.dedup, make_previous),
+                   (self.newspapers, lambda: mt.newspapers_input(self.country_dict).queue),
+                   (self.tvchannels, lambda: mt.tvchannels_input().queue)]
+        [stage.add_upstream() for stage, make_items in feeders]
+
+        [stage.start() for stage in self.stages]   # The stages wait for their upstream stages and jobs
+        self.snapshotter.start()
+        threads = [threading.Thread(target=self.run_feeder, args=(stage, make_items), daemon=True)
+                   for stage, make_items in feeders]
+        [thread.start() for thread in threads]
+
+        self.names.done.wait()
+        [self.names.emit(newssite) for newssite in self.merger.flush()]
+        self.snapshotter.stop()
+
+        q_result = queue.Queue()
+        [q_result.put((newssite,)) for newssite in self.names.output]
+        return qh.filter_newssites(q_result)
+
+    @staticmethod
+    def run_feeder(stage: Stage, make_items: callable) -> None:
+        """
+        Target of the feeder threads: make the input items of a stage and put them in
+        @param stage: the stage to feed
+        @param make_items: function returning the input items
+        """
+        try:
+            items = make_items()
+        except Exception as e:
+            print(f'\nWhile making the input of {stage.name}, an exception was raised: {e}')
+            items = []
+        stage.feed(items)
+
+    def get_readers_dict(self, q_newssites: queue.Queue) -> dict:
+        """
+        Gives the total readers of newspapers per country, from the newspapers processed by the tempreaders stage
+        @param q_newssites: a queue with the NewsSite objects at the end of the pipeline (it is not changed)
+        @return: dictionary with total readers of newspapers per country
+        """
+        # The NewsSites are matched by key, a resumed run replays other objects than those of the tempreaders stage
+        processed = {sh.item_key((newssite,)) for newssite in self.tempreaders.results}
+        newspapers = {}
+        for (newssite,) in list(q_newssites.queue):
+            key = sh.item_key((newssite,))
+            if newssite.tpe == 'pp' and newssite.tempreaders is not None and key in processed:
+                newspapers.setdefault(key, newssite)
+        readers_dict = {}
+        for newssite in newspapers.values():
+            readers_dict[newssite.country] = readers_dict.get(newssite.country, 0) + newssite.tempreaders
+        return readers_dict
+
+    def unfinished(self) -> int:
+        """
+        Gives the number of items the stages could not process
+        @return: the number of failed or unfinished items
+        """
+        return sum(stage.stats['failed'] + stage.stats['unfinished'] for stage in self.stages)
+
+    def report(self) -> str:
+        """
+        Gives the counters of each stage
+        @return: a string with the counters
+        """
+        return '; '.join(f'{stage.name}: {len(stage.output)} out ' +
+                         ''.join(f', {num} {stat}' for stat, num in stage.stats.items() if num) +
+                         f', {stage.jobs.throughput():.1f}/s, {1000 * stage.jobs.mean_latency():.0f} ms per call'
+                         for stage in self.stages)
@@ -9,21 +9,21 @@ import typing as tp
 def filter_newssites(q_newssites: queue.Queue, get_relevant=False) -> tp.Union[queue.Queue,
                                                                                tp.Tuple[queue.Queue, dict]]:
     """
-    Filter out NewsSite object from q_newssites that are duplicates
+    Filter out NewsSite object from q_newssites that are duplicates, keeping the one with the highest
+        NewsSite.dedup_key() (the first one if equal)
     @param q_newssites: a queue of NewsSite objects
     @param get_relevant: option to just return the relevant dictionary
     @return: the filtered queue
     """
-    relevant = dict()
+    best = dict()   # Name -> (key, NewsSite), the key of each NewsSite is only computed once
     while not q_newssites.empty():
         (newssite,) = q_newssites.get()
-        if newssite.name not in relevant:
-            relevant[newssite.name] = newssite
-        else:
-            other = relevant[newssite.name]
-            if newssite >= other:
-                relevant[newssite.name] = newssite
+        key = newssite.dedup_key()
+        other = best.get(newssite.name)
+        if other is None or key > other[0]:
+            best[newssite.name] = (key, newssite)
 
+    relevant = {name: newssite for name, (key, newssite) in best.items()}
     q_newssites_new = queue.Queue()
     for name, newssite in relevant.items():
         q_newssites_new.put((newssite,))
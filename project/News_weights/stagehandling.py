@@ -0,0 +1,209 @@
+"""
+Journaling of the stages of the create() function, to resume them after a crash
+"""
+
+from .NewsSite import NewsSite
+import typing as tp
+import threading
+import json
+import os
+
+
+def get_journal_folder(mainpy=True) -> str:
+    """
+    Gives the folder of the stage journals
+    @param mainpy: boolean to indicate if this file is run from main.py
+    @return: the path of the folder
+    """
+    return 'project/News_weights/data/journal' if mainpy else 'News_weights/data/journal'
+
+
+def encode(obj: tp.Any) -> tp.Any:
+    """
+    Converts an input or output of a stage task to something json can write
+    @param obj: a NewsSite, a tuple or list of those, or a str/int/float/bool/None
+    @return: the json compatible version of obj
+    """
+    if isinstance(obj, NewsSite):
+        json_dict = obj.__dict__()
+        json_dict['page'] = None        # The webpages are not journaled
+        return {'NewsSite': json_dict}
+    elif isinstance(obj, (tuple, list)):
+        return [encode(item) for item in obj]
+    elif obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    else:
+        raise TypeError(f'Cannot journal an object of type {type(obj)}')
+
+
+def decode(obj: tp.Any) -> tp.Any:
+    """
+    Converts back the output of encode(), lists become tuples
+    @param obj: a json loaded object
+    @return: the decoded object
+    """
+    if isinstance(obj, dict):
+        return NewsSite.get_self(obj['NewsSite'])
+    elif isinstance(obj, list):
+        return tuple(decode(item) for item in obj)
+    else:
+        return obj
+
+
+def item_key(ipt: tuple) -> str:
+    """
+    Gives a key that identifies an input item of a stage across runs
+    @param ipt: an input item of a stage task
+    @return: a string key
+    """
+    parts = []
+    for part in ipt:
+        if isinstance(part, NewsSite):
+            parts.append(f'{part.tpe}:{part.country}:{part.name}')
+        else:
+            parts.append(str(part))
+    return '|'.join(parts)
+
+
+class StageJournal:
+    """
+    Append-only journal (one json line per item) of the items processed by a stage, and of their outputs
+    """
+    def __init__(self, stage: str, mainpy=True, folder=None):
+        """
+        Initialiser for StageJournal, reads what an unfinished previous run journaled
+        @param stage: name of the stage
+        @param mainpy: boolean to indicate if this file is run from main.py
+        @param folder: optional folder of the journal, instead of the default one
+        """
+        if type(stage) != str:
+            raise TypeError(f'param "stage" should be of type {str}')
+
+        self.stage = stage
+        self.folder = get_journal_folder(mainpy) if folder is None else folder
+        self.path = os.path.join(self.folder, f'{stage}.ndjson')
+        self.lock = threading.Lock()
+        self.file = None
+        self.done = dict()      # Key -> encoded outputs of the items that were processed
+        self.failed = dict()    # Key -> error of the items that failed (and were not processed since)
+        self.replayed = 0       # Number of items replayed in this run
+        self.seen = dict()      # Key -> number of equal items that got a key in this run, see next_key()
+        self.load()
+
+    def load(self) -> None:
+        """
+        Read the journal file, if there is one
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue    # Last line cut by a crash
+                if record['status'] == 'done':
+                    self.done[record['key']] = record['outputs']
+                    self.failed.pop(record['key'], None)
+                elif record['key'] not in self.done:
+                    self.failed[record['key']] = record['error']
+
+    def write(self, record: dict) -> None:
+        """
+        Append a record to the journal file, and flush it so it survives a crash
+        @param record: dictionary to be written as a json line
+        """
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            if self.file is None:
+                os.makedirs(self.folder, exist_ok=True)
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(line)
+            self.file.flush()
+
+    def record_done(self, key: str, outputs: list) -> None:
+        """
+        Journal an item as processed, with its outputs
+        @param key: the key of the item
+        @param outputs: the items the task put in the result queue
+        """
+        encoded = encode(outputs)
+        self.write({'key': key, 'status': 'done', 'outputs': encoded})
+        with self.lock:
+            self.done[key] = encoded
+            self.failed.pop(key, None)
+
+    def record_failed(self, key: str, error: Exception) -> None:
+        """
+        Journal an item as failed, it is processed again by the next run
+        @param key: the key of the item
+        @param error: the exception raised while processing the item
+        """
+        self.write({'key': key, 'status': 'failed', 'error': repr(error)})
+        with self.lock:
+            self.failed[key] = repr(error)
+
+    def keys(self, items: tp.List[tuple]) -> tp.List[str]:
+        """
+        Gives the keys of input items, equal items get numbered keys
+        @param items: the input items of the stage
+        @return: a list with the key of each item
+        """
+        seen = dict()
+        keys = []
+        for ipt in items:
+            key = item_key(ipt)
+            seen[key] = seen.get(key, 0) + 1
+            keys.append(key if seen[key] == 1 else f'{key}#{seen[key]}')
+        return keys
+
+    def next_key(self, ipt: tuple) -> str:
+        """
+        Gives the key of an input item arriving in a streaming stage, like keys() for items one by one
+        @param ipt: an input item of the stage
+        @return: the key of the item
+        """
+        key = item_key(ipt)
+        with self.lock:
+            self.seen[key] = self.seen.get(key, 0) + 1
+            num = self.seen[key]
+        return key if num == 1 else f'{key}#{num}'
+
+    def replay(self, key: str) -> tp.List[tuple]:
+        """
+        Gives the outputs of an item that was already processed
+        @param key: the key of the item
+        @return: the items the task put in the result queue
+        """
+        self.replayed += 1
+        return list(decode(self.done[key]))
+
+    def close(self) -> None:
+        """
+        Close the journal file
+        """
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def clear(self) -> None:
+        """
+        Remove the journal, so the next run starts from fresh
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.done, self.failed = dict(), dict()
+
+
+def clear_journals(mainpy=True) -> None:
+    """
+    Remove all stage journals
+    @param mainpy: boolean to indicate if this file is run from main.py
+    """
+    folder = get_journal_folder(mainpy)
+    if os.path.isdir(folder):
+        for f_name in os.listdir(folder):
+            if f_name.endswith('.ndjson'):
+                os.remove(os.path.join(folder, f_name))
@@ -2,8 +2,55 @@
 Workflow functions to handle web requests for the News_weights package
 """
 
-import requests as rq
 from bs4 import BeautifulSoup as Bs
+from project import http_handler as hh
+import typing as tp
+
+
+# MediaWiki API, used to check the existence of many wikipedia pages at once
+wiki_api_url = 'https://en.wikipedia.org/w/api.php'
+wiki_api_batch = 50     # Maximum number of titles per request of the API
+
+
+def wiki_url_from_title(art_title: str) -> str:
+    """
+    Creates a wikipedia url from a wikipedia page name, without checking it
+    @param art_title: wikipedia page name
+    @return: wikipedia url referring to the given article
+    """
+    return 'https://en.wikipedia.org/wiki/' + art_title.replace(' ', '_')
+
+
+def resolve_wiki_titles(art_titles: tp.Iterable[str]) -> tp.Dict[str, tp.Optional[str]]:
+    """
+    Checks which wikipedia pages exist, in bulk with the MediaWiki API (one request per 50 page names)
+    @param art_titles: wikipedia page names
+    @return: dictionary with the wikipedia url of each page name, None if the page does not exist
+    """
+    titles = list(dict.fromkeys(art_titles))    # Unique page names, in order
+
+    # Type handling
+    if any(type(art_title) != str for art_title in titles):
+        raise TypeError(f'items in "art_titles" should be of type {str}')
+
+    result = {}
+    for i in range(0, len(titles), wiki_api_batch):
+        batch = titles[i:i + wiki_api_batch]
+        params = {'action': 'query', 'format': 'json', 'titles': '|'.join(batch)}
+        page = hh.get(wiki_api_url, params=params, timeout=(61, 121), cache=hh.crawl_cache)
+        if page.status_code == 429:
+            raise ConnectionRefusedError(f'{wiki_api_url} could not be reached. Request returned HTTP code: 429')
+        elif page.status_code != 200:
+            raise ConnectionError(f'{wiki_api_url} could not be reached. Request returned HTTP code: {page.status_code}')
+
+        # The API answers with the normalised page names (e.g. first letter capitalised), and marks the missing pages
+        query = page.json().get('query', {})
+        normalized = {n['from']: n['to'] for n in query.get('normalized', [])}
+        existing = {p['title'] for p in query.get('pages', {}).values() if 'missing' not in p and 'invalid' not in p}
+        for art_title in batch:
+            result[art_title] = wiki_url_from_title(art_title) if normalized.get(art_title, art_title) in existing else None
+
+    return result
 
 
 def create_wiki_link(art_title: str) -> str:
@@ -16,36 +63,75 @@ def create_wiki_link(art_title: str) -> str:
     if type(art_title) != str:
         raise TypeError(f'param "art_title" should be of type {str}')
 
-    # Create the link
-    wiki_link = 'https://en.wikipedia.org/wiki/' + art_title.replace(' ', '_')
+    # Check if it makes sense, without downloading the page
+    wiki_link = resolve_wiki_titles([art_title])[art_title]
+    if wiki_link is None:
+        raise ValueError(f'param "art_title" does not refer to a valid wikipedia page')
+    return wiki_link
+
+
+def get_wiki_page(art_title: str, pretty=False) -> tp.Tuple[str, str]:
+    """
+    Gets a wikipedia page and its url from a wikipedia page name, with a single request
+    @param art_title: wikipedia page name
+    @param pretty: indicates whether to return prettified version or not
+    @return: wikipedia url referring to the given article, and the html code of that page
+    """
+    # Type handling
+    if type(art_title) != str:
+        raise TypeError(f'param "art_title" should be of type {str}')
 
-    # Check if it makes sense
-    page = rq.get(wiki_link, timeout=(61, 121))
+    # Request the page, the HTTP code tells if it exists
+    wiki_link = wiki_url_from_title(art_title)
+    page = hh.get(wiki_link, timeout=(61, 121), cache=hh.crawl_cache)
     if page.status_code == 200:
-        return wiki_link
+        return wiki_link, page_to_str(page.content, pretty=pretty)
     elif page.status_code == 429:
         raise ConnectionRefusedError(f'{wiki_link} could not be reached. Request returned HTTP code: 429')
     else:
         raise ValueError(f'param "art_title" does not refer to a valid wikipedia page')
 
 
-def get_webpage_html_str(url: str, pretty=False) -> str:
+def page_to_str(content: bytes, pretty=False) -> str:
     """
-    Gets a string of the html code of the webpage from the url
+    Decodes the html code of a webpage, only parsed with BeautifulSoup for the prettified version
+    @param content: the bytes of the webpage
     @param pretty: indicates whether to return prettified version or not
-    @param url: a url of a webpage
     @return: the html code of that webpage
     """
+    return content.decode('utf-8', 'replace') if not pretty else Bs(content, 'html.parser').prettify()
+
+
+def get_webpage_bytes(url: str) -> bytes:
+    """
+    Gets the raw bytes of the webpage from the url, for the extraction module
+    @param url: a url of a webpage
+    @return: the bytes of that webpage
+    """
     # Type handling
     if type(url) != str:
         raise TypeError(f'param "url" should be of type {str}')
 
-    # Request the page, handle the HTTP codes and return the correct string form of the page
-    page = rq.get(url, timeout=(61, 121))
+    # Request the page (through the shared rate limiter, and the response cache of the crawl if there is one),
+    # handle the HTTP codes and return the bytes of the page
+    page = hh.get(url, timeout=(61, 121), cache=hh.crawl_cache)
     if page.status_code == 200:
-        soup = Bs(page.content, 'html.parser')
-        return str(soup) if not pretty else soup.prettify()
+        return page.content
     elif page.status_code == 429:
         raise ConnectionRefusedError(f'{url} could not be reached. Request returned HTTP code: 429')
     else:
         raise ConnectionError(f'{url} could not be reached. Request returned HTTP code: {page.status_code}')
+
+
+def get_webpage_html_str(url: str, pretty=False) -> str:
+    """
+    Gets a string of the html code of the webpage from the url
+    @param pretty: indicates whether to return prettified version or not
+    @param url: a url of a webpage
+    @return: the html code of that webpage
+    """
+    # Type handling
+    if type(url) != str:
+        raise TypeError(f'param "url" should be of type {str}')
+
+    return page_to_str(get_webpage_bytes(url), pretty=pretty)
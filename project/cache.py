@@ -1,15 +1,111 @@
 import hashlib
 from datetime import datetime
-import json
-import glob
+import bisect
 from project import tw_elements as TE
-import re
+from project import cache_backends as CB
+import os
 import numpy as np
-import sys
 
 
+class manifest:
+	"""
+	Index of the cached snapshots of a username, saved next to them.
+	There is one entry per snapshot: (timestamp, type, number of tweets, byte offset in the file, file name)
+	"""
+	def __init__(self, username, folder="project/cache"):
+		self.username = username
+		self.folder = folder
+		self.path = os.path.join(folder, f"{username}.manifest")
+		# Entries and their timestamps, per type (feed/latest), sorted by timestamp
+		self.entries = {"feed": [], "latest": []}
+		self.timestamps = {"feed": [], "latest": []}
+		self.mtime = None
+
+	def load(self):
+		"""
+		Load the manifest from the disk, (re)building it first if it is missing or older than the cache folder
+		"""
+		if not os.path.exists(self.path) or os.stat(self.folder).st_mtime_ns > os.stat(self.path).st_mtime_ns:
+			self.sync()
+		mtime = os.stat(self.path).st_mtime_ns
+		# Only read the file again if it changed
+		if mtime == self.mtime:
+			return
+		self.set_entries(self.read_file())
+		self.mtime = mtime
+
+	def read_file(self):
+		"""
+		Return the list of entries saved in the manifest file
+		"""
+		entries = []
+		with open(self.path, "r", encoding="utf-8") as f:
+			# Skip the header line
+			next(f, None)
+			for line in f:
+				timestamp, r_type, count, offset, f_name = line.rstrip("\n").split("\t")
+				entries.append((float(timestamp), r_type, int(count), int(offset), f_name))
+		return entries
+
+	def set_entries(self, entries):
+		"""
+		Sort the entries by type and timestamp
+		"""
+		self.entries = {"feed": [], "latest": []}
+		for entry in sorted(entries):
+			self.entries[entry[1]].append(entry)
+		self.timestamps = {r_type: [e[0] for e in es] for r_type, es in self.entries.items()}
+
+	def sync(self):
+		"""
+		Rebuild the manifest from the files in the cache folder, for every backend.
+		Only the snapshot files that are not in the manifest yet are decoded (to count their tweets).
+		"""
+		known = dict()
+		if os.path.exists(self.path):
+			known = {e[4]: e for e in self.read_file()}
+		entries = []
+		for backend in CB.backends.values():
+			entries += backend.list_snapshots(self.folder, self.username, known)
+		self.write(entries)
+
+	def write(self, entries):
+		"""
+		Write the whole manifest file
+		"""
+		with open(self.path, "w", encoding="utf-8") as f:
+			f.write("timestamp\ttype\tcount\toffset\tfile\n")
+			for entry in sorted(entries):
+				f.write("\t".join(str(e) for e in entry) + "\n")
+		self.set_entries(entries)
+		self.mtime = os.stat(self.path).st_mtime_ns
+
+	def add(self, entry):
+		"""
+		Append the entry of a new snapshot to the manifest
+		"""
+		with open(self.path, "a", encoding="utf-8") as f:
+			f.write("\t".join(str(e) for e in entry) + "\n")
+
+	def last_before(self, r_type, date):
+		"""
+		Return the entry of the last snapshot of a type before a date (None if there is none)
+		"""
+		self.load()
+		i = bisect.bisect_left(self.timestamps[r_type], date.timestamp())
+		if i == 0:
+			return None
+		return self.entries[r_type][i-1]
+
+	def get_entries(self, r_type):
+		"""
+		Return all entries of a type, sorted by timestamp
+		"""
+		self.load()
+		return self.entries[r_type]
+
 class cache:
-	def __init__(self, status=0, username="", before_date=datetime.now()):
+	def __init__(self, status=0, username="", before_date=datetime.now(), backend="store", folder="project/cache"):
 		# Status can be:
 		# 0: Not active
 		# 1: Write only
@@ -18,6 +114,11 @@ class cache:
 		self.read = (status == 2)
 		self.before_date = before_date
 		self.username = username
+		# Storage backend used to write new results ("columnar", "store" or "json"), all of them can always be read
+		self.backend = CB.backends[backend]
+		self.folder = folder
+		# Index of the snapshots of the username in the cache folder
+		self.manifest = manifest(username, folder)
 
 	def save_results(self, result):
 		"""
@@ -30,29 +131,59 @@ class cache:
 		else:
 			r_type = "latest"
 			tweets = result.tweets
-		# Create path and filename of where to save the file
-		# File name containts the username, the type of result, and the current date (timestamp)
-		filename = f"project/cache/{self.username}-{r_type}-{datetime.now().timestamp()}.json"
-		f = open(filename, "w+", encoding="utf8")
-		# Start the json list
-		r = "["
-		# Go trough all tweets of the feed/actions
-		for tw in tweets:
-			# Save each tweet object (class) as a json dump
-			r += json.dumps(tw.__dict__, indent=4, sort_keys=True, default=str) + ",\n"
-		# Remove the last "," from the list, and close it
-		r = r[:-2] + "]"
-		# Write the list of json tweets in the file
-		f.writelines(r)
+		# Make sure the manifest is up-to-date before adding a new file to the folder
+		self.manifest.load()
+		# Save the tweets with the backend, along with the type of result and the current date (timestamp)
+		entry = self.backend.save(self.folder, self.username, r_type, tweets, datetime.now().timestamp())
+		# Add the new snapshot to the index of the snapshots
+		self.manifest.add(entry)
+
+	def load_snapshot(self, entry):
+		"""
+		Return the json tweets (dicts) of a snapshot from its manifest entry
+		"""
+		return CB.backend_from_filename(entry[4]).load(self.folder, entry)
+
+	def convert(self, backend="columnar", remove=True):
+		"""
+		Convert all the cached snapshots of the username to the format of another backend
+		"""
+		new_backend = CB.backends[backend]
+		converted = dict()
+		# Go trough the snapshots in chronological order, so that incremental backends save the right differences
+		entries = self.manifest.get_entries("feed") + self.manifest.get_entries("latest")
+		for entry in sorted(entries):
+			old_backend = CB.backend_from_filename(entry[4])
+			if old_backend is new_backend:
+				continue
+			# Keep the same timestamp for the snapshot
+			new_backend.save_rows(self.folder, self.username, entry[1], self.load_snapshot(entry), entry[0])
+			converted.setdefault(old_backend, []).append(entry)
+		if remove:
+			for old_backend, old_entries in converted.items():
+				old_backend.remove(self.folder, self.username, old_entries)
+		# The snapshots changed, so the manifest has to be rebuilt
+		if os.path.exists(self.manifest.path):
+			os.remove(self.manifest.path)
+		self.manifest.sync()
+
+	def metric_history(self, tweet_id):
+		"""
+		Return the list of (date, like, rt, rep) of a tweet from the incremental store (one item per change)
+		"""
+		return CB.backends["store"].metric_history(self.folder, self.username, tweet_id)
 
 	def json_to_tweet(self, json_tweet, order_by_influence):
 		"""
 		Convert JSON tweet (from disk) back to tweet object (from tw_elements module)
 		"""
-		json_tweet["date"] = json_tweet["date"][:-3]+json_tweet["date"][-2:] #Date preformatting so datetime.striptime doesn't get upset
-		
+		date = json_tweet["date"]
+		# Dates from JSON files are strings, the columnar backend already returns datetimes
+		if isinstance(date, str):
+			date = date[:-3]+date[-2:] #Date preformatting so datetime.striptime doesn't get upset
+			date = datetime.strptime(date, "%Y-%m-%d %H:%M:%S%z")
 		return TE.tweet(json_tweet["id"], json_tweet["like"], json_tweet["rt"], json_tweet["rep"], \
-			json_tweet["username"], datetime.strptime(json_tweet["date"], "%Y-%m-%d %H:%M:%S%z"), \
+			json_tweet["username"], date, \
 			json_tweet["text"], json_tweet["from_verified"], json_tweet["is_reply"], json_tweet["is_retweet"], \
 			order_by_influence, json_tweet["liked_by"], json_tweet["influence_score"])
 
@@ -60,15 +191,13 @@ class cache:
 		"""
 		Return latest feed or actions from the cache
 		"""
-		# Get all json content corresponding to the specified pathname/filename pattern
-		files = self.get_json_files(f"project/cache/{self.username}-{r_type}*")
-		# Return False (and an empty string) if no files could be found
-		if len(files) == 0:
+		# Get the last snapshot before the date from the manifest
+		entry = self.manifest.last_before(r_type, self.before_date)
+		# Return False (and an empty string) if no snapshot could be found
+		if entry is None:
 			return False, ""
-		# Get the latest date from the keys of the json content dict 
-		first_bf_date = self.first_before_date(r_type)
-		# Get the json of the latest file in the dict
-		last_file = files[first_bf_date]
+		# Decode that snapshot only
+		last_file = self.load_snapshot(entry)
 		tweets = []
 		# Go trough every tweet in the json content of the file
 		for t in last_file:
@@ -86,62 +215,56 @@ class cache:
 			# If the results are actions, return true, and an actions object containing all of the tweets
 			return True, TE.actions(self.username, tweets=tweets)
 
-	def get_json_files(self, f_name):
-		"""
-		Get all json content from files in a folder in a dict (keys are dates)
-		"""
-		files = dict()
-		# Go trough all files corresponding to the f_name pathname pattern (example: cache/elonmusk-feed*.json)
-		for f_name in glob.glob(f_name):
-			# Extract timestamp from filename
-			date = re.search("-([0-9]+\.[0-9]+)\.json", f_name).group(1)
-			# Convert timestamp back to datetime format
-			date = datetime.fromtimestamp(int(date.split(".")[0]))
-			# Read the file content
-			try:
-				with open(f_name, "r+", encoding="utf-8") as f:
-					f_json = json.loads(f.read())
-					# Put the json-decoded content in the dict
-					files[date] = f_json
-			except:
-				print(f_name)
-				print("*** Warning: error in JSON decoding of the above file ***")
-				sys.exit()
-		return files
-
 	def available_dates(self, do_print=True, r_type="latest"):
 		"""
 		Print at which dates the cache has data for the specified username
 		"""
-		# Get all files in cache concerning the specified username
-		files = self.get_json_files(f"project/cache/{self.username}-{r_type}*")
+		# Get all snapshots in cache concerning the specified username, from the manifest
+		entries = self.manifest.get_entries(r_type)
 		if not do_print:
-			return files.keys()
+			return [datetime.fromtimestamp(int(e[0])) for e in entries]
 		# Inform user if there is no cache for that username
-		if len(files) == 0:
+		if len(entries) == 0:
 			print(f"There is no data in cache for {self.username}")
 		else:
-			# Print date at which objects for that username have been cached. Dates are the dict keys of the cached files
+			# Print date at which objects for that username have been cached
 			print(f"Dates at wich data ({r_type}) of {self.username} has been cached:")
 			# Also print index, might make this function allow the user to enter the index to select a date (TODO?)
-			for i, (d, v) in enumerate(files.items()):
-				print(f"  {i}:  {d}, {len(v)} tweets")
+			for i, e in enumerate(entries):
+				print(f"  {i}:  {datetime.fromtimestamp(int(e[0]))}, {e[2]} tweets")
 
 	def first_before_date(self, r_type):
 		"""
 		Return the first available date in the cache, before the one specified in __init__
 		"""
-		# Get all dates in cache
-		dates = list(self.available_dates(False, r_type))
-		# Sort the dates list
-		dates.sort()
-		# Reverse the dates list to have the newest one first
-		dates = dates[::-1]
-		# Go trough all the dates
-		for date in dates:
-			# When a date is finally before the specified one, return it
-			if date < self.before_date:
-				return date
+		entry = self.manifest.last_before(r_type, self.before_date)
+		if entry is not None:
+			return datetime.fromtimestamp(int(entry[0]))
+
+	@staticmethod
+	def window_indices(latest_dates, feed_dates, n=50):
+		"""
+		Return a (L, n) matrix with, on each row, the indices of the n feed dates right before a latest date (oldest first)
+		feed_dates must be sorted (oldest first). Dates are epochs; if there are less than n dates before, the row starts with -1
+		"""
+		feed_dates = np.asarray(feed_dates, dtype=np.float64)
+		latest_dates = np.asarray(latest_dates, dtype=np.float64)
+		# Number of feed dates strictly before each latest date, all at once
+		ends = np.searchsorted(feed_dates, latest_dates, side="left")
+		windows = ends[:, np.newaxis] + np.arange(-n, 0)[np.newaxis, :]
+		windows[windows < 0] = -1
+		return windows
+
+	@staticmethod
+	def window_feed(latests, feed, n=50):
+		"""
+		Return the latest tweets and the feed tweets as lists sorted by date (oldest first),
+		with the (L, n) matrix of the indices of the n feed tweets right before each latest tweet (see window_indices())
+		"""
+		latest_tweets = [latests[d] for d in sorted(latests.keys())]
+		feed_tweets = [feed[d] for d in sorted(feed.keys())]
+		windows = cache.window_indices([t.date.timestamp() for t in latest_tweets], [t.date.timestamp() for t in feed_tweets], n)
+		return latest_tweets, feed_tweets, windows
 
 	@staticmethod
 	def split_latest_feed(latests, feed, n=50):
@@ -149,49 +272,70 @@ class cache:
 		Returns the latest tweets (as dict keys) with the n tweets that were before in the feed (as dict values)
 		(Return dict with keys = one latest tweet, value = list of n tweets before the latest tweet)
 		"""
-		r = dict()
-		# Get the dates of every tweet in the feed dict (they are the keys)
-		feed_dates = list(feed.keys())
-		# Go trough every tweet of the latest dict
-		for t_date, latest_tweet in latests.items():
-			# Get the indices of the n tweets from the feed that were tweeted right before James' tweet
-			before_latest = np.where(np.array(feed_dates) < t_date)[-1][-n:-1]
-			# Save the n tweets, from their indices, in a dict
-			r[latest_tweet] = [feed[feed_dates[d]] for d in before_latest]
-		return r
+		latest_tweets, feed_tweets, windows = cache.window_feed(latests, feed, n)
+		# Only build the lists of tweet objects here, from the indices
+		return {t: [feed_tweets[i] for i in row if i >= 0] for t, row in zip(latest_tweets, windows.tolist())}
+
+	@staticmethod
+	def split_latest_feed_batch(latests, feed, n=50):
+		"""
+		Vectorized split_latest_feed() on TweetBatch objects: return the latest tweets and the feed tweets sorted by date
+		(oldest first), with the (L, n) matrix of the indices of the n feed tweets right before each latest tweet
+		"""
+		latests, feed = latests.sort_by_date(), feed.sort_by_date()
+		return latests, feed, cache.window_indices(latests.date, feed.date, n)
+
+	def iter_snapshots(self, r_types=("feed", "latest"), newest_first=True):
+		"""
+		Yield the cached snapshots of the username one by one, as (type, date, list of json tweets)
+		The type comes from the file name (through the manifest), and only one file is decoded at a time
+		"""
+		entries = [e for r_type in r_types for e in self.manifest.get_entries(r_type)]
+		entries.sort(reverse=newest_first)
+		for entry in entries:
+			yield entry[1], datetime.fromtimestamp(int(entry[0])), self.load_snapshot(entry)
 
 	def get_all_cached(self):
 		"""
 		Return all cached results for specified username
 		"""
-		latest = dict()
-		feed = dict()
-		# Get all files in the cache folder that start with the given username
-		files = self.get_json_files(f"project/cache/{self.username}-*")
-		if len(files) == 0:
+		tweets = {"latest": dict(), "feed": dict()}
+		n_files = len(self.manifest.get_entries("latest")) + len(self.manifest.get_entries("feed"))
+		if n_files == 0:
 			print("*** WARNING: the specified username couldn't be found in the cache ***")
 			return None, None
-		# Go trough every file (dates are the keys of the dict)
-		for i, (date, file) in enumerate(files.items()):
-			print(f"Getting all from cache from {self.username}... ({i+1}/{len(files)})", end="\r")
-			r_type = "latest"
-			# If the file contain more than 50 tweets, it's a feed (latest tweets otherwise)
-			if len(file) > 50:
-				r_type = "feed"
+		# Go trough every snapshot, newest first, so that the most recent version of each tweet is kept
+		for i, (r_type, date, file) in enumerate(self.iter_snapshots()):
+			print(f"Getting all from cache from {self.username}... ({i+1}/{n_files})", end="\r")
+			r_tweets = tweets[r_type]
 			# Go through every tweet in the file
 			for t in file:
-				# Convert the JSON tweet back to a tweet object
-				tweet = self.json_to_tweet(t, False)
-				# Save tweet in appropriate dict (key: tweet id, value: tweet) if its not already in it
-				if r_type == "latest" and not (tweet.id in latest.keys()):
-					latest[tweet.id] = tweet
-				elif not (tweet.id in feed.keys()):
-					feed[tweet.id] = tweet
+				# Only convert the JSON tweet back to a tweet object if its id is not already in the dict
+				if t["id"] not in r_tweets:
+					r_tweets[t["id"]] = self.json_to_tweet(t, False)
 		print()
 		# Convert the dict to lists
-		latest, feed = list(latest.values()), list(feed.values())
+		latest, feed = list(tweets["latest"].values()), list(tweets["feed"].values())
 		# Sort the lists (by tweet date)
-		latest.sort(), feed.sort()
+		TE.sort_tweets(latest, key=TE.date_key), TE.sort_tweets(feed, key=TE.date_key)
 		# Convert the lists back to dict (key: tweet date, value: tweet)
 		latest, feed = {l.date:l for l in latest}, {f.date:f for f in feed}
 		return latest, feed
+
+	def get_all_cached_batch(self):
+		"""
+		Return all cached results for specified username, as TweetBatch objects sorted by date (oldest first)
+		Unlike get_all_cached(), no tweet object is made, and tweets with the same date are all kept
+		"""
+		rows = {"latest": dict(), "feed": dict()}
+		if len(self.manifest.get_entries("latest")) + len(self.manifest.get_entries("feed")) == 0:
+			print("*** WARNING: the specified username couldn't be found in the cache ***")
+			return None, None
+		# Go trough every snapshot, newest first, so that the most recent version of each tweet is kept
+		for r_type, date, file in self.iter_snapshots():
+			r_rows = rows[r_type]
+			for t in file:
+				r_rows.setdefault(t["id"], t)
+		latest = TE.TweetBatch.from_rows(list(rows["latest"].values())).sort_by_date()
+		feed = TE.TweetBatch.from_rows(list(rows["feed"].values())).sort_by_date()
+		return latest, feed
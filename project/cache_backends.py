@@ -0,0 +1,490 @@
+import glob
+import json
+import os
+import re
+import struct
+import threading
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+
+def tweet_to_row(tw):
+	"""
+	Extract the fields of a tweet object that the cache needs to rebuild it
+	"""
+	return {"id": tw.id, "like": tw.like, "rt": tw.rt, "rep": tw.rep, "username": tw.username, "date": tw.date,
+		"text": tw.text, "from_verified": tw.from_verified, "is_reply": tw.is_reply, "is_retweet": tw.is_retweet,
+		"liked_by": tw.liked_by, "influence_score": tw.influence_score}
+
+def to_epoch(date):
+	"""
+	Convert a tweet date (datetime, or str from a JSON file) to an epoch int
+	"""
+	if isinstance(date, str):
+		date = datetime.strptime(date[:-3]+date[-2:], "%Y-%m-%d %H:%M:%S%z")
+	return int(date.timestamp())
+
+def parse_snapshot_filename(username, f_name):
+	"""
+	Return the type and timestamp of a snapshot file from its name (None if it's not a snapshot of the username)
+	File names are {username}-{type}-{timestamp}.{extension}
+	"""
+	match = re.match(rf"{re.escape(username)}-(feed|latest)-([0-9]+\.[0-9]+)\.[a-z]+$", os.path.basename(f_name))
+	if match is None:
+		return None
+	return match.group(1), float(match.group(2))
+
+class file_backend:
+	"""
+	Base of the backends that save every snapshot in its own file.
+	Snapshots are described by manifest entries: (timestamp, type, number of tweets, byte offset, file name)
+	"""
+	extension = ""
+
+	def save(self, folder, username, r_type, tweets, timestamp):
+		"""
+		Save a snapshot of tweet objects, return its manifest entry
+		"""
+		f_name = f"{username}-{r_type}-{timestamp}.{self.extension}"
+		self.write(os.path.join(folder, f_name), tweets)
+		return (timestamp, r_type, len(tweets), 0, f_name)
+
+	def save_rows(self, folder, username, r_type, rows, timestamp):
+		"""
+		Save a snapshot of rows (dicts from tweet_to_row() or load()), return its manifest entry
+		"""
+		f_name = f"{username}-{r_type}-{timestamp}.{self.extension}"
+		self.write_rows(os.path.join(folder, f_name), rows)
+		return (timestamp, r_type, len(rows), 0, f_name)
+
+	def load(self, folder, entry):
+		"""
+		Return the rows of the snapshot of a manifest entry
+		"""
+		return self.read(os.path.join(folder, entry[4]))
+
+	def list_snapshots(self, folder, username, known):
+		"""
+		Return the manifest entries of all snapshots of a username in the folder
+		Entries already in the known dict (keys are file names) are not decoded again
+		"""
+		entries = []
+		for path in glob.glob(os.path.join(folder, f"{username}-*.{self.extension}")):
+			parsed = parse_snapshot_filename(username, path)
+			if parsed is None:
+				continue
+			r_type, timestamp = parsed
+			f_name = os.path.basename(path)
+			if f_name in known:
+				entries.append(known[f_name])
+			else:
+				entries.append((timestamp, r_type, len(self.read(path)), 0, f_name))
+		return entries
+
+	def remove(self, folder, username, entries):
+		"""
+		Remove the snapshots of some manifest entries from the disk
+		"""
+		for entry in entries:
+			os.remove(os.path.join(folder, entry[4]))
+
+class json_backend(file_backend):
+	"""
+	Legacy storage: one JSON dump of the tweet objects per snapshot
+	"""
+	extension = "json"
+
+	def write(self, filename, tweets):
+		"""
+		Save a list of tweet objects in a JSON file
+		"""
+		# Save the fields of each tweet object (class) as a json dump, and join them in a json list
+		r = ",\n".join(json.dumps(tweet_to_row(tw), indent=4, sort_keys=True, default=str) for tw in tweets)
+		with open(filename, "w+", encoding="utf8") as f:
+			f.write("[" + r + "]")
+
+	def write_rows(self, filename, rows):
+		"""
+		Save a list of rows (dicts from tweet_to_row() or read()) in a JSON file
+		"""
+		with open(filename, "w+", encoding="utf8") as f:
+			json.dump(rows, f, default=str)
+
+	def read(self, filename):
+		"""
+		Return the list of JSON tweets (dicts) saved in a file
+		"""
+		with open(filename, "r", encoding="utf-8") as f:
+			return json.loads(f.read())
+
+class columnar_backend(file_backend):
+	"""
+	Compact binary storage: the tweets of a snapshot are saved column by column.
+	Counts and dates are fixed-width int arrays, usernames are interned in a table, and texts/ids are one blob.
+	"""
+	extension = "twc"
+	magic = b"TWC1"
+	# Bits of the flags column
+	verified_bit, reply_bit, retweet_bit = 1, 2, 4
+
+	@staticmethod
+	def pack_strings(strings):
+		"""
+		Pack a list of strings as an offsets array followed by one utf-8 blob
+		"""
+		blobs = [s.encode("utf-8") for s in strings]
+		offsets = np.zeros(len(blobs)+1, dtype="<u4")
+		offsets[1:] = np.cumsum([len(b) for b in blobs])
+		return offsets.tobytes() + b"".join(blobs)
+
+	@staticmethod
+	def unpack_strings(buf, pos, n):
+		"""
+		Unpack n strings packed by pack_strings() starting at pos, return the strings and the position after them
+		"""
+		offsets = np.frombuffer(buf, dtype="<u4", count=n+1, offset=pos).tolist()
+		pos += 4 * (n+1)
+		blob = buf[pos:pos+offsets[-1]]
+		strings = [blob[offsets[i]:offsets[i+1]].decode("utf-8") for i in range(n)]
+		return strings, pos + offsets[-1]
+
+	def write(self, filename, tweets):
+		"""
+		Save a list of tweet objects in a columnar binary file
+		"""
+		self.write_rows(filename, [tweet_to_row(tw) for tw in tweets])
+
+	def write_rows(self, filename, rows):
+		"""
+		Save a list of rows (dicts from tweet_to_row() or read()) in a columnar binary file
+		"""
+		n = len(rows)
+		# Intern the usernames (authors and likers) in one table
+		users = dict()
+		for r in rows:
+			users.setdefault(r["username"], len(users))
+			if r["liked_by"] is not None:
+				users.setdefault(r["liked_by"], len(users))
+		flags = np.zeros(n, dtype="u1")
+		for i, r in enumerate(rows):
+			flags[i] = self.verified_bit * bool(r["from_verified"]) + self.reply_bit * bool(r["is_reply"]) \
+				+ self.retweet_bit * bool(r["is_retweet"])
+		influence = [np.nan if r["influence_score"] is None else r["influence_score"] for r in rows]
+		parts = [
+			self.magic,
+			struct.pack("<II", n, len(users)),
+			np.array([r["like"] for r in rows], dtype="<i8").tobytes(),
+			np.array([r["rt"] for r in rows], dtype="<i8").tobytes(),
+			np.array([r["rep"] for r in rows], dtype="<i8").tobytes(),
+			np.array([to_epoch(r["date"]) for r in rows], dtype="<i8").tobytes(),
+			np.array(influence, dtype="<f8").tobytes(),
+			flags.tobytes(),
+			np.array([users[r["username"]] for r in rows], dtype="<u4").tobytes(),
+			np.array([-1 if r["liked_by"] is None else users[r["liked_by"]] for r in rows], dtype="<i4").tobytes(),
+			self.pack_strings(list(users.keys())),
+			self.pack_strings([str(r["id"]) for r in rows]),
+			self.pack_strings([r["text"] for r in rows])
+		]
+		with open(filename, "wb") as f:
+			f.write(b"".join(parts))
+
+	def read(self, filename):
+		"""
+		Return the list of tweets (as dicts, like the JSON backend) saved in a columnar file
+		"""
+		with open(filename, "rb") as f:
+			buf = f.read()
+		if buf[:4] != self.magic:
+			raise ValueError(f"{filename} is not a columnar cache file")
+		n, n_users = struct.unpack_from("<II", buf, 4)
+		pos = 12
+		columns = dict()
+		# Read the fixed-width columns one after the other
+		for name, dtype in [("like", "<i8"), ("rt", "<i8"), ("rep", "<i8"), ("date", "<i8"), ("influence_score", "<f8"),
+			("flags", "u1"), ("username", "<u4"), ("liked_by", "<i4")]:
+			col = np.frombuffer(buf, dtype=dtype, count=n, offset=pos)
+			pos += col.nbytes
+			columns[name] = col.tolist()
+		users, pos = self.unpack_strings(buf, pos, n_users)
+		ids, pos = self.unpack_strings(buf, pos, n)
+		texts, pos = self.unpack_strings(buf, pos, n)
+		rows = []
+		for i in range(n):
+			flags, liked_by, influence = columns["flags"][i], columns["liked_by"][i], columns["influence_score"][i]
+			rows.append({"id": ids[i], "like": columns["like"][i], "rt": columns["rt"][i], "rep": columns["rep"][i],
+				"username": users[columns["username"][i]], "date": datetime.fromtimestamp(columns["date"][i], timezone.utc),
+				"text": texts[i], "from_verified": bool(flags & self.verified_bit), "is_reply": bool(flags & self.reply_bit),
+				"is_retweet": bool(flags & self.retweet_bit), "liked_by": None if liked_by == -1 else users[liked_by],
+				"influence_score": None if influence != influence else influence})
+		return rows
+
+class tweet_store:
+	"""
+	Append-only files of the tweets of a username:
+	 - {username}.tweets: one JSON line per tweet, written once (id, username, date, text, flags, liked_by)
+	 - {username}.metrics: fixed-width records (tweet index, timestamp, like, rt, rep, influence score), only when they changed
+	 - {username}.snapshots: one record per snapshot (timestamp, type, number of tweets) followed by the tweet indices
+	A tweet of the feed is kept once per user that liked it, so the rows are keyed by (id, liked_by)
+	"""
+	metric_record = np.dtype([("tweet", "<u4"), ("timestamp", "<f8"), ("like", "<i8"), ("rt", "<i8"), ("rep", "<i8"),
+		("influence_score", "<f8")])
+	snapshot_header = struct.Struct("<dBI")
+	types = ["feed", "latest"]
+
+	def __init__(self, folder, username):
+		self.username = username
+		self.tweets_path = os.path.join(folder, f"{username}.tweets")
+		self.metrics_path = os.path.join(folder, f"{username}.metrics")
+		self.snapshots_path = os.path.join(folder, f"{username}.snapshots")
+		self.lock = threading.Lock()
+		self.tweets_size = None
+		self.metrics_size = None
+		# Tweet rows (without metrics), tweet index of every (id, liked_by), and latest metrics of every tweet index
+		self.rows = []
+		self.index = dict()
+		self.last_metrics = dict()
+		self.metrics = np.zeros(0, dtype=self.metric_record)
+
+	@staticmethod
+	def size(path):
+		"""
+		Size of a file, 0 if it doesn't exist
+		"""
+		return os.path.getsize(path) if os.path.exists(path) else 0
+
+	def refresh(self):
+		"""
+		(Re)load the tweets and metrics files if they changed on the disk
+		"""
+		if self.size(self.tweets_path) != self.tweets_size:
+			self.rows, self.index = [], dict()
+			if os.path.exists(self.tweets_path):
+				with open(self.tweets_path, "r", encoding="utf-8") as f:
+					for line in f:
+						self.add_row(json.loads(line))
+			self.tweets_size = self.size(self.tweets_path)
+		if self.size(self.metrics_path) != self.metrics_size:
+			self.metrics = np.fromfile(self.metrics_path, dtype=self.metric_record) if os.path.exists(self.metrics_path) \
+				else np.zeros(0, dtype=self.metric_record)
+			# Records are in chronological order, so the last one of each tweet holds its latest metrics
+			self.last_metrics = {int(m["tweet"]): self.metric_values(m) for m in self.metrics}
+			self.metrics_size = self.size(self.metrics_path)
+
+	@staticmethod
+	def metric_values(m):
+		"""
+		Return the (like, rt, rep, influence score) of a metrics record, the influence score is None when it was not computed
+		"""
+		influence = float(m["influence_score"])
+		return int(m["like"]), int(m["rt"]), int(m["rep"]), None if influence != influence else influence
+
+	def add_row(self, line):
+		"""
+		Add a tweet line of the tweets file to the in-memory rows
+		"""
+		id, username, date, text, verif, is_rep, is_rt, liked_by = line
+		self.index[(id, liked_by)] = len(self.rows)
+		self.rows.append({"id": id, "username": username, "date": datetime.fromtimestamp(date, timezone.utc), "text": text,
+			"from_verified": verif, "is_reply": is_rep, "is_retweet": is_rt, "liked_by": liked_by})
+
+	def save_rows(self, r_type, rows, timestamp):
+		"""
+		Append a snapshot to the store, return its manifest entry
+		Only new tweets and metrics that changed since the last snapshot are written
+		"""
+		with self.lock:
+			self.refresh()
+			new_lines, new_metrics, indices = [], [], []
+			for r in rows:
+				key = (str(r["id"]), r["liked_by"])
+				if key not in self.index:
+					line = [key[0], r["username"], to_epoch(r["date"]), r["text"], bool(r["from_verified"]), bool(r["is_reply"]), \
+						bool(r["is_retweet"]), r["liked_by"]]
+					self.add_row(line)
+					new_lines.append(json.dumps(line, ensure_ascii=False) + "\n")
+				i = self.index[key]
+				influence = r["influence_score"]
+				metrics = (int(r["like"]), int(r["rt"]), int(r["rep"]), None if influence is None else float(influence))
+				if self.last_metrics.get(i) != metrics:
+					self.last_metrics[i] = metrics
+					new_metrics.append((i, timestamp) + metrics[:3] + (np.nan if influence is None else metrics[3],))
+				indices.append(i)
+			with open(self.tweets_path, "a", encoding="utf-8") as f:
+				f.writelines(new_lines)
+			new_metrics = np.array(new_metrics, dtype=self.metric_record)
+			with open(self.metrics_path, "ab") as f:
+				f.write(new_metrics.tobytes())
+			self.metrics = np.concatenate([self.metrics, new_metrics])
+			self.tweets_size, self.metrics_size = self.size(self.tweets_path), self.size(self.metrics_path)
+			# The snapshot only holds the indices of its tweets
+			with open(self.snapshots_path, "ab") as f:
+				offset = f.tell()
+				f.write(self.snapshot_header.pack(timestamp, self.types.index(r_type), len(indices)))
+				f.write(np.array(indices, dtype="<u4").tobytes())
+		return (timestamp, r_type, len(indices), offset, os.path.basename(self.snapshots_path))
+
+	def metrics_at(self, timestamp):
+		"""
+		Return a dict {tweet index: (like, rt, rep, influence score)} of the metrics of every tweet at a timestamp
+		"""
+		metrics = self.metrics[self.metrics["timestamp"] <= timestamp][::-1]
+		# The first record of each tweet in the reversed array is the last one before the timestamp
+		tweets, first = np.unique(metrics["tweet"], return_index=True)
+		return {int(i): self.metric_values(m) for i, m in zip(tweets, metrics[first])}
+
+	def load(self, offset):
+		"""
+		Rebuild the rows of the snapshot that starts at a byte offset of the snapshots file
+		"""
+		with self.lock:
+			self.refresh()
+			with open(self.snapshots_path, "rb") as f:
+				f.seek(offset)
+				timestamp, r_type, n = self.snapshot_header.unpack(f.read(self.snapshot_header.size))
+				indices = np.frombuffer(f.read(4*n), dtype="<u4").tolist()
+			metrics = self.metrics_at(timestamp)
+			rows = []
+			for i in indices:
+				row = dict(self.rows[i])
+				row["like"], row["rt"], row["rep"], row["influence_score"] = metrics[i]
+				rows.append(row)
+		return rows
+
+	def list_snapshots(self):
+		"""
+		Return the manifest entries of all snapshots in the store
+		"""
+		entries = []
+		if not os.path.exists(self.snapshots_path):
+			return entries
+		with open(self.snapshots_path, "rb") as f:
+			buf = f.read()
+		pos = 0
+		while pos < len(buf):
+			timestamp, r_type, n = self.snapshot_header.unpack_from(buf, pos)
+			entries.append((timestamp, self.types[r_type], n, pos, os.path.basename(self.snapshots_path)))
+			pos += self.snapshot_header.size + 4*n
+		return entries
+
+	def metric_history(self, id):
+		"""
+		Return the list of (date, like, rt, rep) of a tweet, one item per change of its metrics
+		"""
+		with self.lock:
+			self.refresh()
+			# The metrics of a tweet are the same for every user that liked it, the first row of the id is used
+			indices = [i for (tw_id, liked_by), i in self.index.items() if tw_id == str(id)]
+			if len(indices) == 0:
+				return []
+			metrics = self.metrics[self.metrics["tweet"] == min(indices)]
+		history = []
+		for m in metrics:
+			item = (datetime.fromtimestamp(m["timestamp"]), int(m["like"]), int(m["rt"]), int(m["rep"]))
+			# Records only written because the influence score changed are not a change of the metrics
+			if len(history) == 0 or history[-1][1:] != item[1:]:
+				history.append(item)
+		return history
+
+	def clear(self):
+		"""
+		Remove the files of the store
+		"""
+		with self.lock:
+			for path in [self.tweets_path, self.metrics_path, self.snapshots_path]:
+				if os.path.exists(path):
+					os.remove(path)
+			self.tweets_size, self.metrics_size = None, None
+
+class store_backend:
+	"""
+	Incremental storage: every tweet is written once, and later snapshots only add the metrics (like/rt/rep) that changed.
+	A snapshot at any date can be rebuilt, and the metrics history of every tweet comes for free.
+	"""
+	extension = "snapshots"
+
+	def __init__(self):
+		self.stores = dict()
+		self.lock = threading.Lock()
+
+	def get_store(self, folder, username):
+		"""
+		Return the (shared) tweet_store of a username in a folder
+		"""
+		with self.lock:
+			key = (os.path.abspath(folder), username)
+			if key not in self.stores:
+				self.stores[key] = tweet_store(folder, username)
+			return self.stores[key]
+
+	def save(self, folder, username, r_type, tweets, timestamp):
+		"""
+		Save a snapshot of tweet objects, return its manifest entry
+		"""
+		return self.save_rows(folder, username, r_type, [tweet_to_row(tw) for tw in tweets], timestamp)
+
+	def save_rows(self, folder, username, r_type, rows, timestamp):
+		"""
+		Save a snapshot of rows (dicts from tweet_to_row() or load()), return its manifest entry
+		"""
+		return self.get_store(folder, username).save_rows(r_type, rows, timestamp)
+
+	def load(self, folder, entry):
+		"""
+		Return the rows of the snapshot of a manifest entry
+		"""
+		username = entry[4].rsplit(".", 1)[0]
+		return self.get_store(folder, username).load(entry[3])
+
+	def list_snapshots(self, folder, username, known):
+		"""
+		Return the manifest entries of all snapshots of a username in the folder
+		"""
+		return self.get_store(folder, username).list_snapshots()
+
+	def remove(self, folder, username, entries):
+		"""
+		Snapshots can't be removed one by one from the append-only files: the whole store is removed
+		"""
+		if len(entries) != 0:
+			self.get_store(folder, username).clear()
+
+	def metric_history(self, folder, username, id):
+		"""
+		Return the list of (date, like, rt, rep) of a tweet, one item per change of its metrics
+		"""
+		return self.get_store(folder, username).metric_history(id)
+
+# Available backends, by name
+backends = {"json": json_backend(), "columnar": columnar_backend(), "store": store_backend()}
+
+def backend_from_filename(filename):
+	"""
+	Return the backend that can read a cache file, from the file extension
+	"""
+	extension = filename.rsplit(".", 1)[-1]
+	for backend in backends.values():
+		if backend.extension == extension:
+			return backend
+	raise ValueError(f"No cache backend for file {filename}")
+
+def benchmark(tweets, repeat=5):
+	"""
+	Time saving and loading the same snapshot of tweets with every backend
+	Return a dict {backend name: (save time, load time, size on disk in bytes)}
+	"""
+	results = dict()
+	for name, backend in backends.items():
+		# Use a new instance of the backend, so that nothing is kept in memory from one benchmark to the other
+		backend = type(backend)()
+		with tempfile.TemporaryDirectory() as folder:
+			t0 = time.perf_counter()
+			entries = [backend.save(folder, "bench", "feed", tweets, float(i)) for i in range(repeat)]
+			t1 = time.perf_counter()
+			for entry in entries:
+				backend.load(folder, entry)
+			t2 = time.perf_counter()
+			size = sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+			results[name] = ((t1-t0)/repeat, (t2-t1)/repeat, size)
+	return results
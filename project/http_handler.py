@@ -0,0 +1,372 @@
+import requests
+import requests.adapters
+import requests.structures
+import http.cookiejar
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class token_bucket:
+	"""
+	Rate limit state of one host (or API endpoint):
+	 - a token bucket: each request takes a token, tokens come back at a fixed rate up to the capacity
+	 - the budget announced by the server in the x-rate-limit headers (Twitter), with the requests not answered yet
+	 - an adaptive backoff, that grows on each 429 response and shrinks again on success
+	"""
+	def __init__(self, rate, capacity, reserve=7):
+		self.rate = rate
+		self.capacity = capacity
+		self.tokens = capacity
+		self.updated = time.time()
+		# Budget of the server: requests left in the interval, time of the interval reset, and requests to keep in reserve
+		self.remaining = None
+		self.reset = 0
+		self.reserve = reserve
+		self.in_flight = 0
+		# Adaptive backoff
+		self.backoff = 0
+		self.blocked_until = 0
+
+	def refill(self, now):
+		"""
+		Add the tokens that came back since the last update
+		"""
+		self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+	def wait_time(self, now):
+		"""
+		Return how long to wait before a request can be made (0 if it can be made now)
+		"""
+		self.refill(now)
+		wait = max(0, self.blocked_until - now)
+		if self.tokens < 1:
+			wait = max(wait, (1 - self.tokens) / self.rate)
+		if self.remaining is not None and now < self.reset and self.remaining - self.in_flight <= self.reserve:
+			wait = max(wait, self.reset - now)
+		return wait
+
+	def penalise(self, now, retry_after=None):
+		"""
+		Back off after a 429 response (or any sign of being rate limited)
+		"""
+		self.backoff = min(rate_limiter.max_backoff, max(rate_limiter.min_backoff, self.backoff * 2))
+		if retry_after is not None:
+			self.backoff = max(self.backoff, retry_after)
+		self.blocked_until = max(self.blocked_until, now + self.backoff)
+		self.tokens = 0
+
+	def update(self, now, response):
+		"""
+		Update the state from a response: status code and rate limit headers
+		"""
+		headers = response.headers
+		if response.status_code == 429:
+			self.penalise(now, parse_number(headers.get("Retry-After")))
+		else:
+			# Success: slowly forget about the previous 429 responses
+			self.backoff /= 2
+		remaining, reset = parse_number(headers.get("x-rate-limit-remaining")), parse_number(headers.get("x-rate-limit-reset"))
+		if remaining is not None and reset is not None:
+			# Responses can arrive out of order: in the same interval, keep the lowest number of requests left
+			if reset != self.reset or self.remaining is None or remaining < self.remaining:
+				self.remaining, self.reset = int(remaining), reset
+		return self.remaining
+
+def parse_number(value):
+	"""
+	Convert a header value to a float (None if there is no such header, or if it is not a number)
+	"""
+	if not isinstance(value, str):
+		return None
+	try:
+		return float(value)
+	except ValueError:
+		return None
+
+class rate_limiter:
+	"""
+	Thread-safe rate limiter, with one token bucket per host (or API endpoint)
+	"""
+	min_backoff, max_backoff = 0.5, 300
+	# Requests per second and burst size of the hosts used by the project, and for any other host
+	limits = {
+		"en.wikipedia.org": (50, 50),
+		"www.google.com": (0.5, 2),
+		"www.bing.com": (2, 4),
+		"api.twitter.com": (15, 15),
+		"cdn.syndication.twimg.com": (1, 2)
+	}
+	default_limit = (10, 10)
+	# Waits longer than this (s) are shown to the user
+	warn_wait = 5
+
+	def __init__(self):
+		self.condition = threading.Condition()
+		self.buckets = dict()
+
+	def get_bucket(self, key):
+		"""
+		Return the bucket of a key (host, or host and path), create it if needed
+		"""
+		if key not in self.buckets:
+			rate, capacity = self.limits.get(key.split("/")[0], self.default_limit)
+			self.buckets[key] = token_bucket(rate, capacity)
+		return self.buckets[key]
+
+	def acquire(self, key):
+		"""
+		Wait until a request can be made for a key
+		"""
+		with self.condition:
+			bucket = self.get_bucket(key)
+			warned = False
+			while True:
+				now = time.time()
+				wait = bucket.wait_time(now)
+				if wait <= 0:
+					break
+				if not warned and wait > self.warn_wait:
+					print()
+					print(f"Waiting {round(wait, 1)} seconds to stay below the rate limit of {key}. You might want to stop and try again in 5mins.")
+					print()
+					warned = True
+				# Wait, or until another thread updates the state
+				self.condition.wait(wait)
+			bucket.tokens -= 1
+			bucket.in_flight += 1
+
+	def release(self, key, response=None):
+		"""
+		Update the state of a key after a request was made (response is None if it failed)
+		Return the number of requests left in the interval, if the server says it
+		"""
+		with self.condition:
+			bucket = self.get_bucket(key)
+			bucket.in_flight -= 1
+			remaining = None
+			if response is not None:
+				remaining = bucket.update(time.time(), response)
+			self.condition.notify_all()
+		return remaining
+
+	def remaining(self, key):
+		"""
+		Return the number of requests left in the interval of a key, if the server says it
+		"""
+		with self.condition:
+			return self.get_bucket(key).remaining
+
+	def penalise(self, key):
+		"""
+		Back off for a key, when a server answered without an error code but the answer shows it is overloaded
+		"""
+		with self.condition:
+			self.get_bucket(key).penalise(time.time())
+			self.condition.notify_all()
+
+# Rate limiter shared by all modules of the project
+limiter = rate_limiter()
+
+# Connections kept alive per host: the largest number of threads making requests at the same time (News_weights.multithreading uses 24 to 128)
+pool_size = 128
+# Number of hosts for which a pool of connections is kept
+pool_hosts = 16
+
+def make_session(pool_size=pool_size):
+	"""
+	Create a session that keeps its connections alive, with a pool of pool_size connections per host
+	"""
+	session = requests.Session()
+	adapter = requests.adapters.HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+	session.mount("https://", adapter)
+	session.mount("http://", adapter)
+	# Do not keep the cookies of the responses, so that each request is the same as a separate requests.get()
+	session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+	return session
+
+# Session shared by all modules of the project (the connection pools are thread-safe)
+session = make_session()
+
+def connection_stats(session=session):
+	"""
+	Return, per host, the number of connections opened and the number of requests made through the session
+	"""
+	stats = dict()
+	# The same adapter is mounted for http and https
+	for adapter in set(session.adapters.values()):
+		pools = adapter.poolmanager.pools
+		for pool_key in pools.keys():
+			pool = pools[pool_key]
+			connections, n_requests = stats.get(pool.host, (0, 0))
+			stats[pool.host] = (connections + pool.num_connections, n_requests + pool.num_requests)
+	return stats
+
+def connection_report(session=session):
+	"""
+	Return a summary of the connection reuse of the session: connections opened, requests made, and handshakes saved
+	"""
+	stats = connection_stats(session).values()
+	connections, n_requests = sum(s[0] for s in stats), sum(s[1] for s in stats)
+	return f"{n_requests} requests over {connections} connections ({n_requests - connections} handshakes saved)"
+
+def get_key(url, path=False):
+	"""
+	Return the rate limit key of an url: its host, and its path for APIs that count the requests per endpoint
+	"""
+	parsed = urlparse(url)
+	return parsed.netloc + parsed.path if path else parsed.netloc
+
+class response_cache:
+	"""
+	On-disk cache of responses, with:
+	 - objects/{sha256 of the body}: the bodies, stored once even when several urls return the same content
+	 - index/{sha256 of the url}.json: status, headers and body hash of each url, and when it was fetched
+	Entries older than ttl are revalidated with the ETag/Last-Modified of the server (a 304 response costs no download).
+	In offline mode, the network is never used: cached responses are replayed whatever their age, and the others raise a ConnectionError.
+	"""
+	# Headers kept with the cached responses
+	kept_headers = ["Content-Type", "ETag", "Last-Modified"]
+
+	def __init__(self, folder="project/cache/http", ttl=7*24*3600, offline=False):
+		self.folder = folder
+		self.ttl = ttl
+		self.offline = offline
+		self.lock = threading.Lock()
+		# Responses served from the cache, revalidated with a 304, and downloaded
+		self.stats = {"hit": 0, "revalidated": 0, "miss": 0}
+		os.makedirs(os.path.join(folder, "objects"), exist_ok=True)
+		os.makedirs(os.path.join(folder, "index"), exist_ok=True)
+
+	@staticmethod
+	def request_url(url, params=None):
+		"""
+		Return the full url of a request, with its parameters
+		"""
+		return requests.Request("GET", url, params=params).prepare().url
+
+	def index_path(self, full_url):
+		return os.path.join(self.folder, "index", hashlib.sha256(full_url.encode("utf-8")).hexdigest() + ".json")
+
+	def object_path(self, digest):
+		return os.path.join(self.folder, "objects", digest)
+
+	@staticmethod
+	def write_file(path, content):
+		"""
+		Write a file atomically, so that other threads (or a crash) never see it half written
+		"""
+		tmp_path = f"{path}.{threading.get_ident()}.tmp"
+		with open(tmp_path, "wb") as f:
+			f.write(content)
+		os.replace(tmp_path, path)
+
+	def lookup(self, full_url):
+		"""
+		Return the cache entry of an url (None if there is none)
+		"""
+		try:
+			with open(self.index_path(full_url), encoding="utf-8") as f:
+				entry = json.load(f)
+		except (FileNotFoundError, ValueError):
+			return None
+		# The body may be missing if the cache was cleaned by hand
+		return entry if os.path.exists(self.object_path(entry["body"])) else None
+
+	def store(self, full_url, response, fetched=None):
+		"""
+		Save a response in the cache, and return its entry
+		"""
+		digest = hashlib.sha256(response.content).hexdigest()
+		if not os.path.exists(self.object_path(digest)):
+			self.write_file(self.object_path(digest), response.content)
+		headers = {h: response.headers[h] for h in self.kept_headers if isinstance(response.headers.get(h), str)}
+		entry = {"url": full_url, "status": response.status_code, "headers": headers, "body": digest, \
+			"fetched": time.time() if fetched is None else fetched}
+		self.write_file(self.index_path(full_url), json.dumps(entry).encode("utf-8"))
+		return entry
+
+	def to_response(self, entry):
+		"""
+		Rebuild a response from a cache entry
+		"""
+		response = requests.Response()
+		response.status_code = entry["status"]
+		response.headers = requests.structures.CaseInsensitiveDict(entry["headers"])
+		response.url = entry["url"]
+		with open(self.object_path(entry["body"]), "rb") as f:
+			response._content = f.read()
+		return response
+
+	def count(self, stat):
+		with self.lock:
+			self.stats[stat] += 1
+
+	def get(self, url, key=None, retries=2, params=None, **kwargs):
+		"""
+		GET request through the cache: same arguments as get()
+		"""
+		full_url = self.request_url(url, params)
+		entry = self.lookup(full_url)
+		# Server errors (5xx) are kept for the offline mode, but they are downloaded again when online
+		if entry is not None and (self.offline or (time.time() - entry["fetched"] < self.ttl and entry["status"] < 500)):
+			self.count("hit")
+			return self.to_response(entry)
+		if self.offline:
+			raise ConnectionError(f"{full_url} is not in the response cache (offline mode)")
+		# Stale entry: ask the server if it changed since
+		headers = dict(kwargs.pop("headers", None) or {})
+		if entry is not None:
+			if "ETag" in entry["headers"]:
+				headers["If-None-Match"] = entry["headers"]["ETag"]
+			if "Last-Modified" in entry["headers"]:
+				headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+		if headers:
+			kwargs["headers"] = headers
+		if params is not None:
+			kwargs["params"] = params
+		response = get(url, key=key, retries=retries, **kwargs)
+		if response.status_code == 304 and entry is not None:
+			self.count("revalidated")
+			entry["fetched"] = time.time()
+			self.write_file(self.index_path(full_url), json.dumps(entry).encode("utf-8"))
+			return self.to_response(entry)
+		self.count("miss")
+		# The final responses are cached (also 404 and error pages, so the offline mode can replay them), not a 429
+		if response.status_code != 429:
+			self.store(full_url, response)
+		return response
+
+	def report(self):
+		"""
+		Return a summary of the use of the cache
+		"""
+		return f"{self.stats['hit']} from cache, {self.stats['revalidated']} revalidated, {self.stats['miss']} downloaded"
+
+# Response cache used by the News_weights crawl (None: no cache). News_weights.create() sets it
+crawl_cache = None
+
+def get(url, key=None, retries=2, cache=None, **kwargs):
+	"""
+	GET request through the shared rate limiter and session. kwargs are passed to requests.Session.get()
+	On a 429 response, the request is tried again (after the backoff) up to retries times, then the response is returned
+	If a response_cache is given, the response is taken from it when possible
+	"""
+	if cache is not None:
+		return cache.get(url, key=key, retries=retries, **kwargs)
+	if key is None:
+		key = get_key(url)
+	for attempt in range(retries + 1):
+		limiter.acquire(key)
+		response = None
+		try:
+			response = session.get(url, **kwargs)
+		finally:
+			limiter.release(key, response)
+		if response.status_code != 429:
+			break
+	return response
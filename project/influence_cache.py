@@ -0,0 +1,139 @@
+import collections
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+
+def normalise_text(text):
+	"""
+	Return the text of a tweet as it is used in the cache keys: the "RT @username:" prefixes of retweets are removed,
+	the case and unicode forms are folded, and all whitespace is collapsed to single spaces
+	"""
+	text = unicodedata.normalize("NFKC", text).casefold()
+	text = re.sub(r"^(rt @\w+:\s*)+", "", text.strip())
+	return " ".join(text.split())
+
+def normalise_engine(engine):
+	"""
+	Return the one letter name of a search engine ("b" or "g"), from any name News_Search_URL_Builder() accepts
+	"""
+	if engine in ["G", "g", "google"]:
+		return "g"
+	elif engine in ["B", "b", "bing"]:
+		return "b"
+	raise ValueError(f"Unknown search engine: {engine}")
+
+class influence_cache:
+	"""
+	Cache of the news influence of the tweet texts, per search engine, saved on the disk between runs.
+	Entries older than ttl seconds are searched again; when there are more than max_size entries,
+	the ones that were used the longest ago are removed first.
+	"""
+	def __init__(self, path="project/cache/news_influence.json", ttl=24*3600, max_size=10000):
+		self.path = path
+		self.ttl = ttl
+		self.max_size = max_size
+		self.lock = threading.Lock()
+		# (normalised text, engine) -> (news influence, time it was computed), least recently used first
+		self.entries = collections.OrderedDict()
+		self.loaded = False
+		self.changed = False
+		# Texts whose influence came from the cache, and texts that had to be searched
+		self.stats = {"hit": 0, "miss": 0}
+
+	@staticmethod
+	def key(text, engine):
+		return normalise_text(text), normalise_engine(engine)
+
+	def load(self):
+		"""
+		Read the cache file, the first time the cache is used
+		"""
+		if self.loaded:
+			return
+		self.loaded = True
+		try:
+			with open(self.path, encoding="utf-8") as f:
+				rows = json.load(f)
+		except (FileNotFoundError, ValueError):
+			return
+		now = time.time()
+		# The rows are saved least recently used first, so the LRU order is kept between runs
+		for text, engine, score, computed in rows:
+			if now - computed < self.ttl:
+				self.entries[(text, engine)] = (score, computed)
+		self.trim()
+
+	def trim(self):
+		"""
+		Remove the least recently used entries above max_size
+		"""
+		while len(self.entries) > self.max_size:
+			self.entries.popitem(last=False)
+			self.changed = True
+
+	def get(self, text, engine):
+		"""
+		Return the news influence of a text for a search engine, None if it is not cached (or too old)
+		"""
+		key = self.key(text, engine)
+		with self.lock:
+			self.load()
+			entry = self.entries.get(key)
+			if entry is not None and time.time() - entry[1] >= self.ttl:
+				del self.entries[key]
+				self.changed = True
+				entry = None
+			if entry is None:
+				self.stats["miss"] += 1
+				return None
+			self.entries.move_to_end(key)
+			self.stats["hit"] += 1
+			return entry[0]
+
+	def put(self, text, engine, score):
+		"""
+		Save the news influence of a text for a search engine
+		"""
+		key = self.key(text, engine)
+		with self.lock:
+			self.load()
+			self.entries[key] = (score, time.time())
+			self.entries.move_to_end(key)
+			self.changed = True
+			self.trim()
+
+	def save(self):
+		"""
+		Write the cache file (atomically), if something changed since it was read
+		"""
+		with self.lock:
+			if not self.changed:
+				return
+			rows = [[text, engine, score, computed] for (text, engine), (score, computed) in self.entries.items()]
+			folder = os.path.dirname(self.path)
+			if folder:
+				os.makedirs(folder, exist_ok=True)
+			tmp_path = f"{self.path}.tmp"
+			with open(tmp_path, "w", encoding="utf-8") as f:
+				json.dump(rows, f, ensure_ascii=False)
+			os.replace(tmp_path, self.path)
+			self.changed = False
+
+	def clear(self):
+		"""
+		Remove all entries (the file is emptied by the next save())
+		"""
+		with self.lock:
+			self.loaded = True
+			self.entries.clear()
+			self.changed = True
+
+	def report(self):
+		"""
+		Return a summary of the use of the cache
+		"""
+		return f"{self.stats['hit']} from cache, {self.stats['miss']} searched, {len(self.entries)} cached"
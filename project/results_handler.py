@@ -38,8 +38,6 @@ class results:
 			self.webpage = self.webpage.replace("{orderl}", order_type)
 			to_replace = "latest_tweets"
 		for tweet in tweets[0:n]:
-			# Recompute the global influence score by averaging tweet and news
-			tweet.influence_score = (tweet.tweet_score + tweet.news_score) / 2
 			# Get action type (Tweet, Retweet, Like or Reply)
 			a_type = tweet.action_type()
 			# Get number of replies, or show that none were scraped
@@ -59,12 +57,13 @@ class results:
 				title = f"""
 					<h2>{a_type} <span>({date_to_str(tweet.date)})</span>, 
 					<a target='_blank' href='{tweet_link}'>link</a>:</h2>"""
+			# The reach score is the influence score: the sum of the tweet and news percentages, so out of 200
 			html += f"""
 				<article>
 					{title}
 					<p>{tweet.text}</p>
 					<i>{tweet.like:,} ❤ {tweet.rt:,} 🔁 {rep} 💬</i>
-					<b>Reach score: {round(tweet.influence_score,1)}% ({round(tweet.tweet_score, 1)}% T + {round(tweet.news_score, 1)}% N)</b>
+					<b>Reach score: {round(tweet.influence_score,1)}/200 ({round(tweet.tweet_score, 1)}% T + {round(tweet.news_score, 1)}% N)</b>
 				</article>
 			"""
 		self.webpage = self.webpage.replace(f"{{{to_replace}}}", html)
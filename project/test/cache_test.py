@@ -0,0 +1,204 @@
+from project import cache as TC
+from project import cache_backends as CB
+from project import tw_elements as TE
+from datetime import datetime, timezone
+import os
+import tempfile
+import unittest
+import unittest.mock
+import pytest
+
+
+def make_tweets(n):
+	tweets = []
+	for i in range(n):
+		date = datetime(2020, 1, 1+i%28, 12, i%60, tzinfo=timezone.utc)
+		liked_by = "someone" if i%3 == 0 else None
+		tweets.append(TE.tweet(str(1000+i), 10*i, i, i%5, f"user{i%4}", date, f"Tweet number {i} ✓", i%2 == 0, i%3 == 1, \
+			i%4 == 2, False, liked_by))
+	return tweets
+
+class test_backends(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.TemporaryDirectory()
+		self.tweets = make_tweets(30)
+
+	def tearDown(self):
+		self.folder.cleanup()
+
+	def check_roundtrip(self, backend):
+		filename = os.path.join(self.folder.name, f"user-feed-1578400000.0.{backend.extension}")
+		backend.write(filename, self.tweets)
+		rows = CB.backend_from_filename(filename).read(filename)
+		self.assertEqual(len(rows), len(self.tweets))
+		c = TC.cache(username="user")
+		for row, tw in zip(rows, self.tweets):
+			new_tw = c.json_to_tweet(row, False)
+			for attr in ["id", "like", "rt", "rep", "username", "date", "text", "from_verified", "is_reply", "is_retweet", "liked_by", "influence_score"]:
+				self.assertEqual(getattr(new_tw, attr), getattr(tw, attr))
+
+	def test_json(self):
+		self.check_roundtrip(CB.backends["json"])
+
+	def test_columnar(self):
+		self.check_roundtrip(CB.backends["columnar"])
+
+	def test_empty(self):
+		for backend in CB.backends.values():
+			entry = backend.save(self.folder.name, "empty", "feed", [], 1578400000.0)
+			self.assertEqual(backend.load(self.folder.name, entry), [])
+
+	def test_convert_rows(self):
+		json_file = os.path.join(self.folder.name, "user-latest-1578400000.0.json")
+		twc_file = os.path.join(self.folder.name, "user-latest-1578400000.0.twc")
+		CB.backends["json"].write(json_file, self.tweets)
+		CB.backends["columnar"].write_rows(twc_file, CB.backends["json"].read(json_file))
+		rows = CB.backends["columnar"].read(twc_file)
+		self.assertEqual([r["text"] for r in rows], [tw.text for tw in self.tweets])
+		self.assertEqual([r["date"] for r in rows], [tw.date for tw in self.tweets])
+		self.assertLess(os.path.getsize(twc_file), os.path.getsize(json_file))
+
+	def test_benchmark(self):
+		results = CB.benchmark(self.tweets, repeat=1)
+		self.assertEqual(set(results.keys()), set(CB.backends.keys()))
+
+class test_manifest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.TemporaryDirectory()
+		self.tweets = make_tweets(10)
+		# Write 3 snapshots of each type, an hour apart
+		for i in range(3):
+			for r_type in ["feed", "latest"]:
+				f_name = os.path.join(self.folder.name, f"user-{r_type}-{1578400000 + 3600*i}.0.twc")
+				CB.backends["columnar"].write(f_name, self.tweets[:5+i])
+
+	def tearDown(self):
+		self.folder.cleanup()
+
+	def test_rebuild(self):
+		c = TC.cache(username="user", folder=self.folder.name)
+		entries = c.manifest.get_entries("latest")
+		self.assertEqual([e[2] for e in entries], [5, 6, 7])
+		self.assertTrue(os.path.exists(c.manifest.path))
+		self.assertEqual(len(c.available_dates(False, "feed")), 3)
+
+	def test_last_before(self):
+		c = TC.cache(username="user", folder=self.folder.name, before_date=datetime.fromtimestamp(1578400000 + 5000))
+		self.assertEqual(c.manifest.last_before("feed", c.before_date)[2], 6)
+		self.assertEqual(c.first_before_date("feed"), datetime.fromtimestamp(1578400000 + 3600))
+		self.assertIsNone(c.manifest.last_before("feed", datetime.fromtimestamp(1578400000)))
+
+	def test_get_cached_decodes_one_file(self):
+		c = TC.cache(username="user", folder=self.folder.name, before_date=datetime.fromtimestamp(1578400000 + 5000))
+		c.manifest.load()
+		read = CB.columnar_backend.read
+		with unittest.mock.patch.object(CB.columnar_backend, "read", autospec=True, side_effect=read) as mock_read:
+			exist, latest = c.get_cached("latest", False)
+			self.assertEqual(mock_read.call_count, 1)
+		self.assertTrue(exist)
+		self.assertEqual(len(latest), 6)
+
+	def test_save_results(self):
+		c = TC.cache(status=1, username="user", folder=self.folder.name)
+		c.manifest.load()
+		c.save_results(TE.actions("user", tweets=self.tweets))
+		self.assertEqual(c.manifest.get_entries("latest")[-1][2], 10)
+		# Reading the manifest again from the disk gives the same entries
+		self.assertEqual(TC.manifest("user", self.folder.name).get_entries("latest"), c.manifest.get_entries("latest"))
+
+	def test_get_all_cached(self):
+		c = TC.cache(username="user", folder=self.folder.name)
+		latest, feed = c.get_all_cached()
+		# Same 7 unique tweets in both types, but some dates are shared
+		self.assertEqual(len(latest), len({tw.date for tw in self.tweets[:7]}))
+		self.assertEqual(len(feed), len(latest))
+
+	def test_get_all_cached_batch(self):
+		c = TC.cache(username="user", folder=self.folder.name)
+		latest, feed = c.get_all_cached_batch()
+		# All 7 unique tweets, oldest first, even the ones with the same date
+		self.assertEqual(sorted(latest.ids), sorted(tw.id for tw in self.tweets[:7]))
+		self.assertEqual(latest.date.tolist(), sorted(latest.date.tolist()))
+		self.assertEqual(len(feed), 7)
+		by_date = {tw.date: tw.id for tw in c.get_all_cached()[0].values()}
+		self.assertTrue(all(by_date[tw.date] in latest.ids for tw in latest))
+
+	def test_iter_snapshots(self):
+		c = TC.cache(username="user", folder=self.folder.name)
+		snapshots = list(c.iter_snapshots(r_types=("feed",)))
+		self.assertEqual([s[0] for s in snapshots], ["feed"] * 3)
+		self.assertEqual([len(s[2]) for s in snapshots], [7, 6, 5])
+
+class test_store(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.TemporaryDirectory()
+		self.tweets = make_tweets(10)
+		self.backend = CB.store_backend()
+
+	def tearDown(self):
+		self.folder.cleanup()
+
+	def test_incremental(self):
+		entry1 = self.backend.save(self.folder.name, "user", "feed", self.tweets, 1578400000.0)
+		size = os.path.getsize(os.path.join(self.folder.name, "user.tweets"))
+		# Only one tweet changed: no new tweet line, and a single metrics record
+		self.tweets[3].like += 7
+		entry2 = self.backend.save(self.folder.name, "user", "feed", self.tweets[:8], 1578403600.0)
+		self.assertEqual(os.path.getsize(os.path.join(self.folder.name, "user.tweets")), size)
+		self.assertEqual(os.path.getsize(os.path.join(self.folder.name, "user.metrics")), 11 * CB.tweet_store.metric_record.itemsize)
+		# Both snapshots can be rebuilt, with the metrics they had at the time
+		rows1, rows2 = self.backend.load(self.folder.name, entry1), self.backend.load(self.folder.name, entry2)
+		self.assertEqual(len(rows1), 10)
+		self.assertEqual(len(rows2), 8)
+		self.assertEqual(rows2[3]["like"], rows1[3]["like"] + 7)
+		self.assertEqual([r["text"] for r in rows2], [tw.text for tw in self.tweets[:8]])
+		self.assertEqual(self.backend.list_snapshots(self.folder.name, "user", {}), [entry1, entry2])
+		history = self.backend.metric_history(self.folder.name, "user", self.tweets[3].id)
+		self.assertEqual([h[1] for h in history], [self.tweets[3].like - 7, self.tweets[3].like])
+
+	def test_roundtrip(self):
+		# The same tweet liked by two users, and influence scores that change without the metrics
+		tweets = self.tweets + [TE.tweet(self.tweets[0].id, self.tweets[0].like, self.tweets[0].rt, self.tweets[0].rep, \
+			self.tweets[0].username, self.tweets[0].date, self.tweets[0].text, True, False, False, False, "someone_else")]
+		rows1 = [CB.tweet_to_row(tw) for tw in tweets]
+		rows2 = [dict(r, influence_score=r["influence_score"] + 1.5) for r in rows1]
+		rows2[4]["influence_score"] = None
+		entry1 = self.backend.save_rows(self.folder.name, "user", "feed", rows1, 1578400000.0)
+		entry2 = self.backend.save_rows(self.folder.name, "user", "feed", rows2, 1578403600.0)
+		for backend in [self.backend, CB.store_backend()]:
+			self.assertEqual(backend.load(self.folder.name, entry1), rows1)
+			self.assertEqual(backend.load(self.folder.name, entry2), rows2)
+		# Only the influence scores changed: the metric history is the same
+		self.assertEqual(len(self.backend.metric_history(self.folder.name, "user", self.tweets[0].id)), 1)
+
+	def test_reload_from_disk(self):
+		entry = self.backend.save(self.folder.name, "user", "latest", self.tweets, 1578400000.0)
+		rows = CB.store_backend().load(self.folder.name, entry)
+		self.assertEqual([r["id"] for r in rows], [tw.id for tw in self.tweets])
+		self.assertEqual([r["date"] for r in rows], [tw.date for tw in self.tweets])
+
+	def test_convert(self):
+		for i in range(3):
+			CB.backends["columnar"].save(self.folder.name, "user", "feed", self.tweets[:5+i], 1578400000.0 + 3600*i)
+		c = TC.cache(username="user", folder=self.folder.name)
+		before = [c.load_snapshot(e) for e in c.manifest.get_entries("feed")]
+		c.convert("store")
+		self.assertEqual(os.listdir(self.folder.name).count("user.snapshots"), 1)
+		self.assertFalse(any(f.endswith(".twc") for f in os.listdir(self.folder.name)))
+		after = [c.load_snapshot(e) for e in c.manifest.get_entries("feed")]
+		self.assertEqual(after, before)
+
+class test_split_latest_feed(unittest.TestCase):
+	def test_window_indices(self):
+		windows = TC.cache.window_indices([5, 0, 11, 3.5], [1, 2, 3, 4, 5, 6], n=3)
+		self.assertEqual(windows.tolist(), [[1, 2, 3], [-1, -1, -1], [3, 4, 5], [0, 1, 2]])
+
+	def test_split(self):
+		tweets = make_tweets(20)
+		latest = {tw.date: tw for tw in tweets[0:20:4]}
+		feed = {tw.date: tw for i, tw in enumerate(tweets) if i%4 != 0}
+		data = TC.cache.split_latest_feed(latest, feed, n=5)
+		self.assertEqual(len(data), 5)
+		for l_tweet, before in data.items():
+			expected = sorted([tw for tw in feed.values() if tw.date < l_tweet.date], key=lambda tw: tw.date)[-5:]
+			self.assertEqual(before, expected)
@@ -0,0 +1,238 @@
+from project import http_handler as HH
+from unittest.mock import patch, MagicMock
+import unittest
+import pytest
+import threading
+import time
+import http.server
+import os
+import tempfile
+
+
+def make_response(status_code=200, headers={}):
+	response = MagicMock()
+	response.status_code = status_code
+	response.headers = headers
+	return response
+
+class test_token_bucket(unittest.TestCase):
+	def test_burst_then_rate(self):
+		limiter = HH.rate_limiter()
+		limiter.limits = {"host": (20, 5)}
+		t0 = time.time()
+		# The 5 first requests go at once, the 5 next ones at 20 per second
+		for i in range(10):
+			limiter.acquire("host")
+			limiter.release("host")
+		dt = time.time() - t0
+		self.assertGreaterEqual(dt, 0.2)
+		self.assertLess(dt, 1)
+
+	def test_one_bucket_per_host(self):
+		limiter = HH.rate_limiter()
+		self.assertIs(limiter.get_bucket("en.wikipedia.org"), limiter.get_bucket("en.wikipedia.org"))
+		self.assertEqual(limiter.get_bucket("api.twitter.com/1.1/friends/list.json").rate, HH.rate_limiter.limits["api.twitter.com"][0])
+		self.assertEqual(limiter.get_bucket("unknown.org").rate, HH.rate_limiter.default_limit[0])
+
+	def test_thread_safe(self):
+		limiter = HH.rate_limiter()
+		limiter.limits = {"host": (1000, 1000)}
+		def run():
+			for i in range(50):
+				limiter.acquire("host")
+				limiter.release("host")
+		threads = [threading.Thread(target=run) for i in range(8)]
+		[t.start() for t in threads]
+		[t.join() for t in threads]
+		self.assertEqual(limiter.get_bucket("host").in_flight, 0)
+
+class test_rate_limit_headers(unittest.TestCase):
+	def test_unknown_budget(self):
+		limiter = HH.rate_limiter()
+		limiter.acquire("e")
+		self.assertEqual(limiter.release("e", make_response()), None)
+
+	def test_keep_lowest(self):
+		limiter = HH.rate_limiter()
+		reset = str(int(time.time()) + 900)
+		for remaining in ["50", "48", "49"]:
+			limiter.acquire("e")
+			limiter.release("e", make_response(headers={"x-rate-limit-remaining": remaining, "x-rate-limit-reset": reset}))
+		self.assertEqual(limiter.remaining("e"), 48)
+		self.assertEqual(limiter.get_bucket("e").in_flight, 0)
+
+	def test_wait_for_reset(self):
+		limiter = HH.rate_limiter()
+		limiter.get_bucket("e").reserve = 2
+		reset = int(time.time()) + 2
+		limiter.acquire("e")
+		limiter.release("e", make_response(headers={"x-rate-limit-remaining": "3", "x-rate-limit-reset": str(reset)}))
+		# One request is still allowed, the next one has to wait for the reset of the interval
+		limiter.acquire("e")
+		self.assertLess(time.time(), reset)
+		limiter.acquire("e")
+		self.assertGreaterEqual(time.time(), reset)
+
+	def test_retry_after(self):
+		limiter = HH.rate_limiter()
+		limiter.acquire("e")
+		limiter.release("e", make_response(429, {"Retry-After": "1"}))
+		t0 = time.time()
+		limiter.acquire("e")
+		self.assertGreaterEqual(time.time() - t0, 0.9)
+
+	def test_adaptive_backoff(self):
+		bucket = HH.token_bucket(10, 10)
+		backoffs = []
+		for i in range(4):
+			bucket.update(0, make_response(429))
+			backoffs.append(bucket.backoff)
+		self.assertEqual(backoffs, [0.5, 1, 2, 4])
+		bucket.update(0, make_response(200))
+		self.assertEqual(bucket.backoff, 2)
+
+class test_get(unittest.TestCase):
+	def test_retry_on_429(self):
+		responses = [make_response(429), make_response(200)]
+		with patch.object(HH.session, "get", side_effect=responses) as mock_get:
+			response = HH.get("https://retry.test/page", timeout=(61, 121))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(mock_get.call_count, 2)
+		mock_get.assert_called_with("https://retry.test/page", timeout=(61, 121))
+
+	def test_give_up(self):
+		with patch.object(HH.session, "get", return_value=make_response(429)) as mock_get:
+			response = HH.get("https://overloaded.test", retries=1)
+		self.assertEqual(response.status_code, 429)
+		self.assertEqual(mock_get.call_count, 2)
+
+	def test_failed_request(self):
+		with patch.object(HH.session, "get", side_effect=ConnectionError):
+			with pytest.raises(ConnectionError):
+				HH.get("https://down.test")
+		self.assertEqual(HH.limiter.get_bucket("down.test").in_flight, 0)
+
+class keep_alive_handler(http.server.BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+
+	requests = []
+
+	def do_GET(self):
+		self.requests.append((self.path, self.headers.get("If-None-Match")))
+		if self.path.startswith("/etag") and self.headers.get("If-None-Match") == '"v1"':
+			self.send_response(304)
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+		body = b"ok"
+		status = {"/missing": 404, "/down": 503, "/busy": 429}.get(self.path, 200)
+		self.send_response(status)
+		self.send_header("Content-Length", str(len(body)))
+		self.send_header("Set-Cookie", "session=1")
+		if self.path.startswith("/etag"):
+			self.send_header("ETag", '"v1"')
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+class test_session(unittest.TestCase):
+	def setUp(self):
+		self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), keep_alive_handler)
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+	def test_connection_reuse(self):
+		session = HH.make_session(pool_size=4)
+		for i in range(10):
+			self.assertEqual(session.get(self.url).text, "ok")
+		self.assertEqual(HH.connection_stats(session), {"127.0.0.1": (1, 10)})
+		self.assertEqual(HH.connection_report(session), "10 requests over 1 connections (9 handshakes saved)")
+
+	def test_pool_size(self):
+		session = HH.make_session(pool_size=4)
+		def run():
+			for i in range(5):
+				session.get(self.url)
+		threads = [threading.Thread(target=run) for i in range(4)]
+		[t.start() for t in threads]
+		[t.join() for t in threads]
+		connections, n_requests = HH.connection_stats(session)["127.0.0.1"]
+		self.assertEqual(n_requests, 20)
+		self.assertLessEqual(connections, 4)
+
+	def test_no_cookies_kept(self):
+		session = HH.make_session()
+		session.get(self.url)
+		self.assertEqual(len(session.cookies), 0)
+
+class test_response_cache(unittest.TestCase):
+	def setUp(self):
+		keep_alive_handler.requests = []
+		self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), keep_alive_handler)
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+		self.folder = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		self.folder.cleanup()
+
+	def test_fresh_hit(self):
+		cache = HH.response_cache(self.folder.name)
+		for i in range(3):
+			response = HH.get(self.url + "/page", params={"q": "a b"}, cache=cache)
+			self.assertEqual(response.text, "ok")
+		self.assertEqual(len(keep_alive_handler.requests), 1)
+		self.assertEqual(cache.stats, {"hit": 2, "revalidated": 0, "miss": 1})
+		# Other parameters are another request
+		HH.get(self.url + "/page", params={"q": "c"}, cache=cache)
+		self.assertEqual(len(keep_alive_handler.requests), 2)
+
+	def test_revalidate(self):
+		cache = HH.response_cache(self.folder.name, ttl=0)
+		HH.get(self.url + "/etag", cache=cache)
+		response = HH.get(self.url + "/etag", cache=cache)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.text, "ok")
+		self.assertEqual(keep_alive_handler.requests, [("/etag", None), ("/etag", '"v1"')])
+		self.assertEqual(cache.stats["revalidated"], 1)
+
+	def test_content_addressed(self):
+		cache = HH.response_cache(self.folder.name)
+		HH.get(self.url + "/a", cache=cache)
+		HH.get(self.url + "/b", cache=cache)
+		# Same body for both urls: stored once
+		self.assertEqual(len(os.listdir(os.path.join(self.folder.name, "index"))), 2)
+		self.assertEqual(len(os.listdir(os.path.join(self.folder.name, "objects"))), 1)
+
+	def test_offline(self):
+		HH.get(self.url + "/page", cache=HH.response_cache(self.folder.name, ttl=0))
+		cache = HH.response_cache(self.folder.name, ttl=0, offline=True)
+		with patch.object(HH.session, "get", side_effect=AssertionError("no network in offline mode")):
+			self.assertEqual(HH.get(self.url + "/page", cache=cache).text, "ok")
+			with pytest.raises(ConnectionError):
+				HH.get(self.url + "/other", cache=cache)
+
+	def test_errors(self):
+		cache = HH.response_cache(self.folder.name)
+		for path in ["/missing", "/down", "/busy"]:
+			HH.get(self.url + path, retries=0, cache=cache)
+		# A 404 is final, a 5xx is downloaded again when online, and a 429 is never cached
+		self.assertEqual(HH.get(self.url + "/missing", cache=cache).status_code, 404)
+		self.assertEqual(HH.get(self.url + "/down", cache=cache).status_code, 503)
+		self.assertEqual([r[0] for r in keep_alive_handler.requests], ["/missing", "/down", "/busy", "/down"])
+		self.assertEqual(len(os.listdir(os.path.join(self.folder.name, "index"))), 2)
+		# The offline mode replays the errors, like the first run got them
+		cache = HH.response_cache(self.folder.name, offline=True)
+		with patch.object(HH.session, "get", side_effect=AssertionError("no network in offline mode")):
+			self.assertEqual(HH.get(self.url + "/missing", cache=cache).status_code, 404)
+			self.assertEqual(HH.get(self.url + "/down", cache=cache).status_code, 503)
+			with pytest.raises(ConnectionError):
+				HH.get(self.url + "/busy", cache=cache)
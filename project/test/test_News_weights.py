@@ -7,35 +7,64 @@ Executes unit tests for most functions that do not require online access.
 List of functions that are tested per module:
     - NewsSite.py
         > NewsSite.gen_flags(), NewsSite.check_flag(flag),
-        > NewsSite.remove_page(), NewsSite.gen_json_str()
+        > NewsSite.remove_page()
         > All set_{variable}() functions of class NewsSite
         > All operator overloading of class NewsSite
 
     - webhandling.py
-        > create_wiki_link(art_title)
-        > get_webpage_html_str(url)
+        > create_wiki_link(art_title), get_wiki_page(art_title)
+        > resolve_wiki_titles(art_titles), get_webpage_html_str(url), get_webpage_bytes(url)
+
+    - extracthandling.py
+        > PageInfo(page), find_wiki_date(page), newspaper_titles(page), tvchannel_titles(page), report()
 
     - queuehandling.py
-        > filter_newssites(q_newssites)
+        > filter_newssites(q_newssites), NewsSite.dedup_key()
         > split_bypass(q_newssites, flag)
         > merge_bypass(q_newssites, q_bypass_
 
     - multithreading.py
         > QueueThread.thread_runner(...)
+        > WorkerPool.submit(...), WorkerPool.join(), PoolStage.join()
+
+    - filehandling.py
+        > ReachIndex.get_dict(engine), ReachIndex.refresh()
+
+    - dumphandling.py
+        > write_dump(newssites, num), DumpReader, read_dump(num), convert_json(num)
+        > NewsSite.to_record(fields), NewsSite.from_record(record)
+
+    - stagehandling.py
+        > encode(obj), decode(obj), StageJournal
+        > The Google names stage (namefinders.find_name) with a StageJournal
+
+    - pipelinehandling.py
+        > Stage, Deduplicator, NameMerger, Pipeline.run(q_newssites), Pipeline.get_readers_dict(q_newssites)
 """
 
 import unittest
+import unittest.mock
 from unittest.mock import patch
 
+from project.News_weights import dumphandling as dh
+from project.News_weights import extracthandling as eh
 from project.News_weights import filehandling as fh
 from project.News_weights import multithreading as mt
 from project.News_weights import namefinders as nf
+from project.News_weights import pipelinehandling as ph
 from project.News_weights.NewsSite import NewsSite
 from project.News_weights import queuehandling as qh
+from project.News_weights import stagehandling as sh
 from project.News_weights import webhandling as wh
 
+import datetime as dt
+import json
+import os
 import queue
 import random
+import tempfile
+import threading
+import time
 
 
 class TestNewsSite(unittest.TestCase):
@@ -160,9 +189,6 @@ class TestNewsSite(unittest.TestCase):
             'ggl_name': True,
             'bng_name': True
         }
-        self.refjson_bng1 = '{\n    "bng_name": "bng1",\n    "country": "country1",\n    "ggl_name": "ggl1",\n    '\
-                            '"name": "bng1",\n    "page": null,\n    "readers": 12340,\n    "tempreaders": 1234,\n    '\
-                            '"tpe": "pp",\n    "wiki_date": null,\n    "wiki_url": null\n}'
 
     def tearDown(self) -> None:
         """
@@ -213,6 +239,14 @@ class TestNewsSite(unittest.TestCase):
         self.assertEqual(self.newssite_bng3.flags, self.refflags_bng)
         self.assertEqual(self.newssite_bng4.flags, self.refflags_bng)
 
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            self.newssite_base1.something = 'string'
+
+        self.newssite_base1.country = 'country'                 # The flags follow the variables
+        self.assertTrue(self.newssite_base1.check_flag('country'))
+        self.assertTrue(self.newssite_base1.flags['country'])
+
     def test_comp(self):
         self.assertEqual(self.newssite_base1 == self.newssite_base1, True)
         self.assertEqual(self.newssite_base1 == self.newssite_bng1, False)
@@ -293,6 +327,14 @@ class TestNewsSite(unittest.TestCase):
         self.assertIsNone(self.newssite_base1.page)
         self.assertIsNone(self.newssite_base2.page)
 
+        with self.assertRaises(TypeError):
+            self.newssite_base1.set_info('string')
+        self.newssite_base1.set_info(eh.PageInfo(b'<footer>This page was last edited on 1 May 2020</footer>'))
+        self.newssite_base1.acquire_wiki_date()
+        self.assertEqual(self.newssite_base1.wiki_date, '01 May 2020')
+        self.newssite_base1.remove_page()
+        self.assertIsNone(self.newssite_base1.info)
+
     def test_check_flag(self):
         with self.assertRaises(TypeError):
             self.newssite_base1.check_flag(1234)
@@ -317,10 +359,6 @@ class TestNewsSite(unittest.TestCase):
         self.assertTrue(self.newssite_bng1.check_flag('ggl_name'))
         self.assertTrue(self.newssite_bng1.check_flag('bng_name'))
 
-    def test_gen_json_str(self):
-        json_str = self.newssite_bng1.gen_json_str()
-        self.assertEqual(json_str, self.refjson_bng1)
-
 
 class TestWebhandling(unittest.TestCase):
     def setUp(self) -> None:
@@ -366,15 +404,16 @@ class TestWebhandling(unittest.TestCase):
             wh.create_wiki_link(('string',))
 
     def test_get_webpage_html_str_succes(self):
-        with patch('project.News_weights.wh.rq.get') as mock_get:
+        with patch('project.http_handler.session.get') as mock_get:
             mock_get.return_value.status_code = 200
-            mock_get.return_value.content = 'succes'
+            mock_get.return_value.content = b'succes'
 
             self.assertEqual(wh.get_webpage_html_str(self.wiki_good1), 'succes')
+            self.assertEqual(wh.get_webpage_bytes(self.wiki_good1), b'succes')
             mock_get.assert_called_with(self.wiki_good1, timeout=(61, 121))
 
     def test_get_webpage_html_str_notfound(self):
-        with patch('project.News_weights.wh.rq.get') as mock_get:
+        with patch('project.http_handler.session.get') as mock_get:
             mock_get.return_value.status_code = 404
             mock_get.return_value.content = 'not found'
 
@@ -383,7 +422,7 @@ class TestWebhandling(unittest.TestCase):
                 mock_get.assert_called_with(self.wiki_bad1, timeout=(61, 121))
 
     def test_get_webpage_html_str_toomany(self):
-        with patch('project.News_weights.wh.rq.get') as mock_get:
+        with patch('project.http_handler.session.get') as mock_get:
             mock_get.return_value.status_code = 429
             mock_get.return_value.content = 'too many requests'
 
@@ -391,13 +430,161 @@ class TestWebhandling(unittest.TestCase):
                 wh.get_webpage_html_str('https://overloaded.com')
                 mock_get.assert_called_with('https://overloaded.com', timeout=(61, 121))
 
+    def test_get_wiki_page(self):
+        with patch('project.http_handler.session.get') as mock_get:
+            mock_get.return_value.status_code = 200
+            mock_get.return_value.content = b'succes'
+
+            self.assertEqual(wh.get_wiki_page(self.wiki_good1), (self.wiki_link1, 'succes'))
+            mock_get.assert_called_once_with(self.wiki_link1, timeout=(61, 121))
+
+            mock_get.return_value.status_code = 404
+            with self.assertRaises(ValueError):
+                wh.get_wiki_page(self.wiki_bad1)
+
+    def test_resolve_wiki_titles(self):
+        def api_reply(url, params, timeout):
+            # Titles ending with a 'k' exist, names are normalised with a capital first letter
+            titles = params['titles'].split('|')
+            reply = unittest.mock.MagicMock()
+            reply.status_code = 200
+            reply.json.return_value = {'query': {
+                'normalized': [{'from': t, 'to': t[0].upper() + t[1:]} for t in titles if t[0].islower()],
+                'pages': {str(-i): {'title': t[0].upper() + t[1:], **({} if t.endswith('k') else {'missing': ''})}
+                          for i, t in enumerate(titles)}
+            }}
+            return reply
+
+        titles = [f'title {i}' + ('k' if i % 3 == 0 else '') for i in range(120)] + [self.wiki_good2]
+        with patch('project.http_handler.session.get', side_effect=api_reply) as mock_get:
+            links = wh.resolve_wiki_titles(titles + titles[:10])
+            self.assertEqual(mock_get.call_count, 3)     # 121 unique titles, 50 per request
+        self.assertEqual(links['title 0k'], 'https://en.wikipedia.org/wiki/title_0k')
+        self.assertIsNone(links['title 1'])
+        self.assertIsNone(links[self.wiki_good2])
+        self.assertEqual(len([link for link in links.values() if link is not None]), 40)
+
+        with self.assertRaises(TypeError):
+            wh.resolve_wiki_titles(['string', 1234])
+
     def test_get_webpage_html_str_TypeHandle(self):
-        with patch('project.News_weights.wh.rq.get') as mock_get:
+        with patch('project.http_handler.session.get') as mock_get:
             with self.assertRaises(TypeError):
                 wh.get_webpage_html_str(1234)
                 wh.get_webpage_html_str((self.wiki_bad2,))
 
 
+class TestExtracthandling(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create some (shortened) wikipedia pages
+        """
+        self.newspaper = (b'<html><body><p>Founded in 1900, read by 12,000 people.</p>'
+                          b'<table class="infobox vcard"><tr><th scope="row" class="infobox-label">Country</th>'
+                          b'<td class="infobox-data"><a href="/wiki/France">France</a></td></tr>'
+                          b'<tr><td><table><tr><td>Nested table</td></tr></table></td></tr>'
+                          b'<tr><th class="infobox-label">Circulation</th><td class="infobox-data">2019: '
+                          b'1,234,567</td></tr></table>'
+                          b'<p>Its circulation was about 99,000 copies in 1990.</p>'
+                          b'<footer><ul><li id="footer-info-lastmod"> This page was last edited on 5 March 2021, '
+                          b'at 10:14</li></ul></footer></body></html>')
+        self.tvchannel = (b'<html><body><table class="infobox"><tr><th>Country</th><td>Qatar</td></tr>'
+                          b'<tr><th>Audience share</th><td>12.5%</td></tr></table>'
+                          b'<footer> This page was last edited on 21 December 2020</footer></body></html>')
+        self.no_infobox = (b'<html><body><p>The paper sells 45.000 copies, and reached 2 million viewers.</p>'
+                           b'</body></html>')
+
+    def tearDown(self) -> None:
+        """
+        Remove everything created by setUp() as cleanup
+        """
+        del self.newspaper
+        del self.tvchannel
+        del self.no_infobox
+
+    def test_PageInfo_newspaper(self):
+        info = eh.PageInfo(self.newspaper)
+        self.assertEqual(info.country, ['France'])
+        self.assertEqual(info.wiki_date, '05 March 2021')
+        self.assertEqual(info.newspaper_readers(), 1234567)     # The infobox comes before the text
+
+    def test_PageInfo_tvchannel(self):
+        info = eh.PageInfo(self.tvchannel.decode())
+        self.assertEqual(info.country, ['Qatar'])
+        self.assertEqual(info.wiki_date, '21 December 2020')
+        self.assertEqual(info.tvchannel_viewers(1000), 12500)
+
+    def test_PageInfo_text(self):
+        info = eh.PageInfo(self.no_infobox)
+        self.assertEqual((info.country, info.wiki_date), ([], None))
+        self.assertEqual(info.newspaper_readers(), 45000)
+        self.assertEqual(info.tvchannel_viewers(1000), 2 * 10 ** 6)
+        self.assertIsNone(eh.PageInfo(b'').newspaper_readers())
+
+        with self.assertRaises(TypeError):
+            eh.PageInfo(1234)
+
+    def test_compact(self):
+        info = eh.PageInfo(self.newspaper).compact('pp')
+        self.assertIsNone(info.page)
+        self.assertEqual(info.newspaper_readers(), 1234567)
+
+        info = eh.PageInfo(self.no_infobox).compact('pp')      # The text is scanned before the page is dropped
+        self.assertEqual((info.page, info.newspaper_readers()), (None, 45000))
+        info = eh.PageInfo(self.no_infobox).compact('tv')
+        self.assertEqual(info.tvchannel_viewers(1000), 2 * 10 ** 6)
+        self.assertEqual(eh.PageInfo(self.tvchannel).compact('tv').tvchannel_viewers(1000), 12500)
+
+    def test_tasks_drop_pages(self):
+        cntry_dict = {'Qatar': {'TV': 1000, 'pop': 2000, 'Internet': 500}}
+        newssite = NewsSite('Al Jazeera', 'tv')
+        newssite.set_wiki_url('https://en.wikipedia.org/wiki/Al_Jazeera')
+        with patch.object(mt.wh, 'get_webpage_bytes', return_value=self.tvchannel) as get_page:
+            self.assertEqual(mt.tvchannels_task(newssite, cntry_dict), (newssite, False))
+            self.assertEqual((newssite.country, newssite.wiki_date), ('Qatar', '21 December 2020'))
+            self.assertIsNone(newssite.page)                    # Only the extracted information is kept
+            self.assertIsNone(newssite.info.page)
+
+            self.assertEqual(mt.tempreaders_task(newssite, cntry_dict)[0], (newssite,))
+            self.assertEqual(get_page.call_count, 1)            # Not downloaded again
+        self.assertEqual(newssite.tempreaders, 12500)
+        self.assertIsNone(newssite.info)
+
+    def test_infobox(self):
+        box = eh.infobox(self.newspaper)
+        self.assertTrue(box.startswith(b'class="infobox') and box.endswith(b'</table>'))
+        self.assertIn(b'Circulation', box)                      # After the nested table
+        self.assertNotIn(b'copies', box)
+        self.assertEqual(eh.infobox(self.no_infobox), b'')
+
+    def test_find_wiki_date(self):
+        self.assertEqual(eh.find_wiki_date(self.newspaper), '05 March 2021')
+        self.assertEqual(eh.find_wiki_date(self.no_infobox), dt.datetime.now().strftime('%d %B %Y'))
+        # A footer date datetime cannot read is unknown, instead of failing the whole page
+        page = b'<p>This page was last edited on 5 Marzo 2021, at 10:00</p>'
+        self.assertIsNone(eh.PageInfo(page).wiki_date)
+        self.assertEqual(eh.find_wiki_date(page), dt.datetime.now().strftime('%d %B %Y'))
+
+    def test_titles(self):
+        newspapers = b'<li><i><a href="/wiki/Le_Monde" title="Le Monde">Le Monde</a></i></li>' \
+                     b'<li><i><a href="/wiki/Lib%C3%A9ration">Lib</a></i></li>'
+        self.assertEqual(eh.newspaper_titles(newspapers), ['Le Monde', 'Libération'])
+        # Non-ASCII hrefs are decoded to the page names the API knows
+        newspapers = b'<li><i><a href="/wiki/List%C3%ADn_Diario">LD</a></i></li>' \
+                     b'<li><i><a href="/wiki/%D0%98%D0%B7%D0%B2%D0%B5%D1%81%D1%82%D0%B8%D1%8F">I</a></i></li>' \
+                     b'<li><i><a href="/wiki/AT%26T_News">ATT</a></i></li>'
+        self.assertEqual(eh.newspaper_titles(newspapers), ['Listín Diario', 'Известия', 'AT&T News'])
+
+        channels = '<table><tr>\n<td><a href="/wiki/Al_Jazeera" title="Al Jazeera">AJ</a></td>\n</tr>' \
+                   '<tr>\n<td>No link</td>\n</tr><tr>\n<td><a title="Fox &amp; Friends">F</a></td>\n</tr></table>'
+        self.assertEqual(eh.tvchannel_titles(channels), ['Al Jazeera', 'Fox & Friends'])
+
+    def test_report(self):
+        eh.PageInfo(self.newspaper)
+        self.assertIn('infobox: ', eh.report())
+        self.assertIn('footer: ', eh.report())
+
+
 class TestQueuehandling(unittest.TestCase):
     def setUp(self) -> None:
         """
@@ -556,6 +743,24 @@ class TestQueuehandling(unittest.TestCase):
             self.assertEqual(self.result4[flag], count_dict[flag])
         self.assertEqual(len(relevant4), self.result4['total'] - self.result4['double'])
 
+    def test_filter_newssites_key(self):
+        newssites = [NewsSite('test', 'pp') for _ in range(4)]
+        [newssite.set_country('country') for newssite in newssites]
+        newssites[1].wiki_date = '01 January 2020'          # Newer page
+        newssites[2].wiki_date = '01 January 2019'
+        newssites[2].set_readers(10)                        # More flags
+        newssites[3].wiki_date = '01 January 2019'
+        newssites[3].set_readers(10)                        # Equal to the one before, the first one is kept
+        q_newssites = queue.Queue()
+        [q_newssites.put((newssite,)) for newssite in newssites]
+
+        # No page is downloaded for the NewsSites without a date
+        with patch.object(NewsSite, 'acquire_wiki_date', side_effect=AssertionError('download')):
+            q_newssites_new, relevant = qh.filter_newssites(q_newssites, get_relevant=True)
+        self.assertIs(relevant['test'], newssites[2])
+        self.assertEqual(newssites[2].dedup_key(), (2, dt.date(2019, 1, 1).toordinal(), 10))
+        self.assertEqual(newssites[0].dedup_key(), (1, 0, -1))
+
     def test_split_bypass_c(self):
         q_newssites2_c, q_bypass2_c = qh.split_bypass(self.q_newssites2, 'country')
         self.assertEqual(q_newssites2_c.qsize(), self.result2['total'] - self.result2['country'])
@@ -754,5 +959,631 @@ class TestMultithreading(unittest.TestCase):
             i += 1
 
 
+    def test_WorkerPool_limit(self):
+        worker_pool = mt.WorkerPool(8)
+        stage = worker_pool.stage('limited', limit=2)
+        lock, running, most = threading.Lock(), [0], [0]
+
+        def task(num: int) -> int:
+            with lock:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            time.sleep(0.002)
+            with lock:
+                running[0] -= 1
+            return num
+
+        results = []
+        [worker_pool.submit(stage, task, (i,), callback=results.append) for i in range(20)]
+        self.assertTrue(stage.join(10))
+        self.assertEqual(sorted(results), list(range(20)))
+        self.assertLessEqual(most[0], 2)
+        self.assertEqual((stage.submitted, stage.done, stage.failed), (20, 20, 0))
+        self.assertGreater(stage.throughput(), 0)
+        worker_pool.close()
+
+    def test_WorkerPool_requeue(self):
+        worker_pool = mt.WorkerPool(2, max_retries=3, backoff=0.001)
+        stage = worker_pool.stage('refused')
+        attempts, results, errors = [], [], []
+
+        def task(succeed_after: int) -> int:
+            attempts.append(succeed_after)
+            if attempts.count(succeed_after) <= succeed_after:
+                raise ConnectionRefusedError('429')
+            return succeed_after
+
+        worker_pool.submit(stage, task, (2,), callback=results.append, errback=errors.append)
+        worker_pool.submit(stage, task, (5,), callback=results.append, errback=errors.append)
+        worker_pool.join()
+        self.assertEqual(results, [2])                          # Requeued twice, then done
+        self.assertEqual([type(error) for error in errors], [ConnectionRefusedError])   # Too many retries
+        self.assertEqual((stage.done, stage.failed, stage.requeued), (1, 1, 5))
+        worker_pool.close()
+
+    def test_QueueThread_refused(self):
+        worker_pool = mt.WorkerPool(4, max_retries=1, backoff=0.001)
+        refused = []
+
+        def task(num: int, const: int, const_text: str):
+            if num == 3 and not refused:
+                refused.append(num)
+                raise ConnectionRefusedError('429')
+            return self.task_single_exiter(num, const, const_text)
+
+        # A refused input value does not stop the other ones, and is processed again after a backoff
+        result = mt.QueueThread.thread_runner(self.input_queue_single, task, self.args, worker_pool=worker_pool)
+        self.assertEqual([item[0] for item in result.queue], [i + self.args[0] for i in range(20)])
+        worker_pool.close()
+
+
+class TestFilehandling(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create a small reach csv file to index
+        """
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'News_reach2.csv')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('ggl_name,bng_name,reach\n')
+            f.write('Paper~ Online,Paper,100\n')
+            f.write('Paper~ Online,#,200\n')
+            f.write('#,Channel,50\n')
+
+    def tearDown(self) -> None:
+        """
+        Remove the temporary reach file
+        """
+        self.tempdir.cleanup()
+        del self.tempdir
+        del self.path
+
+    def test_ReachIndex_get_dict(self):
+        index = fh.ReachIndex(self.path)
+        self.assertEqual(index.get_dict('g')['Paper, Online'], 200)
+        self.assertEqual(index.get_dict('bing')['Paper'], 100)
+        self.assertEqual(index.get_dict('B')['Channel'], 50)
+        self.assertNotIn('Channel', index.get_dict('google'))
+
+        with self.assertRaises(ValueError):
+            index.get_dict('yahoo')
+
+    def test_ReachIndex_refresh(self):
+        index = fh.ReachIndex(self.path)
+        with patch('project.News_weights.fh.read_reach_file', wraps=fh.read_reach_file) as mock_read:
+            index.get_dict('g')
+            index.get_dict('b')
+            self.assertEqual(mock_read.call_count, 1)
+
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('New Paper,#,10\n')
+            os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 10**9))
+
+            self.assertEqual(index.get_dict('g')['New Paper'], 10)
+            self.assertEqual(mock_read.call_count, 2)
+
+    def test_ReachIndex_missing(self):
+        index = fh.ReachIndex(os.path.join(self.tempdir.name, 'missing.csv'))
+        with self.assertRaises(FileNotFoundError):
+            index.get_dict('g')
+
+
+class TestDumphandling(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create some NewsSites and a temporary folder for the dumps
+        """
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.tempdir.name, 'News_weights', 'data')
+        os.makedirs(self.folder)
+        self.cwd = os.getcwd()
+        os.chdir(self.tempdir.name)
+
+        self.newssites = []
+        for i in range(10):
+            newssite = NewsSite(f'test{i}', 'pp' if i % 2 else 'tv')
+            newssite.wiki_url = f'https://en.wikipedia.org/wiki/test{i}'
+            newssite.set_country(f'country{i % 3}')
+            newssite.wiki_date = '01 January 2020'
+            self.newssites.append(newssite)
+
+    def tearDown(self) -> None:
+        """
+        Remove the temporary folder
+        """
+        os.chdir(self.cwd)
+        self.tempdir.cleanup()
+        del self.tempdir
+        del self.newssites
+
+    def test_round_trip(self):
+        self.newssites[0].set_page('<html>test</html>')
+        self.newssites[1].set_readers(1000)
+        self.assertEqual(dh.write_dump(self.newssites, 1, mainpy=False), 10)
+        with open(dh.get_dump_path(1, mainpy=False), encoding='utf-8') as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 10)
+        self.assertNotIn('page', lines[0])                  # The page is not written
+        self.assertNotIn('readers', lines[0])               # Neither are the variables that are not set
+
+        newssites = list(dh.read_dump(1, mainpy=False))
+        self.assertEqual([newssite.__dict__() for newssite in newssites[1:]],
+                         [newssite.__dict__() for newssite in self.newssites[1:]])
+        self.assertIsNone(newssites[0].page)
+        self.assertEqual(newssites[1].readers, 1000)
+        self.assertTrue(newssites[1].check_flag('readers'))
+
+        with self.assertRaises(TypeError):
+            dh.write_dump(self.newssites + ['test'], 1, mainpy=False)
+        self.assertEqual(len(list(dh.read_dump(1, mainpy=False))), 10)  # The failed write did not touch the dump
+
+    def test_deltas(self):
+        dh.write_dump(self.newssites, 1, mainpy=False)
+        [newssite.set_tempreaders(i) for i, newssite in enumerate(self.newssites)]
+        dh.write_dump(self.newssites, 2, mainpy=False)
+        [newssite.set_ggl_name(newssite.name.upper()) for newssite in self.newssites[:5]]
+        dh.write_dump(self.newssites[:5], 3, mainpy=False)
+        [newssite.set_bng_name(newssite.name.title()) for newssite in self.newssites[5:]]
+        dh.write_dump(self.newssites[5:], 4, mainpy=False)
+
+        with open(dh.get_dump_path(3, mainpy=False), encoding='utf-8') as f:
+            self.assertEqual(json.loads(f.readline()), {'name': 'test0', 'tpe': 'tv', 'ggl_name': 'TEST0'})
+
+        with dh.read_dump(3, mainpy=False) as reader:
+            self.assertEqual(len(reader), 5)
+            newssite = reader[2]
+            self.assertEqual((newssite.country, newssite.tempreaders, newssite.ggl_name), ('country2', 2, 'TEST2'))
+            self.assertIsNone(newssite.bng_name)
+
+        newssites = list(dh.read_dump(4, mainpy=False))
+        self.assertEqual([newssite.bng_name for newssite in newssites], [f'Test{i}' for i in range(5, 10)])
+        self.assertEqual([newssite.tempreaders for newssite in newssites], list(range(5, 10)))
+        self.assertTrue(all(newssite.ggl_name is None for newssite in newssites))
+
+    def test_lazy_reader(self):
+        dh.write_dump(self.newssites, 5, mainpy=False)
+        with patch.object(dh.NewsSite, 'from_record', wraps=NewsSite.from_record) as from_record:
+            with dh.read_dump(5, mainpy=False) as reader:
+                self.assertEqual(len(reader), 10)
+                self.assertEqual(from_record.call_count, 0)     # Nothing is built before it is asked for
+                self.assertEqual(reader[7].name, 'test7')
+                self.assertEqual(from_record.call_count, 1)
+                self.assertEqual(reader.find('test3', 'pp')['country'], 'country0')
+                self.assertIsNone(reader.find('test3', 'tv'))
+
+        dh.write_dump([], 5, mainpy=False)
+        with dh.read_dump(5, mainpy=False) as reader:
+            self.assertEqual(list(reader), [])
+
+    def test_convert_json(self):
+        [newssite.set_tempreaders(i) for i, newssite in enumerate(self.newssites)]
+        self.newssites[3].set_ggl_name('Test 3')
+        self.newssites[4].wiki_date = None
+        legacy = [{**newssite.__dict__(), 'page': None} for newssite in self.newssites]     # The old json format
+        with open('News_weights/data/NewsSiteDump5.json', 'w', encoding='utf-8') as f:
+            json.dump(legacy, f, ensure_ascii=False, indent=4)
+
+        # The dump has the same fields as the old json dump, wiki_date included
+        self.assertEqual(dh.convert_json(5, mainpy=False), 10)
+        with dh.read_dump(5, mainpy=False) as reader:
+            self.assertEqual(len(reader), len(legacy))
+            for idx, json_dict in enumerate(legacy):
+                record = reader.record(idx)
+                for field in NewsSite.record_fields:
+                    self.assertEqual(record.get(field), json_dict[field], f'{field} of {json_dict["name"]}')
+
+    def test_pipeline_from_dump(self):
+        for newssite in self.newssites:
+            newssite.set_tempreaders(1)
+            newssite.set_ggl_name(newssite.name)
+            newssite.set_bng_name(newssite.name)
+        dh.write_dump(self.newssites, 5, mainpy=False)
+
+        with patch.object(ph.mt, 'newspapers_input', return_value=queue.Queue()), \
+                patch.object(ph.mt, 'tvchannels_input', return_value=queue.Queue()), \
+                dh.read_dump(5, mainpy=False) as previous:
+            q_result = ph.Pipeline({}, dump_interval=3600, mainpy=False).run(previous)
+
+        result = sorted((newssite.name for (newssite,) in list(q_result.queue)), key=lambda name: int(name[4:]))
+        self.assertEqual(result, [f'test{i}' for i in range(10)])
+
+    def test_write_to_json(self):
+        q_newssites = queue.Queue()
+        [q_newssites.put((newssite,)) for newssite in self.newssites]
+        q_newssites = fh.write_to_json(q_newssites, 5, mainpy=False)
+        self.assertEqual(q_newssites.qsize(), 10)
+        with dh.read_dump(5, mainpy=False) as reader:
+            self.assertEqual([newssite.name for newssite in reader], [f'test{i}' for i in range(10)])
+
+
+class TestStagehandling(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create a temporary journal folder and some NewsSites
+        """
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.newssites = []
+        for i in range(20):
+            newssite = NewsSite(f'test{i}', 'pp' if i % 2 else 'tv')
+            newssite.set_country(f'country{i % 3}')
+            newssite.set_tempreaders(1000 * i)
+            newssite.wiki_date = '01 January 2020'
+            self.newssites.append(newssite)
+
+    def tearDown(self) -> None:
+        """
+        Remove the temporary journals
+        """
+        self.tempdir.cleanup()
+        del self.tempdir
+        del self.newssites
+
+    def test_encode_decode(self):
+        item = ((self.newssites[3],), ('country0', 3000))
+        decoded = sh.decode(json.loads(json.dumps(sh.encode(item))))
+        self.assertEqual(decoded, item)
+
+        with self.assertRaises(TypeError):
+            sh.encode({'a': 1})
+
+    def test_keys(self):
+        journal = sh.StageJournal('test', folder=self.tempdir.name)
+        keys = journal.keys([(self.newssites[0],), ('a', 'b'), (self.newssites[0],)])
+        self.assertEqual(keys, ['tv:country0:test0', 'a|b', 'tv:country0:test0#2'])
+
+    def test_truncated_journal(self):
+        journal = sh.StageJournal('test', folder=self.tempdir.name)
+        journal.record_done('a', [('x',)])
+        journal.close()
+        with open(journal.path, 'a', encoding='utf-8') as f:
+            f.write('{"key": "b", "sta')
+        journal = sh.StageJournal('test', folder=self.tempdir.name)
+        self.assertEqual(list(journal.done), ['a'])
+        self.assertEqual(journal.replay('a'), [('x',)])
+        journal.clear()
+        self.assertFalse(os.path.exists(journal.path))
+
+    def test_namefinder_resume(self):
+        searches = []
+
+        def search(url, tme=True):
+            searches.append(url)
+            if len(searches) > 4 and blocked:
+                raise ConnectionRefusedError('429')
+            return [['url', 'Paper', '', None, '']]
+
+        def run_stage(journal: sh.StageJournal) -> ph.Stage:
+            # The Google names stage of the Pipeline, on its own
+            stage = ph.Stage('ggl_names', lambda site: nf.find_name(site, 'ggl') or [site], nf.limits['ggl'],
+                             bypass='ggl_name', journal=journal, stop_on_refused=True, worker_pool=worker_pool)
+            stage.add_upstream()
+            stage.start()
+            # New NewsSite objects per run, like the ones read from the dumps
+            stage.feed([(NewsSite.from_record(newssite.to_record()),) for newssite in self.newssites])
+            stage.done.wait(10)
+            self.assertTrue(stage.done.is_set())
+            return stage
+
+        # The search engine refuses everything after 4 searches, also after the retries of the pool
+        blocked = True
+        worker_pool = mt.WorkerPool(4, max_retries=1, backoff=0.001)
+        journal = sh.StageJournal('ggl_names', folder=self.tempdir.name)
+        with patch('project.News_weights.namefinders.Na.News_Search', side_effect=search):
+            stage = run_stage(journal)
+            self.assertEqual((stage.stats['processed'], stage.stats['unfinished']), (4, 16))
+            self.assertTrue(all(newssite.ggl_name == 'Paper' for newssite in stage.results))
+            journal.close()
+
+            blocked, searches = False, []
+            journal = sh.StageJournal('ggl_names', folder=self.tempdir.name)
+            stage = run_stage(journal)
+        self.assertEqual(stage.stats['processed'], 16)
+        self.assertEqual(len(searches), 16)
+        self.assertEqual(journal.replayed, 4)
+        self.assertEqual(sorted(newssite.name for newssite in stage.output), sorted(f'test{i}' for i in range(20)))
+        self.assertTrue(all(newssite.ggl_name == 'Paper' for newssite in stage.output))
+        worker_pool.close()
+
+class TestPipelinehandling(unittest.TestCase):
+    def setUp(self) -> None:
+        """
+        Create a temporary journal folder and a list of NewsSites
+        """
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.newssites = []
+        for i in range(20):
+            newssite = NewsSite(f'test{i}', 'pp' if i % 2 else 'tv')
+            newssite.set_country(f'country{i % 3}')
+            newssite.wiki_date = '01 January 2020'
+            self.newssites.append(newssite)
+        self.calls = []
+        self.fail = {'test3'}
+
+    def tearDown(self) -> None:
+        """
+        Remove the temporary journals
+        """
+        self.tempdir.cleanup()
+        del self.tempdir
+        del self.newssites
+        del self.calls
+        del self.fail
+
+    def set_tempreaders(self, newssite: NewsSite) -> list:
+        """
+        A task that sets the tempreaders of a NewsSite, and fails for the NewsSites with a name in self.fail
+        """
+        self.calls.append(newssite.name)
+        if newssite.name in self.fail:
+            raise ConnectionError('failed')
+        newssite.set_tempreaders(1000 * int(newssite.name[4:]) + 1)
+        return [newssite]
+
+    def run_stages(self, *stages: ph.Stage, newssites=None) -> ph.Stage:
+        """
+        Connect the stages, feed them the NewsSites and wait for the last stage to be done
+        """
+        [stage.connect(next_stage) for stage, next_stage in zip(stages, stages[1:])]
+        stages[0].add_upstream()
+        [stage.start() for stage in stages]
+        stages[0].feed([(newssite,) for newssite in (self.newssites if newssites is None else newssites)])
+        stages[-1].done.wait(10)
+        self.assertTrue(stages[-1].done.is_set())
+        return stages[-1]
+
+    def test_stage(self):
+        self.newssites[5].set_tempreaders(42)
+        collect = ph.Stage('collect', lambda newssite: [newssite], 1)
+        stage = ph.Stage('tempreaders', self.set_tempreaders, 8, bypass='tempreaders')
+        collect = self.run_stages(stage, collect)
+
+        self.assertEqual(sorted(self.calls), sorted(f'test{i}' for i in range(20) if i not in (5,)))
+        self.assertEqual(stage.stats['processed'], 18)
+        self.assertEqual(stage.stats['bypassed'], 1)
+        self.assertEqual(stage.stats['failed'], 1)
+        self.assertEqual(len(collect.output), 19)
+        self.assertNotIn(self.newssites[3], collect.output)
+        self.assertEqual(self.newssites[5].tempreaders, 42)
+        self.assertEqual(len(stage.results), 18)
+
+    def test_stop_on_refused(self):
+        def search(newssite: NewsSite) -> list:
+            self.calls.append(newssite.name)
+            if len(self.calls) >= 5:
+                raise ConnectionRefusedError('429')
+            newssite.set_ggl_name(newssite.name)
+            return [newssite]
+
+        worker_pool = mt.WorkerPool(4, max_retries=2, backoff=0.001)
+        stage = ph.Stage('ggl_names', search, 1, bypass='ggl_name', stop_on_refused=True, worker_pool=worker_pool)
+        collect = self.run_stages(stage, ph.Stage('collect', lambda newssite: [newssite], 1, worker_pool=worker_pool))
+        self.assertEqual(stage.stats['processed'], 4)
+        self.assertEqual(stage.stats['unfinished'], 16)
+        self.assertGreaterEqual(stage.jobs.requeued, 2)         # Retried before giving up
+        self.assertEqual(len(collect.output), 20)               # The NewsSites not processed still go on
+        worker_pool.close()
+
+    def test_resume(self):
+        journal = sh.StageJournal('tempreaders', folder=self.tempdir.name)
+        self.run_stages(ph.Stage('tempreaders', self.set_tempreaders, 8, journal=journal))
+        journal.close()
+
+        # A new run only processes the failure, and replays the rest
+        self.calls, self.fail = [], set()
+        journal = sh.StageJournal('tempreaders', folder=self.tempdir.name)
+        self.assertEqual(set(journal.failed), {'pp:country0:test3'})
+        stage = self.run_stages(ph.Stage('tempreaders', self.set_tempreaders, 8, journal=journal))
+        self.assertEqual(self.calls, ['test3'])
+        self.assertEqual(journal.replayed, 19)
+        self.assertEqual(len(stage.output), 20)
+        self.assertEqual(sorted(newssite.tempreaders for newssite in stage.output),
+                         [1000 * i + 1 for i in range(20)])
+
+    def test_deduplicator(self):
+        dedup = ph.Deduplicator()
+        newssite = NewsSite('test0', 'pp')
+        newssite.set_country('country0')
+        newssite.wiki_date = '01 January 2020'
+        self.newssites[0].set_tempreaders(10)
+        self.assertEqual(dedup(self.newssites[0]), [self.newssites[0]])
+        self.assertEqual(dedup(newssite), [])                   # Worse than the first one
+        newssite.set_tempreaders(20)
+        newssite.set_readers(10)
+        # Better than the first one: the first one takes its variables, and no second NewsSite goes on
+        self.assertEqual(dedup(newssite), [])
+        self.assertEqual((self.newssites[0].tpe, self.newssites[0].tempreaders, self.newssites[0].readers), ('pp', 20, 10))
+        self.assertEqual(dedup(self.newssites[1]), [self.newssites[1]])
+
+    def test_duplicate_searched_once(self):
+        searches = []
+
+        def find_name(newssite: NewsSite, engine: str) -> None:
+            searches.append((engine, newssite.name))
+            getattr(newssite, f'set_{engine}_name')(newssite.name)
+
+        # A crawled NewsSite goes on first, the better previous data with the same name comes later
+        crawled = NewsSite('test0', 'pp')
+        crawled.set_country('country0')
+        crawled.wiki_date = '01 January 2020'
+        previous = NewsSite('test0', 'pp')
+        previous.set_country('country0')
+        previous.wiki_date = '01 January 2020'
+        previous.set_tempreaders(5)
+        previous.set_ggl_name('Test 0')
+        previous.set_bng_name('')
+        previous.set_readers(50)
+        released = threading.Event()
+
+        def set_tempreaders(newssite: NewsSite) -> list:
+            released.wait(10)                                   # The previous data comes in during the page fetch
+            self.calls.append(newssite.name)
+            newssite.set_tempreaders(1)
+            return [newssite]
+
+        with patch.object(ph.nf, 'find_name', side_effect=find_name), \
+                patch.object(ph.dh, 'write_dump'):
+            pipeline = ph.Pipeline({}, dump_interval=3600)
+            pipeline.tempreaders.task = set_tempreaders
+            [stage.start() for stage in pipeline.stages]
+            [stage.add_upstream() for stage in (pipeline.newspapers, pipeline.tvchannels, pipeline.dedup)]
+            pipeline.newspapers.feed([])
+            pipeline.tvchannels.feed([])
+            pipeline.dedup.put((crawled,))
+            pipeline.dedup.put((previous,))
+            pipeline.dedup.jobs.join(10)
+            released.set()
+            pipeline.dedup.close_upstream()
+            self.assertTrue(pipeline.names.done.wait(10))
+
+        self.assertEqual(pipeline.names.output, [crawled])
+        self.assertEqual(searches, [])                          # The names of the previous data are kept
+        self.assertEqual((crawled.ggl_name, crawled.bng_name, crawled.readers), ('Test 0', '', 50))
+
+    def test_name_merger(self):
+        merger = ph.NameMerger()
+        replayed = NewsSite('test0', 'tv')                      # Same NewsSite, replayed from the Bing journal
+        replayed.set_country('country0')
+        replayed.set_bng_name('Test Bing')
+        self.newssites[0].set_ggl_name('Test Google')
+
+        self.assertEqual(merger(self.newssites[0]), [])         # Waits for the other branch
+        self.assertEqual(merger(self.newssites[1]), [])
+        self.assertEqual(merger(replayed), [self.newssites[0]])
+        self.assertEqual(self.newssites[0].bng_name, 'Test Bing')
+        self.assertEqual(merger(self.newssites[1]), [self.newssites[1]])
+        self.assertEqual(merger.waiting, {})
+
+    def test_parallel_names(self):
+        google_done = threading.Event()
+
+        def find_name(newssite: NewsSite, engine: str) -> None:
+            if engine == 'ggl':
+                google_done.wait(10)                            # Google is slow for all NewsSites
+                newssite.set_ggl_name(newssite.name)
+            else:
+                newssite.set_bng_name(newssite.name)
+
+        with patch.object(ph.nf, 'find_name', side_effect=find_name), \
+                patch.object(ph.dh, 'write_dump'):
+            pipeline = ph.Pipeline({}, dump_interval=3600)
+            [stage.start() for stage in pipeline.stages[3:]]     # Fed here instead of by the dedup stage
+            [newssite.set_tempreaders(1) for newssite in self.newssites]
+            pipeline.tempreaders.feed([(newssite,) for newssite in self.newssites])
+
+            # All Bing searches are done while Google is still busy with the first ones
+            self.assertTrue(pipeline.bngnames.jobs.join(10))
+            self.assertEqual(pipeline.bngnames.stats['processed'], 20)
+            self.assertLessEqual(pipeline.gglnames.jobs.running, ph.nf.limits['ggl'])
+            self.assertEqual(pipeline.names.output, [])
+            google_done.set()
+            self.assertTrue(pipeline.names.done.wait(10))
+
+        self.assertEqual(len(pipeline.names.output), 20)
+        self.assertTrue(all(newssite.ggl_name == newssite.bng_name == newssite.name
+                            for newssite in pipeline.names.output))
+
+    def test_pipeline(self):
+        previous = NewsSite('test0', 'tv')                      # Previous data, already processed
+        previous.set_country('country0')
+        previous.set_tempreaders(5)
+        previous.set_ggl_name('Test 0')
+        previous.set_bng_name('Test 0')
+        q_previous = queue.Queue()
+        q_previous.put((previous,))
+
+        q_inputs = queue.Queue()
+        [q_inputs.put((f'country{i}', f'url{i}')) for i in range(3)]
+
+        def newspapers_task(country: str, url: str):
+            return [newssite for newssite in self.newssites[1:] if newssite.country == country], False
+
+        def tempreaders_task(newssite: NewsSite, cntry_dict: dict):
+            return self.set_tempreaders(newssite), newssite.country, newssite.tempreaders, False
+
+        def find_name(newssite: NewsSite, engine: str) -> None:
+            (newssite.set_ggl_name if engine == 'ggl' else newssite.set_bng_name)(newssite.name.upper())
+
+        with patch.object(ph.mt, 'newspapers_input', return_value=q_inputs), \
+                patch.object(ph.mt, 'newspapers_task', side_effect=newspapers_task), \
+                patch.object(ph.mt, 'tvchannels_input', return_value=queue.Queue()), \
+                patch.object(ph.mt, 'tempreaders_task', side_effect=tempreaders_task), \
+                patch.object(ph.nf, 'find_name', side_effect=find_name), \
+                patch.object(ph.dh, 'write_dump') as write_dump:
+            pipeline = ph.Pipeline({}, dump_interval=3600)
+            q_result = pipeline.run(q_previous)
+
+        result = {newssite.name: newssite for (newssite,) in list(q_result.queue)}
+        self.assertEqual(set(result), {f'test{i}' for i in range(20) if i != 3})
+        self.assertIs(result['test0'], previous)
+        self.assertEqual(result['test0'].ggl_name, 'Test 0')
+        self.assertEqual(result['test4'].bng_name, 'TEST4')
+        self.assertEqual(sorted(call[0][1] for call in write_dump.call_args_list), [1, 2, 3, 4])
+        self.assertEqual(pipeline.unfinished(), 1)
+
+        readers_dict = pipeline.get_readers_dict(q_result)
+        self.assertEqual(readers_dict['country1'], sum(1000 * i + 1 for i in range(1, 20, 6)))   # Newspapers only
+        self.assertNotIn(5, readers_dict.values())                 # The previous data is not counted again
+
+    def test_failed_name(self):
+        def find_name(newssite: NewsSite, engine: str) -> None:
+            if engine == 'bng' and newssite.name == 'test5':
+                raise ValueError('unexpected page')             # Not refused: the Bing branch drops the NewsSite
+            (newssite.set_ggl_name if engine == 'ggl' else newssite.set_bng_name)(newssite.name.upper())
+
+        [newssite.set_tempreaders(1) for newssite in self.newssites]
+        with patch.object(ph.mt, 'newspapers_input', return_value=queue.Queue()), \
+                patch.object(ph.mt, 'tvchannels_input', return_value=queue.Queue()), \
+                patch.object(ph.nf, 'find_name', side_effect=find_name), \
+                patch.object(ph.dh, 'write_dump'):
+            pipeline = ph.Pipeline({}, dump_interval=3600)
+            q_result = pipeline.run(self.newssites)
+
+        # The NewsSite still comes out of the pipeline, without a Bing name
+        result = {newssite.name: newssite for (newssite,) in list(q_result.queue)}
+        self.assertEqual(set(result), {f'test{i}' for i in range(20)})
+        self.assertEqual((result['test5'].ggl_name, result['test5'].bng_name), ('TEST5', ''))
+        self.assertEqual(pipeline.merger.waiting, {})
+        self.assertEqual(pipeline.unfinished(), 1)
+
+    def test_readers_dict_resume(self):
+        def newspapers_task(country: str, url: str):
+            newssites = []                                      # New objects on every run, like a real crawl
+            for i in range(1, 20, 2):
+                newssite = NewsSite(f'test{i}', 'pp')
+                newssite.set_country(f'country{i % 3}')
+                newssite.wiki_date = '01 January 2020'
+                newssites.append(newssite)
+            return [newssite for newssite in newssites if newssite.country == country], False
+
+        def tempreaders_task(newssite: NewsSite, cntry_dict: dict):
+            return self.set_tempreaders(newssite), newssite.country, newssite.tempreaders, False
+
+        def find_name(newssite: NewsSite, engine: str) -> None:
+            (newssite.set_ggl_name if engine == 'ggl' else newssite.set_bng_name)(newssite.name.upper())
+
+        readers_dicts = []
+        for run in range(2):
+            q_inputs = queue.Queue()
+            [q_inputs.put((f'country{i}', f'url{i}')) for i in range(3)]
+            journals = {stage: sh.StageJournal(stage, folder=self.tempdir.name)
+                        for stage in ('tempreaders', 'ggl_names', 'bng_names')}
+            with patch.object(ph.mt, 'newspapers_input', return_value=q_inputs), \
+                    patch.object(ph.mt, 'newspapers_task', side_effect=newspapers_task), \
+                    patch.object(ph.mt, 'tvchannels_input', return_value=queue.Queue()), \
+                    patch.object(ph.mt, 'tempreaders_task', side_effect=tempreaders_task), \
+                    patch.object(ph.nf, 'find_name', side_effect=find_name), \
+                    patch.object(ph.dh, 'write_dump'):
+                pipeline = ph.Pipeline({}, journals=journals, dump_interval=3600)
+                q_result = pipeline.run(queue.Queue())
+                readers_dicts.append(pipeline.get_readers_dict(q_result))
+            [journal.close() for journal in journals.values()]
+
+        # The second run replays every stage from the journals, with other objects than those of the crawl
+        self.assertEqual(pipeline.tempreaders.stats['replayed'], 9)
+        self.assertEqual(pipeline.gglnames.stats['replayed'], 9)
+        self.assertEqual(readers_dicts[1], readers_dicts[0])
+        self.assertEqual(readers_dicts[1]['country1'], sum(1000 * i + 1 for i in range(1, 20, 6)))
+
+
 if __name__ == '__main__':
     unittest.main()
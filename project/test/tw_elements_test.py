@@ -1,6 +1,17 @@
 from project import tw_elements as TE
+from project import influence_cache as IC
+from project import cache as TC
+from project import cache_backends as CB
 import unittest
+import unittest.mock
 import pytest
+import datetime
+import numpy as np
+import os
+import random
+import tempfile
+import threading
+import time
 
 
 class test_actions(unittest.TestCase):
@@ -40,4 +51,300 @@ class test_actions(unittest.TestCase):
 	def test_index(self):
 		ac = TE.actions("testU", tweets=[0, 1, 5])
 		ac.remove_action(2)
-		self.assertEqual(ac[2], 5)
\ No newline at end of file
+		self.assertEqual(ac[2], 5)
+
+class test_feed(unittest.TestCase):
+	def setUp(self):
+		random.seed(1578400000)
+		self.feed = TE.feed("testU", feed_actions=[], feed_tweets=[])
+		self.dates = []
+		for u in range(10):
+			tweets = []
+			for i in range(random.randint(0, 8)):
+				date = datetime.datetime(2020, 1, random.randint(1, 28), random.randint(0, 23), random.randint(0, 59))
+				self.dates.append(date)
+				tweets.append(TE.tweet(f"{u}-{i}", 0, 0, 0, f"user{u}", date, "", False, False, False, False))
+			self.feed.add(TE.actions(f"user{u}", tweets=tweets))
+
+	def test_construct_feed(self):
+		self.feed.construct_feed()
+		# Latest tweet last
+		self.assertEqual([t.date for t in self.feed], sorted(self.dates))
+		self.assertEqual(self.feed.len_actions(), 0)
+
+	def test_construct_feed_n(self):
+		self.feed.construct_feed(n=5)
+		self.assertEqual([t.date for t in self.feed], sorted(self.dates)[-5:])
+
+	def test_construct_from_tweets(self):
+		self.feed.construct_feed()
+		tweets = list(self.feed.feed_tweets)
+		random.shuffle(tweets)
+		new_feed = TE.feed("testU", feed_tweets=tweets)
+		new_feed.construct_feed(n=7)
+		self.assertEqual([t.date for t in new_feed], sorted(self.dates)[-7:])
+
+class test_tweet(unittest.TestCase):
+	def make_tweet(self, **kwargs):
+		return TE.tweet(1, 100, 10, 5, "user", datetime.datetime(2020, 1, 1), "Big news", False, False, False, False, **kwargs)
+
+	def test_lazy_influence(self):
+		def computer_news_influence(tw, include_google):
+			tw.news_score = 10
+		with unittest.mock.patch.object(TE.tweet, "computer_news_influence", side_effect=computer_news_influence, autospec=True) as news_influence:
+			tw = self.make_tweet(include_news=True)
+			# Nothing is searched before the score is used
+			news_influence.assert_not_called()
+			self.assertEqual(tw.influence_score, round(10 + (584 + 10 + 21.4) / 1000, 3))
+			tw.influence_score
+			news_influence.assert_called_once_with(tw, False)
+		self.assertEqual(self.make_tweet().influence_score, round((584 + 10 + 21.4) / 1000, 3))
+
+	def test_invalidate(self):
+		tw = self.make_tweet()
+		self.assertEqual(tw.tweet_score, (584 + 10 + 21.4) / 1000)
+		tw.like = 0
+		self.assertEqual(tw.tweet_score, (10 + 21.4) / 1000)
+		self.assertEqual(tw.influence_score, round((10 + 21.4) / 1000, 3))
+		tw.rep, tw.rt = 0, 1000
+		self.assertEqual(tw.influence_score, 1)
+
+	def test_given_influence(self):
+		tw = self.make_tweet(influence_score=42)
+		self.assertEqual(tw.influence_score, 42)
+		self.assertEqual(tw.news_score, 0)
+		tw.tweet_score *= 2
+		self.assertEqual(tw.influence_score, round(2 * (584 + 10 + 21.4) / 1000, 3))
+
+class test_sort(unittest.TestCase):
+	def setUp(self):
+		random.seed(1578400000)
+		self.tweets = [TE.tweet(i, random.randint(0, 1000), 0, 0, "user", datetime.datetime(2020, 1, 1 + i), "", False, False, False, True)
+			for i in range(20)]
+		random.shuffle(self.tweets)
+
+	def test_sort_by_influence(self):
+		scores = [t.influence_score for t in self.tweets]
+		TE.sort_tweets(self.tweets)
+		self.assertEqual([t.like for t in self.tweets], sorted([t.like for t in self.tweets], reverse=True))
+		# Sorting does not change the scores
+		self.assertEqual(sorted(scores), sorted(t.influence_score for t in self.tweets))
+		# The order is the one of the influence scores shown on the results page
+		self.assertEqual([t.influence_score for t in self.tweets], sorted(scores, reverse=True))
+
+	def test_sort_by_date(self):
+		TE.sort_tweets(self.tweets, key=TE.date_key)
+		self.assertEqual([t.id for t in self.tweets], list(range(19, -1, -1)))
+		ac = TE.actions("user", tweets=list(self.tweets))
+		ac.sort()
+		self.assertEqual([t.id for t in ac], [t.id for t in sorted(self.tweets, key=TE.influence_key, reverse=True)])
+
+	def test_construct_feed_by_influence(self):
+		fd = TE.feed("testU", feed_actions=[], feed_tweets=[])
+		for i in range(4):
+			fd.add(TE.actions(f"user{i}", tweets=self.tweets[5*i:5*i+5]))
+		fd.construct_feed(n=6)
+		likes = sorted([t.like for t in self.tweets], reverse=True)[:6]
+		# Most influential tweet last
+		self.assertEqual([t.like for t in fd], likes[::-1])
+
+class test_influence_cache(unittest.TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.tempdir.name, "news_influence.json")
+		self.cache = IC.influence_cache(self.path, ttl=3600, max_size=3)
+
+	def tearDown(self):
+		self.tempdir.cleanup()
+
+	def test_normalise_text(self):
+		self.assertEqual(IC.normalise_text("RT @user_1: Big  news\ntoday "), "big news today")
+		self.assertEqual(IC.normalise_text("Big news today"), "big news today")
+		self.assertEqual(IC.normalise_text("RT @a: RT @b: Big news"), IC.normalise_text(IC.normalise_text("RT @a: RT @b: Big news")))
+		self.assertEqual(self.cache.key("Big news", "bing"), self.cache.key("big news", "B"))
+		with self.assertRaises(ValueError):
+			self.cache.key("Big news", "yahoo")
+
+	def test_get_put(self):
+		self.assertIsNone(self.cache.get("Big news", "b"))
+		self.cache.put("Big news", "b", 1.5)
+		self.assertEqual(self.cache.get("RT @user: big news", "b"), 1.5)
+		self.assertIsNone(self.cache.get("Big news", "g"))
+		self.assertEqual(self.cache.stats, {"hit": 1, "miss": 2})
+
+	def test_lru(self):
+		for i in range(3):
+			self.cache.put(f"news {i}", "b", i)
+		# Use the oldest entry, so that the second one is removed first
+		self.cache.get("news 0", "b")
+		self.cache.put("news 3", "b", 3)
+		self.assertIsNone(self.cache.get("news 1", "b"))
+		self.assertEqual([self.cache.get(f"news {i}", "b") for i in (0, 2, 3)], [0, 2, 3])
+
+	def test_ttl(self):
+		with unittest.mock.patch("time.time", return_value=1000.):
+			self.cache.put("Big news", "b", 1.5)
+		with unittest.mock.patch("time.time", return_value=1000. + 3599):
+			self.assertEqual(self.cache.get("Big news", "b"), 1.5)
+		with unittest.mock.patch("time.time", return_value=1000. + 3600):
+			self.assertIsNone(self.cache.get("Big news", "b"))
+
+	def test_save_load(self):
+		self.cache.put("news 0", "b", 0.5)
+		self.cache.put("news 1", "g", 1.5)
+		self.cache.get("news 0", "b")
+		self.cache.save()
+		new_cache = IC.influence_cache(self.path, ttl=3600, max_size=2)
+		self.assertEqual(new_cache.get("news 1", "g"), 1.5)
+		# The least recently used order is kept between runs
+		self.assertEqual(list(new_cache.entries), [("news 0", "b"), ("news 1", "g")])
+		# Entries older than the ttl are not loaded
+		self.assertIsNone(IC.influence_cache(self.path, ttl=0).get("news 1", "g"))
+
+	def test_no_search_when_cached(self):
+		results = [["url", "Site A"], ["url", "Site B"]]
+		with unittest.mock.patch.object(TE, "news_cache", self.cache), \
+				unittest.mock.patch.object(TE.NA, "News_Search", return_value=results) as news_search, \
+				unittest.mock.patch.object(TE.NW, "call_many", return_value=[10, None]):
+			tweets = [TE.tweet(i, 0, 0, 0, "user", datetime.datetime(2020, 1, 1), text, False, False, False, False)
+				for i, text in enumerate(["Big news", "RT @user: Big news", "Other news"])]
+			[tweet.compute_influence(include_news=True) for tweet in tweets]
+			self.assertEqual(news_search.call_count, 2)
+			self.assertEqual([tweet.news_score for tweet in tweets], [10, 10, 10])
+			self.cache.save()
+
+			self.cache = IC.influence_cache(self.path)
+			with unittest.mock.patch.object(TE, "news_cache", self.cache):
+				[tweet.compute_influence(include_news=True) for tweet in tweets]
+			self.assertEqual(news_search.call_count, 2)
+
+class test_score_batch(unittest.TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.TemporaryDirectory()
+		self.cache = IC.influence_cache(os.path.join(self.tempdir.name, "news_influence.json"))
+		self.running, self.max_running = 0, 0
+		self.lock = threading.Lock()
+		texts = [f"News number {i % 20}" for i in range(40)]
+		self.tweets = [TE.tweet(i, i, 2*i, 0, "user", datetime.datetime(2020, 1, 1), text, False, False, False, False)
+			for i, text in enumerate(texts)]
+
+	def tearDown(self):
+		self.tempdir.cleanup()
+
+	def news_search(self, url):
+		with self.lock:
+			self.running += 1
+			self.max_running = max(self.running, self.max_running)
+		time.sleep(0.05)
+		with self.lock:
+			self.running -= 1
+		number = int(url.split("+")[-1].split('"')[0])
+		return [["url", f"Site {number}"], ["url", "Site 0"], ["url", "Unknown"]]
+
+	@staticmethod
+	def call_many(names, engine):
+		return [int(name.split()[1]) * 10 if name != "Unknown" else None for name in names]
+
+	def test_score_batch(self):
+		with unittest.mock.patch.object(TE, "news_cache", self.cache), \
+				unittest.mock.patch.object(TE.NA, "News_Search", side_effect=self.news_search) as news_search, \
+				unittest.mock.patch.object(TE.NW, "call_many", side_effect=self.call_many) as call_many:
+			t0 = time.perf_counter()
+			TE.score_batch(self.tweets, include_news=True, include_google=True, concurrency=8)
+			duration = time.perf_counter() - t0
+			# Each text is searched once per engine, with several searches at the same time
+			self.assertEqual(news_search.call_count, 40)
+			self.assertEqual(call_many.call_count, 2)
+			self.assertGreater(self.max_running, 1)
+			self.assertLess(duration, 40 * 0.05)
+			# Same scores as one by one (which now come from the cache)
+			scores = [(t.tweet_score, t.news_score, t.influence_score) for t in self.tweets]
+			[t.compute_influence(include_news=True, include_google=True) for t in self.tweets]
+			self.assertEqual(news_search.call_count, 40)
+		self.assertEqual(scores, [(t.tweet_score, t.news_score, t.influence_score) for t in self.tweets])
+		self.assertEqual(self.tweets[23].news_score, 3 * 10 + 0)
+		self.assertEqual(self.tweets[23].influence_score, round(23 * 5.84 / 1000 + 46 / 1000 + 30, 3))
+
+	def test_score_batch_no_news(self):
+		with unittest.mock.patch.object(TE.NA, "News_Search") as news_search:
+			TE.score_batch(self.tweets, include_news=False)
+		news_search.assert_not_called()
+		self.assertEqual(self.tweets[10].influence_score, round(10 * 5.84 / 1000 + 20 / 1000, 3))
+
+	def test_score_batch_refused(self):
+		def news_search(url):
+			if "number+3" in url:
+				raise ConnectionRefusedError("429")
+			return self.news_search(url)
+		with unittest.mock.patch.object(TE, "news_cache", self.cache), \
+				unittest.mock.patch.object(TE.NA, "News_Search", side_effect=news_search), \
+				unittest.mock.patch.object(TE.NW, "call_many", side_effect=self.call_many):
+			with self.assertRaises(ConnectionRefusedError):
+				TE.score_batch(self.tweets, concurrency=4)
+		# The other searches are kept for the next time
+		self.assertEqual(len(self.cache.entries), 19)
+
+class test_tweet_batch(unittest.TestCase):
+	def setUp(self):
+		self.tweets = []
+		for i in range(30):
+			date = datetime.datetime(2020, 1, 1 + i % 28, 12, i, tzinfo=datetime.timezone.utc)
+			liked_by = "someone" if i % 3 == 0 else None
+			self.tweets.append(TE.tweet(str(1000 + i), 100 * i, i, i % 5, f"user{i % 4}", date, f"Tweet {i}", i % 2 == 0,
+				i % 3 == 1, i % 4 == 2, False, liked_by))
+		self.batch = TE.TweetBatch.from_tweets(self.tweets)
+
+	def attributes(self, tw):
+		return [tw.id, tw.like, tw.rt, tw.rep, tw.username, tw.date, tw.text, tw.from_verified, tw.is_reply, tw.is_retweet,
+			tw.liked_by, tw.tweet_score, tw.news_score, tw.influence_score, tw.interacted]
+
+	def test_columns(self):
+		self.assertEqual(len(self.batch), 30)
+		self.assertEqual(self.batch.like.dtype, np.int64)
+		self.assertEqual(self.batch.date.dtype, np.int64)
+		self.assertEqual(self.batch.is_reply.dtype, bool)
+		# Usernames are interned
+		self.assertEqual(len(self.batch.users), 5)
+		self.assertEqual(self.batch.liked_by.tolist()[:4], [self.batch.users.index("someone"), -1, -1, self.batch.users.index("someone")])
+
+	def test_views(self):
+		self.assertEqual([self.attributes(tw) for tw in self.batch], [self.attributes(tw) for tw in self.tweets])
+		self.assertEqual(self.attributes(self.batch[7]), self.attributes(self.tweets[7]))
+		small = self.batch[self.batch.like > 2000]
+		self.assertEqual([tw.id for tw in small], [tw.id for tw in self.tweets[21:]])
+		self.assertEqual(small.users, self.batch.users)
+
+	def test_scores(self):
+		rows = [CB.tweet_to_row(tw) for tw in self.tweets]
+		for r in rows:
+			r["influence_score"] = None
+		batch = TE.TweetBatch.from_rows(rows)
+		self.assertEqual(batch.tweet_score.tolist(), [tw.tweet_score for tw in self.tweets])
+		self.assertEqual(batch.influence_score.tolist(), [tw.influence_score for tw in self.tweets])
+
+	def test_normalise_scores(self):
+		self.batch.normalise_scores()
+		TE.normalise_scores(self.tweets)
+		self.assertEqual(self.batch.tweet_score.tolist(), [tw.tweet_score for tw in self.tweets])
+		self.assertEqual(self.batch.news_score.tolist(), [tw.news_score for tw in self.tweets])
+		self.assertEqual(self.batch.influence_score.tolist(), [tw.influence_score for tw in self.tweets])
+		self.assertEqual([tw.influence_score for tw in self.batch.to_tweets()], [tw.influence_score for tw in self.tweets])
+		# The influence scores are those of the normalised scores, not the raw ones
+		self.assertEqual(self.tweets[-1].influence_score, 100.0)
+
+	def test_flag_interact(self):
+		latest = TE.TweetBatch.from_tweets(self.tweets[::3])
+		TE.TweetBatch.flag_interact(self.batch, latest)
+		TE.feed.flag_interact({tw.date: tw for tw in self.tweets}, {tw.date: tw for tw in self.tweets[::3]})
+		self.assertEqual(self.batch.interacted.tolist(), [tw.interacted for tw in self.tweets])
+		self.assertEqual(int(self.batch.interacted.sum()), 10)
+
+	def test_split_latest_feed(self):
+		latest = TE.TweetBatch.from_tweets(self.tweets[0:30:4])
+		feed = TE.TweetBatch.from_tweets([tw for i, tw in enumerate(self.tweets) if i % 4 != 0])
+		latest, feed, windows = TC.cache.split_latest_feed_batch(latest, feed, n=5)
+		expected = TC.cache.split_latest_feed({tw.date: tw for tw in self.tweets[0:30:4]}, \
+			{tw.date: tw for i, tw in enumerate(self.tweets) if i % 4 != 0}, n=5)
+		self.assertEqual([tw.id for tw in latest], [tw.id for tw in expected])
+		for row, before in zip(windows.tolist(), expected.values()):
+			self.assertEqual([feed.ids[i] for i in row if i >= 0], [tw.id for tw in before])
@@ -1,7 +1,11 @@
 from project import twitter_api as TAPI
+from project import tw_elements as TE
+from unittest.mock import patch
 import unittest
 import pytest
 import datetime
+import random
+import time
 
 
 class test_date_from_string(unittest.TestCase):
@@ -17,4 +21,15 @@ class test_date_from_string(unittest.TestCase):
 	def test_3(self):
 		d = datetime.datetime(1020, 1, 1, 16, 15, 10, tzinfo=datetime.timezone.utc)
 		d_f = TAPI.extract_twitter_time("Wed Jan 01 16:15:10 +0000 1020")
-		self.assertEqual(d_f, d)
\ No newline at end of file
+		self.assertEqual(d_f, d)
+
+class test_get_feed(unittest.TestCase):
+	def test_get_feed_order(self):
+		followings = [f"user{i}" for i in range(20)]
+		def get_actions(username, order_by_influence, get_replies=False, cache=None):
+			time.sleep(random.random() / 100)
+			date = datetime.datetime(2020, 1, 1 + int(username[4:]))
+			return TE.actions(username, [TE.tweet(username, 0, 0, 0, username, date, "", False, False, False, False)])
+		with patch.object(TAPI, "get_user_following", return_value=followings), patch.object(TAPI, "get_actions", side_effect=get_actions):
+			feed = TAPI.get_feed("testU", workers=8)
+		self.assertEqual([t.username for t in feed], followings)
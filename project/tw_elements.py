@@ -1,6 +1,19 @@
 from project import results_handler as RH
 from project import News_api as NA
 from project import News_weights as NW
+from project import influence_cache as IC
+from project import cache_backends as CB
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import heapq
+import itertools
+import numpy as np
+
+# Weight of the likes, retweets and replies in the tweet score
+likes_weight, retweets_weight, replies_weight = 5.84 / 1000, 1 / 1000, 4.28 / 1000
+
+# News influence of the tweet texts already searched, per search engine (saved with news_cache.save())
+news_cache = IC.influence_cache()
 
 def normalise_scores(tweets):
 	"""
@@ -18,6 +31,93 @@ def normalise_scores(tweets):
 		tweet.news_score *= 100/max_news_score
 	return tweets
 
+def news_weight(results, news_weights):
+	"""
+	Return the news influence of the results of a news search, from the weights of their news sites (None: no data)
+	"""
+	total_weight = 0
+	for i in range(1, len(results)+1):
+		# Compute a ranking weight based on how far the result was on Google search
+		google_rank_weight = (i+10)/i/11
+		if news_weights[i-1] is not None:
+			total_weight += google_rank_weight * news_weights[i-1]
+	return total_weight
+
+def score_batch(tweets, include_news=True, include_google=False, concurrency=8):
+	"""
+	Compute the tweet, news and influence scores of a list of tweets at once (in place), and return the list
+	The texts that are not in the news cache are searched by concurrency threads at the same time (the searches
+	still go through the rate limiter of http_handler), and the news sites of all results are looked up at once
+	"""
+	engines = ["b", "g"] if include_google else ["b"]
+	for tweet in tweets:
+		tweet.compute_influence(include_news=False)
+	if not include_news:
+		return tweets
+	# Search every (normalised) text only once per engine, and only if it is not cached
+	engine_weights = dict()
+	searches = dict()
+	for tweet in tweets:
+		for engine in engines:
+			key = news_cache.key(tweet.text, engine)
+			if key in engine_weights or key in searches:
+				continue
+			weight = news_cache.get(tweet.text, engine)
+			if weight is None:
+				searches[key] = NA.News_Search_URL_Builder(tweet.text, engine, 20)
+			else:
+				engine_weights[key] = weight
+	errors = []
+	with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+		futures = {key: executor.submit(NA.News_Search, url) for key, url in searches.items()}
+		results = dict()
+		for key, future in futures.items():
+			try:
+				results[key] = future.result()
+			except Exception as e:
+				errors.append(e)
+	# Get the weight of the news sites of all results at once, per engine
+	for engine in engines:
+		keys = [key for key in results if key[1] == engine]
+		news_weights = iter(NW.call_many([r[1] for key in keys for r in results[key]], engine))
+		for key in keys:
+			engine_weights[key] = news_weight(results[key], [next(news_weights) for _ in results[key]])
+			news_cache.put(key[0], engine, engine_weights[key])
+	# Only raise once the searches that worked are cached
+	if errors:
+		raise errors[0]
+	for tweet in tweets:
+		tweet.news_score = sum(engine_weights[news_cache.key(tweet.text, engine)] for engine in engines)/len(engines)
+		tweet.influence_score = round(tweet.tweet_score + tweet.news_score, 3)
+	return tweets
+
+def date_key(tweet):
+	"""
+	Sort key of the tweets by date (sort with reverse=True to get the latest tweet first)
+	"""
+	return tweet.date
+
+def influence_key(tweet):
+	"""
+	Sort key of the tweets by influence: their influence score (reverse=True: most influential first)
+	"""
+	return tweet.influence_score
+
+def order_key(tweets):
+	"""
+	Return the key function to sort a list of tweets with: by influence if its tweets are ordered by influence, else by date
+	"""
+	for tweet in tweets:
+		return influence_key if tweet.order_by_influence else date_key
+	return date_key
+
+def sort_tweets(tweets, key=None):
+	"""
+	Sort a list of tweets in place, latest (or most influential) tweet first. The key of each tweet is computed once
+	"""
+	tweets.sort(key=order_key(tweets) if key is None else key, reverse=True)
+	return tweets
+
 class actions:
 	"""
 	Actions class: store what the last actions (tweets, likes, replies, RTs) of a specified user were
@@ -41,7 +141,7 @@ class actions:
 			self.tweets.remove(action)
 
 	def sort(self):
-		self.tweets.sort()
+		sort_tweets(self.tweets)
 
 	def __iter__(self):
 		return iter(self.tweets)
@@ -84,25 +184,26 @@ class feed:
 		actions.sort()
 		self.feed_actions.append(actions)
 
-	def construct_feed(self):
+	def construct_feed(self, n=None):
+		"""
+		Merge the actions of all followings into the tweet feed (the latest tweet is put last)
+		If n is given, only the n latest tweets are kept
+		"""
 		if len(self.feed_tweets) != 0:
-			self.feed_tweets.sort()
+			sort_tweets(self.feed_tweets)
+			self.feed_tweets = self.feed_tweets[:n]
 			self.feed_tweets.reverse()
 		else:
-			l = self.len_actions()
-			# Remove actions one by one, to put them in the "tweet feed"
-			while self.len_actions() != 0:
-				progress = (l - self.len_actions()+1)/l
-				print(f"Constructing feed... {round(progress*100, 1)}%", end="\r")
-				# Get the latest actions list (contains latest tweet)
-				max_actions = max(self.feed_actions)
-				# Get latest tweet
-				latest = max(max_actions)
-				# Remove latest tweet from latest action
-				max_actions.remove_action(latest)
-				# Add latest tweet to the tweet feed
-				self.feed_tweets.append(latest)
-			print()
+			print("Constructing feed...")
+			# Each actions list is already sorted by add() (latest tweet first), so they only have to be merged
+			key = order_key(itertools.chain.from_iterable(a.tweets for a in self.feed_actions))
+			merged = heapq.merge(*[a.tweets for a in self.feed_actions], key=key, reverse=True)
+			# Stop merging once the n latest tweets have been found
+			self.feed_tweets = list(itertools.islice(merged, n))
+			self.feed_tweets.reverse()
+			# The tweets have all been moved from the actions to the tweet feed
+			for a in self.feed_actions:
+				a.tweets = []
 
 	def __str__(self):
 		return f"{self.username} followings recently made {self.len_actions()} actions."
@@ -123,7 +224,7 @@ class feed:
 		return self.feed_tweets[item]
 
 	def sort(self):
-		self.feed_tweets.sort()
+		sort_tweets(self.feed_tweets)
 
 	@staticmethod
 	def flag_interact(feed_ts, latest_ts):
@@ -142,10 +243,15 @@ class feed:
 class tweet:
 	# Tweet class: stores informations about a tweet
 	def __init__(self, id, like, rt, rep, username, date, text, verif, is_rep, is_rt, order_by_influence, liked_by=None, influence_score=None, include_news=False):
+		# The scores are only computed when they are used (see the properties below), None means not computed yet
+		self._tweet_score = None
+		self._news_score = None
+		self._influence_score = influence_score
+		self.include_news = include_news	# Search the news when the influence score is computed? (boolean)
 		self.id = id				# Tweet ID
-		self.like = like			# Number of likes
-		self.rt = rt				# Number of RTs
-		self.rep = rep				# Number of replies
+		self._like = like			# Number of likes
+		self._rt = rt				# Number of RTs
+		self._rep = rep				# Number of replies
 		self.username = username	# Username that tweeted this
 		self.date = date			# Date of the tweet; datetime format
 		self.text = text			# Text of the tweet (might be truncated)
@@ -153,15 +259,80 @@ class tweet:
 		self.is_reply = is_rep		# Is this tweet a reply to another one? (boolean)
 		self.is_retweet = is_rt		# Is this tweet a RT? (boolean)
 		self.liked_by = liked_by	# Username that liked this tweet (string or None)
-		if influence_score is None:
-			self.influence_score = self.compute_influence(include_news)
-		else:
-			self.influence_score = influence_score
-		self.tweet_score = 0
-		self.news_score = 0
 		self.order_by_influence = order_by_influence
 		self.interacted = False
 
+	def reset_scores(self):
+		"""
+		Forget the scores that depend on the number of likes, RTs and replies, they are computed again when used
+		"""
+		self._tweet_score = None
+		self._influence_score = None
+
+	@property
+	def like(self):
+		return self._like
+
+	@like.setter
+	def like(self, like):
+		self._like = like
+		self.reset_scores()
+
+	@property
+	def rt(self):
+		return self._rt
+
+	@rt.setter
+	def rt(self, rt):
+		self._rt = rt
+		self.reset_scores()
+
+	@property
+	def rep(self):
+		return self._rep
+
+	@rep.setter
+	def rep(self, rep):
+		self._rep = rep
+		self.reset_scores()
+
+	@property
+	def tweet_score(self):
+		# Weighted number of likes, RTs and replies
+		if self._tweet_score is None:
+			self._tweet_score = self.weighted_counts()
+		return self._tweet_score
+
+	@tweet_score.setter
+	def tweet_score(self, tweet_score):
+		self._tweet_score = tweet_score
+		self._influence_score = None
+
+	@property
+	def news_score(self):
+		# Weighted readers of the news sites that wrote about the text of the tweet (0 if the news are not searched)
+		if self._news_score is None:
+			if self.include_news:
+				self.computer_news_influence(False)
+			else:
+				self._news_score = 0
+		return self._news_score
+
+	@news_score.setter
+	def news_score(self, news_score):
+		self._news_score = news_score
+		self._influence_score = None
+
+	@property
+	def influence_score(self):
+		if self._influence_score is None:
+			self._influence_score = round(self.tweet_score + self.news_score, 3)
+		return self._influence_score
+
+	@influence_score.setter
+	def influence_score(self, influence_score):
+		self._influence_score = influence_score
+
 	def __str__(self):
 		v = ""
 		if self.from_verified:
@@ -193,19 +364,18 @@ class tweet:
 
 	def __lt__(self, other):
 		# This allow to get the latest tweet, by comparing the dates or influence scores
+		# To sort lists of tweets, sort_tweets() computes the key of each tweet only once
 		if self.order_by_influence:
-			# Make sure the influence scores are still up-to-date
-			self.influence_score = (self.news_score + self.tweet_score) / 2
-			other.influence_score = (other.news_score + other.tweet_score) / 2
-			return self.influence_score > other.influence_score
+			return influence_key(self) > influence_key(other)
 		return self.date > other.date
 
-	def compute_influence(self, include_news=True, include_google=False):
-		# Weight of each component is specified here
-		likes_weight, retweets_weight, replies_weight = 5.84 / 1000, 1 / 1000, 4.28 / 1000
+	def weighted_counts(self):
 		weighted_likes, weighted_retweets, weighted_replies = \
 			self.like * likes_weight, self.rt * retweets_weight, self.rep * replies_weight
-		self.tweet_score = (weighted_likes + weighted_replies + weighted_retweets)
+		return weighted_likes + weighted_replies + weighted_retweets
+
+	def compute_influence(self, include_news=True, include_google=False):
+		self.tweet_score = self.weighted_counts()
 		self.news_score = 0
 		if include_news:
 			self.computer_news_influence(include_google)
@@ -216,13 +386,166 @@ class tweet:
 		total_weight = 0
 		engines = ["b", "g"] if include_google else ["b"]
 		for engine in engines:
-			search_url = NA.News_Search_URL_Builder(self.text, engine, 20)
-			results = NA.News_Search(search_url)
-			for i in range(1, len(results)+1):
-				# Compute a ranking weight based on how far the result was on Google search
-				google_rank_weight = (i+10)/i/11
-				news_site = results[i-1][1]
-				news_weight = NW.call(news_site, engine)
-				if news_weight is not None:
-					total_weight += google_rank_weight * news_weight
+			# Identical texts (e.g. retweets) are only searched once per engine
+			engine_weight = news_cache.get(self.text, engine)
+			if engine_weight is None:
+				engine_weight = self.search_news_influence(engine)
+				news_cache.put(self.text, engine, engine_weight)
+			total_weight += engine_weight
 		self.news_score = total_weight/len(engines)
+
+	def search_news_influence(self, engine):
+		"""
+		Search the text of the tweet in the news, and return the weighted sum of the weights of the news sites found
+		"""
+		search_url = NA.News_Search_URL_Builder(self.text, engine, 20)
+		results = NA.News_Search(search_url)
+		# Get the weight of every news site of the results page at once
+		return news_weight(results, NW.call_many([r[1] for r in results], engine))
+
+
+class TweetBatch:
+	"""
+	Many tweets stored column by column (struct of arrays), for bulk analytics without a tweet object per tweet:
+	 - like, rt, rep: int64 arrays; date: int64 array of epochs
+	 - tweet_score, news_score, influence_score: float64 arrays (NaN for an influence score that is not computed)
+	 - from_verified, is_reply, is_retweet, interacted: bool arrays
+	 - username, liked_by: int32 indices in the users table (-1 for nobody); ids and texts are lists
+	tweet objects are only built when they are asked for (batch[i], iteration or to_tweets())
+	"""
+	int_columns = ["like", "rt", "rep", "date"]
+	float_columns = ["tweet_score", "news_score", "influence_score"]
+	bool_columns = ["from_verified", "is_reply", "is_retweet", "interacted"]
+	user_columns = ["username", "liked_by"]
+
+	def __init__(self, columns, ids, texts, users, order_by_influence=False):
+		self.columns = columns
+		self.ids = ids
+		self.texts = texts
+		self.users = users
+		self.order_by_influence = order_by_influence
+
+	@staticmethod
+	def from_rows(rows, order_by_influence=False):
+		"""
+		Build a batch from rows (dicts from cache_backends.tweet_to_row() or from the cache backends)
+		"""
+		users = dict()
+		def user_index(username):
+			return -1 if username is None else users.setdefault(username, len(users))
+		columns = {
+			"like": np.array([r["like"] for r in rows], dtype=np.int64),
+			"rt": np.array([r["rt"] for r in rows], dtype=np.int64),
+			"rep": np.array([r["rep"] for r in rows], dtype=np.int64),
+			"date": np.array([CB.to_epoch(r["date"]) for r in rows], dtype=np.int64),
+			"influence_score": np.array([np.nan if r["influence_score"] is None else r["influence_score"] for r in rows], dtype=np.float64),
+			"from_verified": np.array([bool(r["from_verified"]) for r in rows], dtype=bool),
+			"is_reply": np.array([bool(r["is_reply"]) for r in rows], dtype=bool),
+			"is_retweet": np.array([bool(r["is_retweet"]) for r in rows], dtype=bool),
+			"interacted": np.array([bool(r.get("interacted", False)) for r in rows], dtype=bool),
+			"username": np.array([user_index(r["username"]) for r in rows], dtype=np.int32),
+			"liked_by": np.array([user_index(r["liked_by"]) for r in rows], dtype=np.int32)
+		}
+		batch = TweetBatch(columns, [r["id"] for r in rows], [r["text"] for r in rows], list(users), order_by_influence)
+		batch.compute_tweet_scores()
+		return batch
+
+	@staticmethod
+	def from_tweets(tweets):
+		"""
+		Build a batch from a list of tweet objects (their scores are kept)
+		"""
+		tweets = list(tweets)
+		rows = [{"id": tw.id, "like": tw.like, "rt": tw.rt, "rep": tw.rep, "username": tw.username, "date": tw.date,
+			"text": tw.text, "from_verified": tw.from_verified, "is_reply": tw.is_reply, "is_retweet": tw.is_retweet,
+			"liked_by": tw.liked_by, "influence_score": tw.influence_score, "interacted": tw.interacted} for tw in tweets]
+		batch = TweetBatch.from_rows(rows, order_by_influence=bool(tweets) and tweets[0].order_by_influence)
+		batch.columns["tweet_score"] = np.array([tw.tweet_score for tw in tweets], dtype=np.float64)
+		batch.columns["news_score"] = np.array([tw.news_score for tw in tweets], dtype=np.float64)
+		return batch
+
+	def __getattr__(self, name):
+		# Give the columns as attributes: batch.like, batch.date...
+		columns = self.__dict__.get("columns", {})
+		if name in columns:
+			return columns[name]
+		raise AttributeError(f"TweetBatch has no attribute {name}")
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __iter__(self):
+		return (self.tweet(i) for i in range(len(self)))
+
+	def __getitem__(self, item):
+		# An index gives a tweet object, a slice, a list of indices or a boolean mask gives a smaller batch
+		if isinstance(item, (int, np.integer)):
+			return self.tweet(item)
+		return self.take(np.arange(len(self))[item])
+
+	def take(self, indices):
+		"""
+		Return a batch with the tweets at the given indices (in that order), the users table is shared
+		"""
+		indices = np.asarray(indices, dtype=np.int64)
+		columns = {name: col[indices] for name, col in self.columns.items()}
+		return TweetBatch(columns, [self.ids[i] for i in indices.tolist()], [self.texts[i] for i in indices.tolist()], \
+			self.users, self.order_by_influence)
+
+	def tweet(self, i):
+		"""
+		Build the tweet object of one tweet of the batch
+		"""
+		c = self.columns
+		influence = float(c["influence_score"][i])
+		liked_by = int(c["liked_by"][i])
+		tw = tweet(self.ids[i], int(c["like"][i]), int(c["rt"][i]), int(c["rep"][i]), self.users[c["username"][i]], \
+			datetime.fromtimestamp(int(c["date"][i]), timezone.utc), self.texts[i], bool(c["from_verified"][i]), \
+			bool(c["is_reply"][i]), bool(c["is_retweet"][i]), self.order_by_influence, None if liked_by == -1 else self.users[liked_by])
+		tw.tweet_score = float(c["tweet_score"][i])
+		tw.news_score = float(c["news_score"][i])
+		tw.influence_score = None if influence != influence else influence
+		tw.interacted = bool(c["interacted"][i])
+		return tw
+
+	def to_tweets(self):
+		return list(self)
+
+	def compute_tweet_scores(self):
+		"""
+		Compute the tweet scores of all tweets at once (the news scores are set to 0),
+		and the influence scores of the tweets that do not have one yet
+		"""
+		c = self.columns
+		c["tweet_score"] = c["like"] * likes_weight + c["rep"] * replies_weight + c["rt"] * retweets_weight
+		c["news_score"] = np.zeros(len(self), dtype=np.float64)
+		missing = np.isnan(c["influence_score"])
+		c["influence_score"][missing] = np.round(c["tweet_score"][missing], 3)
+
+	def normalise_scores(self):
+		"""
+		Vectorized normalise_scores(): divide the tweet and news scores by the maximum ones (at least 1), as percentages
+		The influence scores are computed again from the normalised scores, like the setters of the tweet class do
+		"""
+		c = self.columns
+		if len(self) != 0:
+			c["tweet_score"] = c["tweet_score"] * (100 / max(c["tweet_score"].max(), 1))
+			c["news_score"] = c["news_score"] * (100 / max(c["news_score"].max(), 1))
+			c["influence_score"] = np.round(c["tweet_score"] + c["news_score"], 3)
+		return self
+
+	def sort_by_date(self):
+		"""
+		Return the batch sorted by date, oldest tweet first
+		"""
+		return self.take(np.argsort(self.columns["date"], kind="stable"))
+
+	@staticmethod
+	def flag_interact(feed_batch, latest_batch):
+		"""
+		Vectorized feed.flag_interact(): set interacted=True for the feed tweets that are also in the latest tweets
+		"""
+		feed_ids = np.array([str(i) for i in feed_batch.ids])
+		latest_ids = np.array([str(i) for i in latest_batch.ids])
+		feed_batch.columns["interacted"] |= np.isin(feed_ids, latest_ids)
+		return feed_batch
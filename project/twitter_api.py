@@ -1,12 +1,12 @@
-import requests
 import json
 from bs4 import BeautifulSoup
 from datetime import datetime
 from requests_oauthlib import OAuth1
-import time
+from concurrent.futures import ThreadPoolExecutor
 from project import tw_elements as TE
 from project import twitter_api_public as TAPIP
 from project import cache as TC
+from project import http_handler as HH
 import sys
 
 
@@ -46,29 +46,17 @@ def dev_api_request(url):
 	"""
 	Call the DEV API at a given URL
 	"""
-	read_ok = False
 	# Create OAuth headers, following OAuth1 protocol
 	oauth = OAuth1(consumer_key, consumer_secret, access_token, access_token_secret, signature_type="query")
-	# Request API url
-	resp = requests.get(url, auth=oauth)
-	# Extract API rate limite remaining from the headers
-	req_limit = int(resp.headers["x-rate-limit-remaining"])
-	# If there is less than 7 requests left in the interval, slow the code down
-	if req_limit < 10:
-		if req_limit < 7:
-			# Get interval reset time
-			req_reset = int(resp.headers["x-rate-limit-reset"])
-			# Compute time the code must sleep by taking a quarter of the time left before interval reset
-			sleep_time = (req_reset - time.time()) / 4
-			print()
-			print(f"Waiting {round(sleep_time, 1)} seconds to stay below the API rate limit. You might want to stop and try again in 5mins.")
-			print()
-			time.sleep(sleep_time)
-		else:
-			# Warn user of the numbers of API calls left in the interval
-			print()
-			print(f"*** WARNING: only {req_limit} API calls left in this interval ***")
-			print()
+	# Request API url through the rate limiter. Twitter counts the calls per endpoint, so each endpoint has its own budget
+	key = HH.get_key(url, path=True)
+	resp = HH.get(url, key=key, auth=oauth)
+	req_limit = HH.limiter.remaining(key)
+	# Warn user of the numbers of API calls left in the interval
+	if req_limit is not None and req_limit < 10:
+		print()
+		print(f"*** WARNING: only {req_limit} API calls left in this interval ***")
+		print()
 	resp_json = resp.json()
 	return resp_json
 
@@ -136,8 +124,9 @@ def get_user_interactions(username, type, order_by_influence, get_replies=False,
 	# Check if number of tweets/RTs returned by the API matches the specified one
 	count = len(resp_json)
 	if count == 1 and type != 2:
-		print(f"\n*** WARNING: only got 1 tweet instead of the {n} requested. Retrying in 15secs...***\n")
-		time.sleep(15)
+		print(f"\n*** WARNING: only got 1 tweet instead of the {n} requested. Retrying...***\n")
+		# Back off on this endpoint before retrying
+		HH.limiter.penalise(HH.get_key(api_url, path=True))
 		return get_user_interactions(username, type, order_by_influence, get_replies, n, n_l, cache)
 	TWs = []
 	ids = []
@@ -147,8 +136,8 @@ def get_user_interactions(username, type, order_by_influence, get_replies=False,
 		try:
 			id, username, like, rt, date, text, verif, is_rep, is_rt = extract_tweet_infos(tweet)
 		except TypeError:
-			print("\n*** WARNING: the API response was not in the correct format... Retrying in 15secs... ***\n")
-			time.sleep(15)
+			print("\n*** WARNING: the API response was not in the correct format... Retrying... ***\n")
+			HH.limiter.penalise(HH.get_key(api_url, path=True))
 			return get_user_interactions(username, type, order_by_influence, get_replies, n, n_l, cache)
 		# Save tweet id in a list to later get replies number
 		ids.append(id)
@@ -184,15 +173,17 @@ def get_actions(username, order_by_influence, get_replies=False, cache=TC.cache(
 	actions.add_actions(get_user_interactions(username, 2, order_by_influence, cache=cache))
 	return actions
 
-def get_feed(username, cache=TC.cache(0), show_name="", get_replies=False, order_by_influence=False):
+def get_feed(username, cache=TC.cache(0), show_name="", get_replies=False, order_by_influence=False, n=None, workers=1):
 	"""
 	Get the Twitter feed that the specified username should see when he opens Twitter
+	If n is given, only the n latest tweets of the feed are kept
+	The actions of the followings are downloaded by the given number of workers (threads) at the same time
 	"""
 	exist = False
 	if cache.read:
 		exist, feed = cache.get_cached("feed", order_by_influence)
 		if exist:
-			feed.construct_feed()
+			feed.construct_feed(n)
 			return feed
 		else:
 			print("User feed couldn't be found in the cache, trying live...")
@@ -200,15 +191,17 @@ def get_feed(username, cache=TC.cache(0), show_name="", get_replies=False, order
 	followings = get_user_following(username)
 	# Create feed object
 	feed = TE.feed(username, show_name=show_name)
-	# For each following...
-	for i, following in enumerate(followings):
-		print(f"Getting latest actions of {len(followings)} twitter accounts... ({i+1}/{len(followings)})", end="\r")
-		# Get latest actions (likes, tweets, replies, RTs)
-		f_actions = get_actions(following, order_by_influence, get_replies=get_replies)
-		feed.add(f_actions)
+	# Get latest actions (likes, tweets, replies, RTs) of each following, with several workers sharing the rate limit budget
+	with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+		all_actions = executor.map(lambda f: get_actions(f, order_by_influence, get_replies=get_replies), followings)
+		# Results come in the same order as the followings, whatever order they are downloaded in
+		for i, f_actions in enumerate(all_actions):
+			print(f"Getting latest actions of {len(followings)} twitter accounts... ({i+1}/{len(followings)})", end="\r")
+			feed.add(f_actions)
 	print()
-	# Construct the feed by picking the latest actions ones by ones
-	feed.construct_feed()
-	if cache.write or (cache.read and not exist):
+	save = cache.write or (cache.read and not exist)
+	# Construct the feed by merging the latest actions (keep them all if the feed is saved in the cache)
+	feed.construct_feed(None if save else n)
+	if save:
 		cache.save_results(feed)
 	return feed
@@ -1,8 +1,7 @@
-import requests
 import json
 from bs4 import BeautifulSoup
 import datetime
-import time
+from project import http_handler as HH
 
 
 def down_json(url):
@@ -10,7 +9,7 @@ def down_json(url):
 	Get json from Twitter api url
 	"""
 	# Download url and extract text
-	req = requests.get(url).text
+	req = HH.get(url).text
 	# JSONP to JSON: extract content in the ()
 	try:
 		content = req.split("(", 1)[1].strip(")")[:-2]
@@ -40,21 +39,25 @@ def n_from_string(s):
 		return int(float(n_text[:-1]) * 1e6)
 	return 0
 
-def tweets_infos(tweet_ids):
+def tweets_infos(tweet_ids, retries=5):
 	"""
 	This function return the number of replies and likes of a list of tweets.
+	An empty list is returned if the public API keeps returning empty results.
 	"""
 	# Join the tweet ids as one parameter
 	ids_param = "-t%2C".join(tweet_ids) + "-t"
 	# Tweets infos API bypass url
 	url = "https://cdn.syndication.twimg.com/tweets.json?callback=__twttr.callbacks.cb0&ids=" \
 		+ ids_param + "&lang=en"
-	# Get JSON from url
-	data = down_json(url)
-	if data == "":
-		print("*** WARNING: public API returned empty result, retrying in 15 secs... ***")
-		time.sleep(15)
-		return tweets_infos(tweet_ids)
+	# Get JSON from url. An empty result means the public API is overloaded: back off on it before retrying
+	for attempt in range(retries + 1):
+		data = down_json(url)
+		if data != "":
+			break
+		print("*** WARNING: public API returned empty result, retrying... ***")
+		HH.limiter.penalise(HH.get_key(url))
+	else:
+		return []
 	infos = []
 	# Go trough the html of each tweet
 	for id, html in data.items():